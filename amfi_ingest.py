@@ -0,0 +1,165 @@
+"""Whole-market NAV ingest from AMFI ``NAVAll.txt``-format files.
+
+AMFI publishes the latest NAV of every scheme (~40k) as one text file:
+
+    Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;Date
+
+    Open Ended Schemes(Debt Scheme - Banking and PSU Fund)
+
+    Aditya Birla Sun Life Mutual Fund
+
+    119551;INF209KA12Z1;INF209KA13Z9;Aditya Birla Sun Life Banking & PSU Debt Fund - DIRECT - IDCW;105.1234;16-Oct-2024
+
+The file is read line by line from a local path or any URL (the real AMFI
+endpoint or the local stand-in's ``/NAVAll.txt``) and every scheme's latest
+NAV is merged into the history store in batched transactions, so the daily
+update of the whole market costs one download. Per-scheme mfapi calls are
+then only needed to backfill histories (see ``NavStore.merge_latest``). The
+same pass refreshes the scheme master behind the local fund search.
+
+Usage: python amfi_ingest.py [path-or-url]
+"""
+import argparse
+import logging
+import time
+from collections import namedtuple
+from datetime import date, datetime
+
+import pytz
+
+from config import get_config
+from nav_store import format_nav_date, get_nav_store
+
+logger = logging.getLogger(__name__)
+
+NavAllRow = namedtuple("NavAllRow", ["code", "name", "category", "fund_house", "day", "nav"])
+
+# Points merged per store transaction
+INGEST_BATCH_SIZE = 5000
+
+# NAV days are Indian market days, whatever the server's timezone
+IST = pytz.timezone('Asia/Kolkata')
+
+_MONTHS = {name: i for i, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+
+
+def parse_amfi_date(date_str):
+    """Convert an AMFI ``dd-Mon-YYYY`` date to a day ordinal (ValueError when malformed)"""
+    day, month, year = date_str.strip().split("-")
+    month = _MONTHS.get(month[:3].lower())
+    if month is None:
+        raise ValueError(f"Unknown month in {date_str!r}")
+    return date(int(year), month, int(day)).toordinal()
+
+
+def parse_navall(lines, stats=None):
+    """Yield a ``NavAllRow`` for every scheme line with a usable NAV and date.
+
+    Section headings (``Open Ended Schemes(...)``) set the category and the
+    other bare lines the fund house of the rows that follow. Rows without a
+    NAV (``N.A.``) or with a malformed date are counted in ``stats["skipped"]``.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("rows", 0)
+    stats.setdefault("skipped", 0)
+    category = fund_house = None
+    # The whole file usually carries one or two dates
+    days = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if ";" not in line:
+            if "Schemes" in line and line.endswith(")"):
+                category = line
+            else:
+                fund_house = line
+            continue
+        fields = line.split(";")
+        if len(fields) < 6 or fields[0].startswith("Scheme Code"):
+            continue
+        stats["rows"] += 1
+        date_str = fields[5].strip()
+        try:
+            day = days.get(date_str)
+            if day is None:
+                day = days[date_str] = parse_amfi_date(date_str)
+            nav = float(fields[4])
+        except ValueError:
+            stats["skipped"] += 1
+            continue
+        if nav <= 0:
+            stats["skipped"] += 1
+            continue
+        yield NavAllRow(fields[0].strip(), fields[3].strip(), category, fund_house, day, nav)
+
+
+def open_navall(source):
+    """Iterate the text lines of a NAVAll file at a local path or http(s) URL"""
+    if source.startswith(("http://", "https://")):
+        import requests
+
+        with requests.get(source, stream=True, timeout=(10, 120)) as response:
+            response.raise_for_status()
+            response.encoding = response.encoding or "utf-8"
+            yield from response.iter_lines(decode_unicode=True)
+    else:
+        with open(source, "r", encoding="utf-8", errors="replace") as f:
+            yield from f
+
+
+def _merge_batch(store, rows):
+    store.save_schemes((row.code, row.name, row.category, row.fund_house) for row in rows)
+    return store.merge_latest((row.code, row.day, row.nav) for row in rows)
+
+
+def ingest_navall(source=None, store=None, batch_size=INGEST_BATCH_SIZE):
+    """Stream a NAVAll file into the NAV store in one pass.
+
+    Returns ``{"rows", "skipped", "schemes", "merged", "latest_day", "seconds"}``;
+    ``merged`` counts points that were new or changed.
+    """
+    source = source or get_config().AMFI_NAVALL_URL
+    store = store or get_nav_store()
+    stats = {"rows": 0, "skipped": 0}
+    schemes = merged = 0
+    latest_day = None
+    started = time.perf_counter()
+    batch = []
+    for row in parse_navall(open_navall(source), stats):
+        batch.append(row)
+        latest_day = row.day if latest_day is None else max(latest_day, row.day)
+        if len(batch) >= batch_size:
+            merged += _merge_batch(store, batch)
+            schemes += len(batch)
+            batch = []
+    merged += _merge_batch(store, batch)
+    schemes += len(batch)
+    if latest_day is not None:
+        # Weekdays the whole market skipped are holidays, not gaps in the histories
+        closed = store.record_closed_days(latest_day, datetime.now(IST).date().toordinal())
+        if closed:
+            logger.info(f"Recorded market holidays: {', '.join(format_nav_date(d) for d in closed)}")
+
+    stats.update(schemes=schemes, merged=merged, latest_day=latest_day,
+                 seconds=time.perf_counter() - started)
+    logger.info(f"NAVAll ingest from {source}: {schemes} schemes, {merged} new points, "
+                f"{stats['skipped']} rows skipped in {stats['seconds']:.2f}s")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest an AMFI NAVAll.txt file into the NAV history store")
+    parser.add_argument("source", nargs="?", default=None, help="path or URL (default: AMFI_NAVALL_URL)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    stats = ingest_navall(args.source)
+    latest = format_nav_date(stats["latest_day"]) if stats["latest_day"] else "NA"
+    print(f"{stats['schemes']} schemes up to {latest}: {stats['merged']} new points, "
+          f"{stats['skipped']} rows skipped, {stats['seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
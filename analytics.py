@@ -0,0 +1,176 @@
+"""Vectorized returns engine.
+
+Computes trailing returns, CAGR, year-on-year breakdowns and the consistency
+score for many funds at once. All NAV series are concatenated into one array
+and every as-of lookup for every fund is answered by a single
+``numpy.searchsorted`` call, replacing the per-period ``bisect`` loop.
+"""
+import numpy as np
+
+from nav_store import format_nav_date
+
+# Trailing periods reported in "returns"/"dates" (calendar days back from the latest NAV)
+PERIOD_DAYS = {
+    "1day": 1,
+    "1week": 7,
+    "1month": 30,
+    "3month": 90,
+    "6month": 180,
+    "1year": 365,
+    "2year": 730,
+    "3year": 1095,
+    "5year": 1825
+}
+
+# Multi-year periods are annualized (CAGR); shorter ones stay absolute
+CAGR_PERIODS = {"2year", "3year", "5year"}
+
+# Year-on-year breakdown windows, in years
+BREAKDOWN_YEARS = (2, 3, 5)
+
+# Consistency Score: (0.2 * 1Y) + (0.3 * 2Y) + (0.5 * 3Y)
+CONSISTENCY_WEIGHTS = {"1year": 0.2, "2year": 0.3, "3year": 0.5}
+
+# Every distinct "days before the latest NAV" anchor the engine needs
+ANCHOR_OFFSETS = tuple(sorted(
+    set(PERIOD_DAYS.values()) | {365 * k for k in range(max(BREAKDOWN_YEARS) + 1)}
+))
+
+
+def asof_lookup(series_list, offsets=ANCHOR_OFFSETS):
+    """Look up the NAV on or before ``latest_day - offset`` for every fund and offset.
+
+    ``series_list`` holds ``(days, navs)`` pairs of ascending day ordinals and
+    NAVs; every series must be non-empty. Returns ``(current_days,
+    current_navs, anchor_days, anchor_navs)`` where the anchor arrays have
+    shape ``(n_funds, len(offsets))`` and missing anchors (before the first
+    stored NAV) are ``-1`` / ``nan``.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.fromiter((len(days) for days, _ in series_list), dtype=np.int64,
+                          count=len(series_list))
+    days_all = np.concatenate([np.asarray(days, dtype=np.int64) for days, _ in series_list])
+    navs_all = np.concatenate([np.asarray(navs, dtype=np.float64) for _, navs in series_list])
+
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    current_days = days_all[ends - 1]
+    current_navs = navs_all[ends - 1]
+
+    # Shift each fund into its own key range so one sorted array serves all
+    # funds. The stride leaves room for targets that fall before a fund's
+    # first NAV without spilling into the previous fund's range.
+    stride = int(days_all.max() - days_all.min() + offsets.max() + 1)
+    base = np.arange(len(series_list), dtype=np.int64) * stride
+    keys = days_all + np.repeat(base, lengths)
+    targets = current_days[:, None] - offsets[None, :] + base[:, None]
+
+    idx = np.searchsorted(keys, targets, side='right') - 1
+    found = idx >= starts[:, None]
+    safe_idx = np.where(found, idx, 0)
+    anchor_days = np.where(found, days_all[safe_idx], -1)
+    anchor_navs = np.where(found, navs_all[safe_idx], np.nan)
+    return current_days, current_navs, anchor_days, anchor_navs
+
+
+def _pct_change(end, start):
+    """Absolute % return, 0 where the start NAV is missing or zero (matches the template contract)"""
+    valid = np.isfinite(start) & np.isfinite(end) & (start != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret = (end - start) / start * 100
+    return np.where(valid, ret, 0.0), valid
+
+
+def compute_returns_batch(funds, series_list):
+    """Compute the per-fund result dicts used by the templates and ``/api/funds``.
+
+    ``funds`` are the fund dicts (``name``/``code``) matching ``series_list``
+    element by element.
+    """
+    if not series_list:
+        return []
+
+    current_days, current_navs, anchor_days, anchor_navs = asof_lookup(series_list)
+    col = {offset: i for i, offset in enumerate(ANCHOR_OFFSETS)}
+    cur = current_navs[:, None]
+
+    # Trailing returns, all periods at once
+    period_cols = [col[d] for d in PERIOD_DAYS.values()]
+    hist = anchor_navs[:, period_cols]
+    period_returns, period_valid = _pct_change(cur, hist)
+    years = np.array([d / 365.0 for d in PERIOD_DAYS.values()])
+    is_cagr = np.array([p in CAGR_PERIODS for p in PERIOD_DAYS])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cagr = ((cur / hist) ** (1 / years) - 1) * 100
+    use_cagr = is_cagr[None, :] & period_valid & np.isfinite(cagr)
+    period_returns = np.where(use_cagr, cagr, period_returns)
+
+    # Year-on-year returns between consecutive 365-day anchors, shared by every window
+    max_years = max(BREAKDOWN_YEARS)
+    year_end = anchor_navs[:, [col[365 * i] for i in range(max_years)]]
+    year_start = anchor_navs[:, [col[365 * (i + 1)] for i in range(max_years)]]
+    year_returns, year_valid = _pct_change(year_end, year_start)
+    total_absolute, _ = _pct_change(cur, anchor_navs[:, [col[365 * y] for y in BREAKDOWN_YEARS]])
+
+    weights = np.array([CONSISTENCY_WEIGHTS.get(p, 0.0) for p in PERIOD_DAYS])
+    scores = period_returns @ weights
+
+    # Only date formatting is left per fund; memoize it across the batch
+    date_strings = {}
+
+    def fmt(day):
+        if day < 0:
+            return "NA"
+        s = date_strings.get(day)
+        if s is None:
+            s = date_strings[day] = format_nav_date(day)
+        return s
+
+    period_names = list(PERIOD_DAYS)
+    period_returns = period_returns.tolist()
+    period_valid = period_valid.tolist()
+    period_days = anchor_days[:, period_cols].tolist()
+    year_returns = year_returns.tolist()
+    year_valid = year_valid.tolist()
+    year_end_days = anchor_days[:, [col[365 * i] for i in range(max_years)]].tolist()
+    year_start_days = anchor_days[:, [col[365 * (i + 1)] for i in range(max_years)]].tolist()
+    total_absolute = total_absolute.tolist()
+    scores = scores.tolist()
+    current_navs = current_navs.tolist()
+    current_days = current_days.tolist()
+
+    results = []
+    for f, fund in enumerate(funds):
+        returns = {}
+        dates = {}
+        for p, period in enumerate(period_names):
+            returns[period] = period_returns[f][p]
+            dates[period] = fmt(period_days[f][p]) if period_valid[f][p] else "NA"
+
+        year_breakdown = {}
+        for w, period_years in enumerate(BREAKDOWN_YEARS):
+            period_data = {"year_dates": {}}
+            for i in range(period_years):
+                year_num = i + 1
+                if year_valid[f][i]:
+                    period_data[f"year{year_num}"] = year_returns[f][i]
+                    period_data["year_dates"][f"year{year_num}_start"] = fmt(year_start_days[f][i])
+                    period_data["year_dates"][f"year{year_num}_end"] = fmt(year_end_days[f][i])
+                else:
+                    period_data[f"year{year_num}"] = 0
+                    period_data["year_dates"][f"year{year_num}_start"] = "NA"
+                    period_data["year_dates"][f"year{year_num}_end"] = "NA"
+            period_data["total_absolute"] = total_absolute[f][w]
+            year_breakdown[f"{period_years}year"] = period_data
+
+        results.append({
+            "name": fund["name"],
+            "code": fund["code"],
+            "current_nav": current_navs[f],
+            "current_date": fmt(current_days[f]),
+            "returns": returns,
+            "consistency_score": scores[f],
+            "dates": dates,
+            "year_breakdown": year_breakdown
+        })
+    return results
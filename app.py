@@ -1,18 +1,39 @@
-from flask import Flask, render_template, send_from_directory, jsonify, request, redirect, url_for, flash, session
+from flask import Flask, Response, render_template, send_from_directory, jsonify, request, redirect, url_for, flash, session, abort, g
 
-from fetch_mf_returns import fetch_funds_data, load_funds, add_fund, remove_fund
+from fetch_mf_returns import (fetch_funds_data, iter_funds_async, refresh_changed_funds, get_all_funds, load_funds,
+                              add_fund, remove_fund, fund_registry)
+from fund_cache import FundCache
+from cache import TwoTierCache, make_key, args_digest
+from singleflight import SingleFlight
+from async_runtime import get_runtime
+from fragments import FragmentCache
+from scoring import FORMULAS, DEFAULT_FORMULA, MetricsMatrix
+from amfi_ingest import ingest_navall
+from scheme_search import fetch_mfapi_schemes, get_scheme_index, invalidate_scheme_index
+from nav_store import expected_nav_day, format_nav_date, get_nav_store, parse_nav_date
+from notes_store import NotesStore
+from job_scheduler import JobScheduler, LeaderLease
+import metrics
+from profiling import list_profiles, profile
+import atexit
 import json
-from datetime import datetime, timedelta
+import gzip
+import hashlib
+import hmac
+from datetime import datetime, timedelta, timezone
+from contextlib import ExitStack
 from functools import wraps
 import logging
 import traceback
 import os
-import asyncio
+import queue
+import tempfile
+import threading
+import time
 from flask_cors import CORS
-from cachetools import TTLCache
+from jinja2 import FileSystemBytecodeCache
 import redis
 from dotenv import load_dotenv
-from apscheduler.schedulers.background import BackgroundScheduler
 import pytz
 from authlib.integrations.flask_client import OAuth
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
@@ -158,6 +179,7 @@ try:
     redis_client.ping()  # Test connection
     logger.info("Redis connection established")
 except Exception as e:
+    redis_client = None
     logger.warning(f"Redis not available: {e}")
 
 # Session configuration
@@ -172,49 +194,49 @@ if redis_client:
 else:
     logger.info("Using default cookie-based sessions (Redis not available)")
 
-# In-memory cache as fallback
-memory_cache = TTLCache(maxsize=app.config.get('MEMORY_CACHE_SIZE', 200), ttl=app.config.get('MEMORY_CACHE_TTL', 600))
+# Two-tier (memory + Redis) cache for decorated helpers
+response_cache = TwoTierCache(
+    redis_client,
+    l1_maxsize=app.config.get('MEMORY_CACHE_SIZE', 200),
+    l1_ttl=app.config.get('MEMORY_CACHE_TTL', 600),
+    l2_ttl=app.config.get('REDIS_TTL', 600)
+)
 
 # Ensure the static directory exists
 static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+# Compiled templates survive restarts in an on-disk bytecode cache (Vercel only allows /tmp)
+jinja_cache_dir = os.path.join(tempfile.gettempdir() if IS_VERCEL else DATA_DIR, 'jinja_cache')
+try:
+    os.makedirs(jinja_cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(jinja_cache_dir)
+except OSError as e:
+    logger.warning(f"Jinja bytecode cache disabled: {e}")
+
+dashboard_fragments = FragmentCache(app.jinja_env)
 if not os.path.exists(static_dir):
     os.makedirs(static_dir)
 
 def cache_response(timeout=600):
-    """Decorator for caching API responses with improved performance"""
+    """Decorator caching JSON-serializable results in the two-tier cache.
+
+    Keys are derived from the function's qualified name and a stable digest of
+    its arguments, so every gunicorn worker shares the same Redis entries.
+    ``timeout`` is the Redis (L2) TTL; L1 uses MEMORY_CACHE_TTL.
+    """
     def decorator(f):
+        namespace = f"{f.__module__}.{f.__qualname__}"
+
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            cache_key = f"{f.__name__}:{hash(str(args) + str(kwargs))}"
-            
-            # Try Redis first
-            if redis_client:
-                try:
-                    cached = redis_client.get(cache_key)
-                    if cached:
-                        logger.info(f"Redis cache hit for {cache_key}")
-                        return json.loads(cached)
-                except Exception as e:
-                    logger.warning(f"Redis cache error: {e}")
-            
-            # Fallback to memory cache
-            if cache_key in memory_cache:
-                logger.info(f"Memory cache hit for {cache_key}")
-                return memory_cache[cache_key]
+            cache_key = make_key(namespace, args_digest(args, kwargs))
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return cached
             
             # Execute function and cache result
             result = f(*args, **kwargs)
-            
-            # Cache in Redis
-            if redis_client:
-                try:
-                    redis_client.setex(cache_key, timeout, json.dumps(result))
-                except Exception as e:
-                    logger.warning(f"Redis cache set error: {e}")
-            
-            # Cache in memory
-            memory_cache[cache_key] = result
-            
+            response_cache.set(cache_key, result, l2_ttl=timeout)
             return result
         return decorated_function
     return decorator
@@ -224,30 +246,233 @@ def favicon():
     return send_from_directory(os.path.join(app.root_path, 'static'),
                              'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
-@cache_response(timeout=600)
-def get_cached_data():
-    """Get cached fund data with improved error handling and performance"""
-    try:
-        logger.info("Starting to fetch fund data")
-        
-        # Use async function for better performance
-        results = asyncio.run(fetch_funds_data())
-        
-        if not results:
-            logger.error("No fund data could be fetched")
-            return {"error": "No data available", "funds": []}
-        
-        logger.info(f"Successfully fetched data for {len(results)} funds")
-        return {
+# One event loop thread with a pooled upstream session, shared by requests and jobs
+async_runtime = get_runtime(
+    max_connections=app.config.get('MAX_CONCURRENT_REQUESTS', 10),
+    connections_per_host=app.config.get('CONNECTION_POOL_SIZE', 5)
+)
+
+# Stale-while-revalidate view of the fund dataset, assembled from the
+# per-fund cache entries listed in the versioned index
+DATA_SOFT_TTL = app.config.get('DATA_SOFT_TTL', 600)
+DATA_HARD_TTL = app.config.get('DATA_HARD_TTL', 86400)
+fund_cache = FundCache(redis_client, ttl=DATA_HARD_TTL)
+_snapshot = None  # {"data": {...}, "fetched_at": epoch seconds, "version": index version}
+
+# Single-flight coordination of dataset refreshes across threads and workers
+REFRESH_JOB = "snapshot-refresh"
+refresh_flight = SingleFlight(
+    redis_client,
+    lease_ttl=app.config.get('REFRESH_LEASE_TTL', 120),
+    wait_timeout=app.config.get('REFRESH_WAIT_TIMEOUT', 120)
+)
+
+def _snapshot_age(snapshot):
+    return time.time() - snapshot["fetched_at"]
+
+def _fetch_stale_funds(funds):
+    """Re-pull only the funds whose cache entry is missing or older than DATA_SOFT_TTL"""
+    entries = fund_cache.get_many(f["code"] for f in funds)
+    now = time.time()
+    stale = [
+        f for f in funds
+        if f["code"] not in entries or now - entries[f["code"]]["fetched_at"] >= DATA_SOFT_TTL
+    ]
+    if not stale:
+        logger.info(f"All {len(funds)} funds are fresh, nothing to fetch")
+        return 0
+    
+    logger.info(f"Fetching {len(stale)} of {len(funds)} funds with stale data")
+    results = async_runtime.call(fetch_funds_data, stale)
+    fund_cache.put_many(results)
+    logger.info(f"Successfully fetched data for {len(results)} funds")
+    return len(results)
+
+def _assemble_snapshot(index):
+    """Build the dataset described by an index from the per-fund entries"""
+    entries = fund_cache.get_many(
+        (f["code"] for f in index["funds"]),
+        stamps={f["code"]: f["fetched_at"] for f in index["funds"] if f.get("fetched_at")}
+    )
+    results = []
+    for f in index["funds"]:
+        entry = entries.get(f["code"])
+        if entry is None:
+            continue
+        result = dict(entry["result"])
+        result["is_portfolio"] = f["is_portfolio"]
+        results.append(result)
+    return {
+        "data": {
             "funds": results,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": datetime.fromtimestamp(index["fetched_at"]).isoformat(),
             "count": len(results)
-        }
-        
+        },
+        "fetched_at": index["fetched_at"],
+        "version": index["version"]
+    }
+
+def _build_snapshot():
+    """Refresh stale funds, publish a new index and return the assembled snapshot (None on failure)"""
+    global _snapshot
+    started = time.perf_counter()
+    try:
+        funds = get_all_funds()
+        _fetch_stale_funds(funds)
+        if not fund_cache.get_many(f["code"] for f in funds):
+            # Keep the previous index rather than publishing an empty dataset
+            logger.error("No fund data could be fetched")
+            metrics.REFRESH.observe(time.perf_counter() - started, kind="snapshot", outcome="empty")
+            return None
+        index = fund_cache.publish_index(funds)
+        snapshot = _assemble_snapshot(index)
     except Exception as e:
-        logger.error(f"Error in get_cached_data: {str(e)}")
+        logger.error(f"Error fetching fund data: {str(e)}")
         logger.error(traceback.format_exc())
-        return {"error": str(e), "funds": []}
+        metrics.REFRESH.observe(time.perf_counter() - started, kind="snapshot", outcome="failed")
+        return None
+    
+    metrics.REFRESH.observe(time.perf_counter() - started, kind="snapshot", outcome="ok")
+    _snapshot = snapshot
+    return snapshot
+
+def _load_snapshot(bypass_l1=False):
+    """Return the snapshot for the current index version, reassembling it when another worker published"""
+    global _snapshot
+    index = fund_cache.get_index(use_l1=not bypass_l1)
+    if index is None:
+        return None
+    if _snapshot is not None and _snapshot["version"] == index["version"]:
+        return _snapshot
+    snapshot = _assemble_snapshot(index)
+    if not snapshot["data"]["funds"]:
+        return None
+    _snapshot = snapshot
+    return snapshot
+
+def invalidate_snapshot():
+    """Drop the index so the next request rebuilds the dataset (per-fund entries are kept)"""
+    global _snapshot
+    _snapshot = None
+    fund_cache.clear_index()
+
+def apply_fund_change(code):
+    """Update the dataset after one fund was added or removed, touching only that fund's entry"""
+    def change():
+        funds = get_all_funds()
+        fund = next((f for f in funds if f["code"] == code), None)
+        if fund is None:
+            fund_cache.delete(code)
+        elif fund_cache.get(code) is None:
+            fund_cache.put_many(async_runtime.call(fetch_funds_data, [fund]))
+        
+        fund_cache.publish_index(funds)
+
+    # Wait for any refresh in flight, then apply the change ourselves
+    refresh_flight.run(REFRESH_JOB, change, coalesce=False)
+
+# Registry version this worker's dataset reflects
+_registry_version = fund_registry.check()
+_registry_lock = threading.Lock()
+
+def apply_registry_changes():
+    """Bring the dataset in line with funds.json, touching only the funds that changed.
+
+    Picks up edits made through this worker's API as well as by other
+    workers or by hand; a change too old to be listed drops the whole index.
+    """
+    global _registry_version
+    if fund_registry.check() == _registry_version:
+        return
+    with _registry_lock:
+        version = fund_registry.version
+        codes = fund_registry.changes_since(_registry_version)
+        if codes is None:
+            logger.info(f"Fund registry moved to version {version}, rebuilding the dataset")
+            invalidate_snapshot()
+        else:
+            for code in codes:
+                try:
+                    apply_fund_change(code)
+                except Exception as e:
+                    # The next request rebuilds the whole dataset instead
+                    logger.error(f"Error applying fund change {code}, rebuilding the dataset: {str(e)}")
+                    invalidate_snapshot()
+                    break
+        # Only now is the dataset in line with this version (or dropped for a rebuild)
+        _registry_version = version
+
+def refresh_snapshot(max_age=None):
+    """Refresh stale funds and publish a new snapshot, blocking the caller.
+
+    Only one refresh runs at a time across all threads and workers. A caller
+    that finds one in flight waits for it and returns the snapshot it
+    published; when ``max_age`` is given, a snapshot that became fresh enough
+    while waiting is reused as well. Returns None when no data is available.
+    """
+    def build():
+        if max_age is not None:
+            snapshot = _load_snapshot(bypass_l1=True)
+            if snapshot is not None and _snapshot_age(snapshot) < max_age:
+                return snapshot
+        return _build_snapshot()
+
+    ran, snapshot = refresh_flight.run(REFRESH_JOB, build)
+    if ran:
+        return snapshot
+    # Another thread or worker ran the refresh; pick up what it published
+    return _load_snapshot(bypass_l1=True)
+
+def _refresh_in_background():
+    """Start one background refresh unless one is already running anywhere"""
+    if refresh_flight.is_running(REFRESH_JOB):
+        return
+
+    def run():
+        ran, snapshot = refresh_flight.run(REFRESH_JOB, _build_snapshot, wait=False)
+        if ran and snapshot is not None:
+            logger.info("Background snapshot refresh completed")
+
+    threading.Thread(target=run, name="snapshot-refresh", daemon=True).start()
+
+def _present_snapshot(snapshot):
+    age = _snapshot_age(snapshot)
+    data = dict(snapshot["data"])
+    data["age_seconds"] = int(age)
+    data["stale"] = age >= DATA_SOFT_TTL
+    data["version"] = snapshot["version"]
+    return data
+
+def get_cached_data():
+    """Get fund data, serving the last good snapshot immediately.
+
+    Snapshots older than DATA_SOFT_TTL are still served but trigger a single
+    background refresh. Only a missing snapshot, or one older than
+    DATA_HARD_TTL, makes the request wait for an upstream fetch.
+    """
+    apply_registry_changes()
+    snapshot = _load_snapshot()
+    if snapshot is None or _snapshot_age(snapshot) >= DATA_HARD_TTL:
+        fresh = refresh_snapshot(max_age=DATA_HARD_TTL)
+        if fresh is None:
+            if snapshot is None:
+                return {"error": "No data available", "funds": []}
+            logger.warning("Refresh failed, serving expired snapshot")
+        else:
+            snapshot = fresh
+    elif _snapshot_age(snapshot) >= DATA_SOFT_TTL:
+        _refresh_in_background()
+    return _present_snapshot(snapshot)
+
+def format_data_age(seconds):
+    """Human readable age for the navbar, e.g. '5 min ago'"""
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{seconds // 60} min ago"
+    if seconds < 86400:
+        return f"{seconds // 3600} h ago"
+    return f"{seconds // 86400} d ago"
 
 def process_fund_data(results):
     """Process and format fund data for templates with improved performance"""
@@ -292,15 +517,29 @@ def process_fund_data(results):
 def index():
     """Main dashboard page"""
     try:
+        if _load_snapshot() is None:
+            # Cold cache: send the page shell now and let app.js stream the rows in
+            return render_template('index.html',
+                                 fragments=dashboard_fragments.get(None, lambda: {"funds": []}),
+                                 streaming=True,
+                                 last_updated="loading…",
+                                 data_age=None,
+                                 data_stale=False,
+                                 fund_count=0,
+                                 deploy_time=APP_START_TIME)
+        
         results = get_cached_data()
-        funds_data = process_fund_data(results)
         
         # Handle empty funds list
-        if not funds_data:
+        if not results.get("funds"):
             return render_template('error.html', 
                                  error_message="No fund data available",
                                  details="Unable to fetch fund data from the API"), 500
         
+        # The data-heavy partials are rendered once per data version
+        fragments = dashboard_fragments.get(results.get("version"),
+                                            lambda: {"funds": process_fund_data(results)})
+        
         # Format timestamp for display
         timestamp = results.get("timestamp", datetime.now().isoformat())
         try:
@@ -310,9 +549,11 @@ def index():
             last_updated = timestamp
         
         return render_template('index.html', 
-                             funds=funds_data,
+                             fragments=fragments,
                              last_updated=last_updated,
-                             fund_count=len(funds_data),
+                             data_age=format_data_age(results.get("age_seconds", 0)),
+                             data_stale=results.get("stale", False),
+                             fund_count=results.get("count", len(results["funds"])),
                              deploy_time=APP_START_TIME)
     except Exception as e:
         logger.error(f"Error rendering index: {str(e)}")
@@ -321,75 +562,310 @@ def index():
                              error_message="Error loading fund data",
                              details=str(e)), 500
 
+def build_funds_payload(results):
+    """Build the /api/funds JSON document for a dataset"""
+    funds_data = [
+        fund_payload(idx, result) for idx, result in enumerate(results["funds"], 1) if result
+    ]
+    
+    return {
+        "funds": funds_data,
+        "timestamp": results.get("timestamp"),
+        "count": len(funds_data)
+    }
+
+def fund_payload(idx, result):
+    """One fund as it appears in /api/funds and the streaming endpoint"""
+    return {
+        "id": str(idx),
+        "name": result["name"],
+        "code": result.get("code", ""),
+        "nav": float(result["current_nav"]),
+        "returns1d": result["returns"].get("1day", 0) or 0,
+        "returns1w": result["returns"].get("1week", 0) or 0,
+        "returns1m": result["returns"].get("1month", 0) or 0,
+        "returns3m": result["returns"].get("3month", 0) or 0,
+        "returns6m": result["returns"].get("6month", 0) or 0,
+        "returns1y": result["returns"].get("1year", 0) or 0,
+        "returns2y": result["returns"].get("2year", 0) or 0,
+        "returns3y": result["returns"].get("3year", 0) or 0,
+        "returns5y": result["returns"].get("5year", 0) or 0,
+        "dates": result["dates"],
+        "current_date": result.get("current_date"),
+        "year_breakdown": result.get("year_breakdown", {}),
+        "consistency_score": result.get("consistency_score", 0),  # New Field
+        "risk_metrics": result.get("risk_metrics", {}),
+        "is_portfolio": result.get("is_portfolio", False),
+        "category": "Other",
+        "risk": "Medium"
+    }
+
+# Serialized /api/funds bodies, rebuilt only when the dataset version changes
+_funds_payload = None
+_funds_payload_lock = threading.Lock()
+
+def get_funds_payload(results):
+    """Return the plain and gzip-compressed /api/funds bodies for the current data version"""
+    global _funds_payload
+    payload = _funds_payload
+    if payload is not None and payload["version"] == results.get("version"):
+        return payload
+    with _funds_payload_lock:
+        payload = _funds_payload
+        if payload is not None and payload["version"] == results.get("version"):
+            return payload
+        body = json.dumps(build_funds_payload(results), separators=(",", ":")).encode('utf-8')
+        digest = hashlib.sha1(body).hexdigest()
+        payload = {
+            "version": results.get("version"),
+            "body": body,
+            "gzip": gzip.compress(body, compresslevel=6),
+            "etag": digest,
+            # The timestamp is naive local time; Werkzeug would read a naive datetime as UTC
+            "last_modified": (datetime.fromisoformat(results["timestamp"]).astimezone(timezone.utc)
+                              if results.get("timestamp") else None)
+        }
+        _funds_payload = payload
+        logger.info(f"Serialized /api/funds payload v{payload['version']}: "
+                    f"{len(body)} bytes, {len(payload['gzip'])} gzipped")
+        return payload
+
 @app.route('/api/funds')
 @login_required
 def api_funds():
-    """API endpoint for fund data with improved formatting and performance"""
+    """API endpoint for fund data, served from a pre-serialized body with ETag/304 support"""
     try:
         results = get_cached_data()
         
         if "error" in results:
             return jsonify({"error": results["error"], "funds": []}), 500
         
-        funds_data = []
-        for idx, result in enumerate(results["funds"], 1):
-            if not result:
-                continue
-                
-            fund = {
-                "id": str(idx),
-                "name": result["name"],
-                "code": result.get("code", ""),
-                "nav": float(result["current_nav"]),
-                "returns1d": result["returns"].get("1day", 0) or 0,
-                "returns1w": result["returns"].get("1week", 0) or 0,
-                "returns1m": result["returns"].get("1month", 0) or 0,
-                "returns3m": result["returns"].get("3month", 0) or 0,
-                "returns6m": result["returns"].get("6month", 0) or 0,
-                "returns1y": result["returns"].get("1year", 0) or 0,
-                "returns2y": result["returns"].get("2year", 0) or 0,
-                "returns3y": result["returns"].get("3year", 0) or 0,
-                "returns5y": result["returns"].get("5year", 0) or 0,
-                "dates": result["dates"],
-                "current_date": result.get("current_date"),
-                "year_breakdown": result.get("year_breakdown", {}),
-                "consistency_score": result.get("consistency_score", 0),  # New Field
-                "is_portfolio": result.get("is_portfolio", False),
-                "category": "Other",
-                "risk": "Medium"
-            }
-            funds_data.append(fund)
+        payload = get_funds_payload(results)
+        use_gzip = 'gzip' in request.accept_encodings
+        etag = payload["etag"] + ("-gzip" if use_gzip else "")
         
-        return jsonify({
-            "funds": funds_data,
-            "timestamp": datetime.now().isoformat(),
-            "count": len(funds_data)
-        })
+        if request.if_none_match.contains(payload["etag"]) or request.if_none_match.contains(payload["etag"] + "-gzip"):
+            response = Response(status=304)
+        else:
+            body = payload["gzip"] if use_gzip else payload["body"]
+            response = Response(body, mimetype='application/json')
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+            metrics.PAYLOAD_BYTES.observe(len(body), endpoint="/api/funds", encoding="gzip" if use_gzip else "identity")
+        
+        response.set_etag(etag)
+        if payload["last_modified"]:
+            response.last_modified = payload["last_modified"]
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['X-Data-Age'] = str(results.get("age_seconds", 0))
+        response.headers['X-Data-Stale'] = 'true' if results.get("stale") else 'false'
+        return response
         
     except Exception as e:
         logger.error(f"Error in API endpoint: {str(e)}")
         return jsonify({"error": str(e), "funds": []}), 500
 
+# Scoring metrics of the current data version, shared by every /api/rank formula
+_rank_metrics = None  # (version, MetricsMatrix)
+_rank_metrics_lock = threading.Lock()
+
+def get_rank_metrics(results):
+    """Return the MetricsMatrix for a dataset, building it once per data version"""
+    global _rank_metrics
+    cached = _rank_metrics
+    if cached is not None and cached[0] == results.get("version"):
+        return cached[1]
+    with _rank_metrics_lock:
+        cached = _rank_metrics
+        if cached is None or cached[0] != results.get("version"):
+            cached = _rank_metrics = (results.get("version"), MetricsMatrix(results["funds"]))
+        return cached[1]
+
+@app.route('/api/rank')
+@login_required
+def api_rank():
+    """Rank the cached funds with a registered scoring formula (?formula=, ?limit=, ?portfolio=1)"""
+    formula = request.args.get('formula', DEFAULT_FORMULA)
+    if formula not in FORMULAS:
+        return jsonify({
+            "error": f"Unknown formula: {formula}",
+            "formulas": {name: f.description for name, f in FORMULAS.items()}
+        }), 400
+    try:
+        limit = request.args.get('limit', type=int)
+        results = get_cached_data()
+        if "error" in results:
+            return jsonify({"error": results["error"], "funds": []}), 500
+        
+        started = time.perf_counter()
+        ranking = get_rank_metrics(results).rank(
+            formula,
+            limit=limit,
+            portfolio_only=request.args.get('portfolio', '').lower() in ('1', 'true')
+        )
+        return jsonify({
+            "formula": formula,
+            "description": FORMULAS[formula].description,
+            "funds": ranking,
+            "count": len(ranking),
+            "timestamp": results.get("timestamp"),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        })
+    except Exception as e:
+        logger.error(f"Error in rank endpoint: {str(e)}")
+        return jsonify({"error": str(e), "funds": []}), 500
+
+_STREAM_END = object()
+
+def stream_fund_results():
+    """Yield ``(event, data)`` pairs for the dashboard as soon as each fund is available.
+
+    Funds with a cached entry younger than DATA_HARD_TTL are emitted at once
+    (stale ones are refreshed in the background as usual). The rest are
+    fetched under the refresh lease, on the async runtime, and emitted in
+    completion order, stored in the fund cache and published in a new index.
+    A caller that finds a refresh in flight waits for it and emits what it
+    published instead of fetching again. Ends with a ``done`` event.
+    """
+    funds = get_all_funds()
+    positions = {f["code"]: i for i, f in enumerate(funds, 1)}
+    entries = fund_cache.get_many(positions)
+    now = time.time()
+    emitted, missing, stale = 0, [], False
+    for fund in funds:
+        entry = entries.get(fund["code"])
+        if entry is None or now - entry["fetched_at"] >= DATA_HARD_TTL:
+            missing.append(fund)
+            continue
+        stale = stale or now - entry["fetched_at"] >= DATA_SOFT_TTL
+        result = dict(entry["result"], is_portfolio=fund.get("is_portfolio", False))
+        emitted += 1
+        yield "fund", fund_payload(positions[fund["code"]], result)
+    if stale:
+        _refresh_in_background()
+    
+    fetched = delivered = 0
+    if missing:
+        # (result, fetched) pairs handed from the worker thread, ended by _STREAM_END
+        results = queue.Queue()
+        
+        def emit_cached(funds_wanted):
+            """Queue the wanted funds that have a fresh entry; return the ones that do not"""
+            cached = fund_cache.get_many(f["code"] for f in funds_wanted)
+            now = time.time()
+            remaining = []
+            for fund in funds_wanted:
+                entry = cached.get(fund["code"])
+                if entry is None or now - entry["fetched_at"] >= DATA_HARD_TTL:
+                    remaining.append(fund)
+                else:
+                    results.put((dict(entry["result"], is_portfolio=fund.get("is_portfolio", False)), False))
+            return remaining
+        
+        def fetch_missing():
+            # A refresh that finished just before we took the lease may have filled some in
+            to_fetch = emit_cached(missing)
+            if not to_fetch:
+                return
+            logger.info(f"Streaming {len(to_fetch)} funds from upstream")
+            incoming = queue.Queue()
+            
+            async def pump():
+                try:
+                    async for result in iter_funds_async(to_fetch, session=await async_runtime.get_session()):
+                        incoming.put(result)
+                finally:
+                    incoming.put(_STREAM_END)
+            
+            future = async_runtime.submit(pump())
+            stored = 0
+            while True:
+                try:
+                    result = incoming.get(timeout=app.config.get('REFRESH_WAIT_TIMEOUT', 120))
+                except queue.Empty:
+                    logger.warning("Timed out waiting for streamed fund results")
+                    future.cancel()
+                    break
+                if result is _STREAM_END:
+                    break
+                fund_cache.put_many([result])
+                stored += 1
+                results.put((result, True))
+            if future.done() and not future.cancelled() and future.exception():
+                logger.error(f"Error streaming fund data: {future.exception()}")
+            if stored:
+                fund_cache.publish_index(funds)
+        
+        def worker():
+            try:
+                ran, _ = refresh_flight.run(REFRESH_JOB, fetch_missing)
+                if not ran:
+                    # Another request or worker was refreshing; stream what it published
+                    emit_cached(missing)
+            except Exception as e:
+                logger.error(f"Error streaming fund data: {str(e)}")
+            finally:
+                results.put(_STREAM_END)
+        
+        threading.Thread(target=worker, name="fund-stream", daemon=True).start()
+        while True:
+            item = results.get()
+            if item is _STREAM_END:
+                break
+            result, from_upstream = item
+            fetched += from_upstream
+            delivered += 1
+            emitted += 1
+            yield "fund", fund_payload(positions[result["code"]], result)
+    
+    if emitted and fund_cache.get_index(use_l1=False) is None:
+        # Every fund may have come from cache (e.g. after invalidate_snapshot); publish so the reload renders
+        fund_cache.publish_index(funds)
+    
+    yield "done", {"count": emitted, "fetched": fetched, "failed": len(missing) - delivered}
+
+@app.route('/api/funds/stream')
+@login_required
+def api_funds_stream():
+    """Stream fund results as they become available: NDJSON by default, SSE with ?format=sse"""
+    use_sse = (request.args.get('format') == 'sse'
+               or request.accept_mimetypes.best == 'text/event-stream')
+    
+    def generate():
+        try:
+            for event, data in stream_fund_results():
+                if use_sse:
+                    yield f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+                else:
+                    yield json.dumps({"type": event, "data": data}, separators=(",", ":")) + "\n"
+        except Exception as e:
+            logger.error(f"Error in streaming endpoint: {str(e)}")
+            if use_sse:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            else:
+                yield json.dumps({"type": "error", "data": {"error": str(e)}}) + "\n"
+    
+    response = Response(generate(), mimetype='text/event-stream' if use_sse else 'application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass events through unbuffered
+    return response
+
 @app.route('/api/refresh')
 @login_required
 def refresh_data():
     """Force refresh of cached data with improved performance"""
     try:
-        # Clear caches
-        memory_cache.clear()
-        if redis_client:
-            redis_client.flushdb()
+        # Re-pull only the funds whose data is stale
+        snapshot = refresh_snapshot()
         
-        # Fetch fresh data
-        results = get_cached_data()
-        
-        if "error" in results:
-            return jsonify({"error": results["error"]}), 500
+        if snapshot is None:
+            return jsonify({"error": "No data available"}), 500
         
         return jsonify({
             "message": "Data refreshed successfully",
-            "timestamp": datetime.now().isoformat(),
-            "count": len(results.get("funds", []))
+            "timestamp": snapshot["data"]["timestamp"],
+            "count": snapshot["data"]["count"]
         })
         
     except Exception as e:
@@ -405,15 +881,28 @@ def search_funds():
     query = request.args.get('q', '')
     if not query or len(query) < 3:
         return jsonify([])
+    limit = min(request.args.get('limit', type=int) or app.config['SCHEME_SEARCH_LIMIT'],
+                app.config['SCHEME_SEARCH_MAX_LIMIT'])
     try:
-        response = requests.get(f"https://api.mfapi.in/mf/search?q={query}", timeout=5)
-        if response.status_code == 200:
-            return jsonify(response.json())
-        return jsonify([])
+        index = get_scheme_index()
+        if len(index):
+            return jsonify(index.search(query, limit))
+        # Scheme master not loaded yet (first run before the daily refresh)
+        return jsonify(search_upstream(query)[:limit])
     except Exception as e:
         logger.error(f"Error searching funds: {e}")
         return jsonify([]), 500
 
+MF_API_BASE_URL = app.config.get('MF_API_BASE_URL', 'https://api.mfapi.in/mf').rstrip('/')
+
+@cache_response(timeout=3600)
+def search_upstream(query):
+    """Scheme search against mfapi, cached for an hour per query (used until the scheme master is loaded)"""
+    response = requests.get(f"{MF_API_BASE_URL}/search", params={"q": query}, timeout=5)
+    if response.status_code == 200:
+        return response.json()
+    return []
+
 @app.route('/api/funds', methods=['POST'])
 @login_required
 def api_add_fund():
@@ -424,10 +913,8 @@ def api_add_fund():
         return jsonify({"error": "Name and code required"}), 400
         
     if add_fund(name, str(code)):
-        # Clear cache so next fetch gets new fund
-        memory_cache.clear()
-        if redis_client:
-            redis_client.flushdb()
+        # Fetch only the new fund and republish the index
+        apply_registry_changes()
         return jsonify({"success": True, "message": "Fund added successfully"})
     return jsonify({"error": "Fund already exists or error adding"}), 400
 
@@ -435,10 +922,8 @@ def api_add_fund():
 @login_required
 def api_remove_fund(code):
     if remove_fund(str(code)):
-        # Clear cache so next fetch reflects removal
-        memory_cache.clear()
-        if redis_client:
-            redis_client.flushdb()
+        # Drop only this fund and republish the index
+        apply_registry_changes()
         return jsonify({"success": True, "message": "Fund removed successfully"})
     return jsonify({"error": "Fund not found or error removing"}), 400
 
@@ -446,80 +931,224 @@ def api_remove_fund(code):
 NOTES_FILE = os.path.join(DATA_DIR, 'notes.json')
 CSV_FILE = os.path.join(DATA_DIR, 'mutual_fund_returns.csv')
 
-# In-memory storage for Vercel
-memory_notes = []
+# SQLite notes shared by all workers; Vercel only has a writable /tmp (notes do not survive redeploys there)
+notes_store = NotesStore(os.path.join(tempfile.gettempdir() if IS_VERCEL else DATA_DIR, 'notes.db'),
+                         legacy_json=NOTES_FILE)
 
-def load_notes():
-    """Load notes from JSON file or memory"""
-    if IS_VERCEL:
-        return memory_notes
-        
-    if not os.path.exists(NOTES_FILE):
-        return []
-    try:
-        with open(NOTES_FILE, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading notes: {e}")
-        return []
+# Opt-in profiling; without PROFILING_ENABLED no hook is installed at all
+PROFILING_ENABLED = app.config.get('PROFILING_ENABLED', False)
+PROFILER = app.config.get('PROFILER', 'cprofile')
+PROFILE_DIR = app.config.get('PROFILE_DIR') or os.path.join(tempfile.gettempdir() if IS_VERCEL else DATA_DIR, 'profiles')
+PROFILE_KEEP = app.config.get('PROFILE_KEEP', 50)
 
-def save_notes(notes):
-    """Save notes to JSON file or memory"""
-    if IS_VERCEL:
-        global memory_notes
-        memory_notes = notes
+def _profiling_authorized():
+    """The profiling token in X-Profile / ?profile=, or any logged-in user"""
+    credential = request.headers.get('X-Profile') or request.args.get('profile')
+    if not credential:
+        return False
+    token = app.config.get('PROFILING_TOKEN')
+    if token and hmac.compare_digest(credential.encode(), token.encode()):
         return True
+    return current_user.is_authenticated
 
-    try:
-        with open(NOTES_FILE, 'w') as f:
-            json.dump(notes, f, indent=2)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving notes: {e}")
-        return False
+def profiled_job(name, fn):
+    """``fn`` wrapped to be profiled on every run when ``name`` is in PROFILE_JOBS, else ``fn`` itself"""
+    if not PROFILING_ENABLED or name not in app.config.get('PROFILE_JOBS', []):
+        return fn
+
+    def run():
+        with profile(f"job {name}", PROFILE_DIR, PROFILER, PROFILE_KEEP):
+            return fn()
+    return run
+
+def install_request_profiling(flask_app):
+    """Profile authorized requests to ``flask_app``; the profile file name is returned in X-Profile"""
+    @flask_app.before_request
+    def start_request_profile():
+        if request.path.startswith('/api/admin/profiles') or not _profiling_authorized():
+            return
+        stack = ExitStack()
+        g.profile_run = stack.enter_context(profile(f"{request.method} {request.path}", PROFILE_DIR, PROFILER, PROFILE_KEEP))
+        g.profile_stack = stack
+
+    @flask_app.after_request
+    def finish_request_profile(response):
+        # Streamed bodies are produced after this point and are not part of the profile
+        stack = g.pop('profile_stack', None)
+        if stack is not None:
+            stack.close()
+            if g.profile_run.path:
+                response.headers['X-Profile'] = os.path.basename(g.profile_run.path)
+        return response
+
+    @flask_app.teardown_request
+    def abort_request_profile(error=None):
+        stack = g.pop('profile_stack', None)
+        if stack is not None:
+            stack.close()
+
+if PROFILING_ENABLED:
+    install_request_profiling(app)
+    logger.info(f"Profiling enabled ({PROFILER}), profiles in {PROFILE_DIR}")
+
+@app.route('/api/admin/profiles')
+def admin_profiles():
+    """Recent profiles, newest first"""
+    if not PROFILING_ENABLED:
+        abort(404)
+    if not _profiling_authorized():
+        abort(403)
+    return jsonify({"profiler": PROFILER, "profiles": list_profiles(PROFILE_DIR, limit=PROFILE_KEEP)})
+
+@app.route('/api/admin/profiles/<name>')
+def admin_profile_download(name):
+    """Download one profile file"""
+    if not PROFILING_ENABLED:
+        abort(404)
+    if not _profiling_authorized():
+        abort(403)
+    return send_from_directory(PROFILE_DIR, name, as_attachment=True)
+
+IST = pytz.timezone('Asia/Kolkata')
+
+def refresh_market_data():
+    """Whole-market NAVAll ingest plus scheme master refresh; the per-fund sync covers failures.
+
+    Returns the latest NAV day in the NAVAll file, or None when it could not be ingested.
+    """
+    navall_url = app.config.get('AMFI_NAVALL_URL')
+    latest_day = None
+    ingested = False
+    if navall_url:
+        # One whole-market download updates every stored scheme's latest NAV and the scheme master
+        try:
+            latest_day = ingest_navall(navall_url)["latest_day"]
+            ingested = True
+        except Exception as e:
+            logger.warning(f"NAVAll ingest failed, falling back to per-fund sync: {e}")
+    if not ingested:
+        try:
+            changed = get_nav_store().save_schemes(fetch_mfapi_schemes(MF_API_BASE_URL))
+            logger.info(f"Scheme master refreshed from mfapi: {changed} schemes changed")
+        except Exception as e:
+            logger.warning(f"Scheme master refresh failed: {e}")
+    invalidate_scheme_index()
+    return latest_day
+
+def refresh_laggards(expected_day):
+    """Refetch only the funds whose cached NAV is older than ``expected_day`` and republish.
+
+    Funds that gained NAV points are recomputed; the ones with nothing new
+    are re-stamped as checked. Returns the run summary: counts of funds
+    ``fetched`` (new upstream points), ``recomputed`` (stored history moved
+    without a fetch), ``unchanged``, ``failed`` and ``skipped`` (already
+    current), plus ``behind``, the codes still short of ``expected_day``.
+    """
+    def refresh():
+        global _snapshot
+        started = time.perf_counter()
+        funds = get_all_funds()
+        entries = fund_cache.get_many(f["code"] for f in funds)
+        known_days = {code: parse_nav_date(entry["result"]["current_date"]) for code, entry in entries.items()}
+        laggards = [f for f in funds if known_days.get(f["code"], -1) < expected_day]
+        outcome = {"fetched": [], "recomputed": [], "unchanged": [], "failed": []}
+        if laggards:
+            logger.info(f"Refreshing {len(laggards)} of {len(funds)} funds behind {format_nav_date(expected_day)}")
+            results, outcome = async_runtime.call(refresh_changed_funds, laggards, known_days, expected_day)
+            fund_cache.put_many(results + [entries[code]["result"] for code in outcome["unchanged"]])
+        if laggards or fund_cache.get_index() is None:
+            if fund_cache.get_many(f["code"] for f in funds):
+                _snapshot = _assemble_snapshot(fund_cache.publish_index(funds))
+        summary = {key: len(codes) for key, codes in outcome.items()}
+        summary["skipped"] = len(funds) - len(laggards)
+        for result, count in summary.items():
+            metrics.REFRESH_FUNDS.inc(count, result=result)
+        summary["behind"] = outcome["unchanged"] + outcome["failed"]
+        metrics.REFRESH.observe(time.perf_counter() - started, kind="laggards", outcome="ok")
+        return summary
+
+    # Serialized with the other refreshes and fund changes
+    return refresh_flight.run(REFRESH_JOB, refresh, coalesce=False)[1]
 
 # Scheduled Task for Data Refresh
-def scheduled_refresh():
-    """Function to be called by APScheduler"""
+def scheduled_refresh(retry=0):
+    """Daily and post-market refresh job: only funds behind the expected NAV day are refetched.
+
+    Funds still behind afterwards (late AMCs, upstream errors) are retried
+    later in the day. Raises when no fund data is available at all, so the
+    scheduler records the run as failed.
+    """
     logger.info("Starting scheduled data refresh...")
     with app.app_context():
-        try:
-            # 1. Refresh Cache (Side effect of calling the logic, ignoring return)
-            # We call get_cached_data directly to strip the caching decorator if we want fresh?
-            # Actually, refresh_data() clears cache then calls get_cached_data.
-            # But refresh_data() returns a Response object.
-            # Let's reproduce the refresh_data logic here for clarity and safety.
-            
-            memory_cache.clear()
-            if redis_client:
-                redis_client.flushdb()
-                
-            results = get_cached_data() # fetches fresh because cache is clear
-            
-            if "funds" not in results:
-                logger.error("Scheduled refresh: No funds data fetched.")
-                return
+        market_day = refresh_market_data()
+        expected_day = expected_nav_day(datetime.now(IST), app.config.get('NAV_PUBLISH_HOUR', 21))
+        if market_day is not None:
+            # AMFI's own latest day accounts for exchange holidays
+            expected_day = min(expected_day, market_day)
+        summary = refresh_laggards(expected_day)
+        logger.info(f"Scheduled refresh for {format_nav_date(expected_day)}: {summary['fetched']} fetched, "
+                    f"{summary['recomputed']} recomputed, {summary['unchanged']} unchanged, {summary['failed']} failed, {summary['skipped']} up to date")
+        if fund_cache.get_index() is None:
+            raise RuntimeError("No funds data fetched")
 
-            logger.info("Scheduled refresh completed successfully.")
-        except Exception as e:
-            logger.error(f"Scheduled refresh failed: {e}")
-            logger.error(traceback.format_exc())
+        if summary["behind"] and job_scheduler is not None and retry < app.config.get('LAGGARD_MAX_RETRIES', 3):
+            delay = app.config.get('LAGGARD_RETRY_MINUTES', 60) * 60
+            logger.info(f"{len(summary['behind'])} funds still behind, retrying in {delay // 60} min")
+            job_scheduler.run_once("laggard-retry", profiled_job("laggard-retry", lambda: scheduled_refresh(retry + 1)),
+                                   delay=delay)
+        return dict(summary, behind=len(summary["behind"]), expected_day=format_nav_date(expected_day), retry=retry)
+
+def warm_up():
+    """Fill the dataset and the search index at startup so the first visitor does not wait"""
+    with app.app_context():
+        if refresh_snapshot(max_age=DATA_SOFT_TTL) is None:
+            logger.warning("Warm-up: no fund data available")
+        if get_nav_store().schemes_version()[0] == 0:
+            # Fresh deploy: load the scheme master now instead of at the next scheduled refresh
+            logger.info("Warm-up: scheme master is empty, refreshing market data")
+            refresh_market_data()
+        get_scheme_index()
 
 # Initialize Scheduler
 # Only start scheduler if not in debug mode (prevents double run with reloader)
+job_scheduler = None
 if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
-    scheduler = BackgroundScheduler()
+    # Every worker schedules the jobs; only the lease holder runs them
+    job_scheduler = JobScheduler(
+        LeaderLease(redis_client, ttl=app.config.get('SCHEDULER_LEADER_TTL', 30)),
+        IST,
+        redis_client=redis_client,
+        misfire_grace_time=app.config.get('SCHEDULER_MISFIRE_GRACE', 3600)
+    )
     # Run every day at 11:00 AM IST
-    scheduler.add_job(func=scheduled_refresh, trigger="cron", hour=11, minute=0, timezone=pytz.timezone('Asia/Kolkata'))
-    scheduler.start()
-    logger.info("Scheduler started (11:00 AM daily)")
+    job_scheduler.add_job("daily-refresh", profiled_job("daily-refresh", scheduled_refresh), "cron", hour=11, minute=0)
+    post_market_hours = app.config.get('POST_MARKET_REFRESH_HOURS')
+    if post_market_hours:
+        # Pick up the day's NAVs as AMFI publishes them in the evening
+        job_scheduler.add_job("post-market-refresh", profiled_job("post-market-refresh", scheduled_refresh), "cron",
+                              day_of_week="mon-fri",
+                              hour=post_market_hours, minute=app.config.get('POST_MARKET_REFRESH_MINUTES', '*/30'))
+    if app.config.get('SCHEDULER_WARMUP', True):
+        job_scheduler.run_once("warm-up", profiled_job("warm-up", warm_up))
+    job_scheduler.start()
+    atexit.register(job_scheduler.shutdown)
+    logger.info(f"Scheduler started (11:00 AM daily{', post-market ' + post_market_hours + 'h' if post_market_hours else ''}, "
+                f"leader: {job_scheduler.lease.is_leader})")
+
+@app.route('/api/scheduler')
+@login_required
+def scheduler_status():
+    """Leadership, next fire times and the latest run timings of the scheduled jobs"""
+    if job_scheduler is None:
+        return jsonify({"running": False, "jobs": {}})
+    return jsonify(job_scheduler.stats())
 
 
 @app.route('/api/notes', methods=['GET'])
 @login_required
 def get_notes():
     """Get all notes"""
-    return jsonify(load_notes())
+    return jsonify(notes_store.list())
 
 @app.route('/api/notes', methods=['POST'])
 @login_required
@@ -530,59 +1159,51 @@ def add_note():
         if not data or 'text' not in data or 'date' not in data:
             return jsonify({"error": "Invalid data"}), 400
             
-        notes = load_notes()
-        notes.append({
-            "date": data['date'],
-            "text": data['text'],
-            "created_at": datetime.now().isoformat()
-        })
-        
-        if save_notes(notes):
-            return jsonify({"message": "Note added successfully", "notes": notes})
-        else:
-            return jsonify({"error": "Failed to save note"}), 500
-            
+        note = notes_store.add(data['date'], data['text'])
+        return jsonify({"message": "Note added successfully", "note": note, "notes": notes_store.list()})
+
     except Exception as e:
         logger.error(f"Error adding note: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/notes/<int:index>', methods=['DELETE'])
+@app.route('/api/notes/<int:note_id>', methods=['DELETE'])
 @login_required
-def delete_note(index):
-    """Delete a note by index"""
+def delete_note(note_id):
+    """Delete a note by its ID"""
     try:
-        notes = load_notes()
-        if 0 <= index < len(notes):
-            notes.pop(index)
-            if save_notes(notes):
-                return jsonify({"message": "Note deleted successfully", "notes": notes})
-            else:
-                return jsonify({"error": "Failed to save changes"}), 500
-        else:
-            return jsonify({"error": "Note not found"}), 404
-            
+        if notes_store.delete(note_id):
+            return jsonify({"message": "Note deleted successfully", "notes": notes_store.list()})
+        return jsonify({"error": "Note not found"}), 404
+
     except Exception as e:
         logger.error(f"Error deleting note: {e}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/health')
 def health_check():
-    """Health check endpoint for monitoring"""
+    """Cheap health check for probes: reads the published index only and never triggers a fetch"""
     try:
-        # Check if we can fetch data
-        results = get_cached_data()
-        
+        index = fund_cache.get_index()
         health_status = {
             "status": "healthy",
             "timestamp": datetime.now().isoformat(),
             "redis_connected": redis_client is not None,
-            "funds_count": len(results.get("funds", [])),
-            "cache_size": len(memory_cache)
+            "funds_count": len(index["funds"]) if index else 0,
+            "data_version": index["version"] if index else None,
+            "data_age_seconds": int(time.time() - index["fetched_at"]) if index else None,
+            "cache": {
+                "responses": response_cache.stats(),
+                "funds": fund_cache.stats(),
+                "fragments": dashboard_fragments.stats()
+            }
         }
         
-        if "error" in results:
+        if index is None:
+            health_status["status"] = "degraded"
+            health_status["error"] = "No data published yet"
+        elif health_status["data_age_seconds"] >= DATA_HARD_TTL:
             health_status["status"] = "degraded"
-            health_status["error"] = results["error"]
+            health_status["error"] = "Data older than DATA_HARD_TTL"
         
         return jsonify(health_status)
         
@@ -594,6 +1215,15 @@ def health_check():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+metrics.register_cache("responses", lambda: response_cache.stats())
+metrics.register_cache("fund_entries", lambda: fund_cache.stats()["entries"])
+metrics.register_cache("fund_index", lambda: fund_cache.stats()["index"])
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint (per worker process, see metrics.py)"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.errorhandler(404)
 def not_found(error):
     return render_template('error.html', 
@@ -0,0 +1,116 @@
+"""Long-lived asyncio runtime for upstream fetches.
+
+One daemon thread runs an event loop for the lifetime of the worker process
+and owns a single pooled ``aiohttp.ClientSession``. Flask handlers and
+scheduler jobs submit coroutines to it instead of calling ``asyncio.run``, so
+DNS lookups and TCP/TLS connections to api.mfapi.in are reused across
+refreshes through keep-alive.
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import os
+import threading
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    def __init__(self, max_connections=10, connections_per_host=5, keepalive_timeout=60, request_timeout=30,
+                 call_timeout=None):
+        self.max_connections = max_connections
+        self.connections_per_host = connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        # Leaves room for upstream retries, but a hung coroutine cannot block a request thread forever
+        self.call_timeout = call_timeout if call_timeout is not None else request_timeout * 2
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Re-create the loop after a fork: threads do not survive into the child
+        if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid() or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._run_loop, args=(loop,),
+                                          name="async-runtime", daemon=True)
+                thread.start()
+                self._loop, self._thread, self._session, self._pid = loop, thread, None, os.getpid()
+                logger.info("Async runtime started")
+        return self._loop
+
+    @staticmethod
+    def _run_loop(loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    async def get_session(self):
+        """Return the shared session, creating it inside the runtime loop on first use"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    limit_per_host=self.connections_per_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=300
+                )
+            )
+        return self._session
+
+    def submit(self, coro):
+        """Schedule a coroutine on the runtime loop and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def call(self, coro_fn, *args, timeout=None, **kwargs):
+        """Run ``coro_fn(*args, session=<shared session>, **kwargs)`` on the runtime and wait for it.
+
+        Waits at most ``timeout`` seconds (default ``call_timeout``), then
+        cancels the coroutine and raises ``TimeoutError``.
+        """
+        async def with_session():
+            return await coro_fn(*args, session=await self.get_session(), **kwargs)
+
+        timeout = self.call_timeout if timeout is None else timeout
+        future = self.submit(with_session())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            logger.warning(f"{getattr(coro_fn, '__name__', coro_fn)} timed out after {timeout}s, cancelled")
+            raise
+
+    def stop(self):
+        """Close the session and stop the loop (called at interpreter exit)"""
+        loop = self._loop
+        if loop is None or self._pid != os.getpid() or not loop.is_running():
+            return
+        if self._session is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self._session.close(), loop).result(5)
+            except Exception as e:
+                logger.warning(f"Error closing upstream session: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime(max_connections=10, connections_per_host=5):
+    """Return the process-wide runtime; pool sizes apply when it is first created"""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = AsyncRuntime(max_connections, connections_per_host)
+                atexit.register(_runtime.stop)
+    return _runtime
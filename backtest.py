@@ -0,0 +1,195 @@
+"""Offline backtest of ranking formulas over the stored NAV histories.
+
+At each rebalance date T every fund's history is cut at T, the scoring
+metrics are computed exactly as the live dashboard would have computed them
+on that day, each formula picks its top N funds, and the equal-weighted
+forward return of that pick over the holding period is measured against
+the average of all eligible funds. Eligibility is decided from the data
+available at T, so funds that disappear later are not dropped in hindsight.
+
+Nothing is fetched: histories come from the NavStore. Rebalance dates are
+spread over a process pool; each task computes the metrics for its date once
+and evaluates every formula on them, since the metrics dominate the cost.
+
+Usage: python backtest.py --years 10 --top 5 --holding-days 365
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+
+from analytics import compute_returns_batch
+from nav_store import format_nav_date, get_nav_store
+from risk import compute_risk_batch
+from scoring import FORMULAS, MetricsMatrix
+
+logger = logging.getLogger(__name__)
+
+# A fund needs this much history at T to be ranked (the 1Y return is the shortest the formulas use)
+MIN_HISTORY_DAYS = 365
+# A fund whose latest NAV at T is older than this had stopped reporting (merged or wound up)
+MAX_STALE_DAYS = 10
+
+# Histories shared with pool workers through the initializer, sent once per process
+_histories = None
+
+
+def load_histories(codes, store=None):
+    """Load ``{code: NavSeries}`` from the NAV store, skipping empty schemes"""
+    store = store or get_nav_store()
+    histories = {}
+    for code in codes:
+        series = store.load(code)
+        if len(series):
+            histories[str(code)] = series
+    return histories
+
+
+def monthly_rebalance_days(start_day, end_day):
+    """First calendar day of every month in ``[start_day, end_day]``, as ordinals"""
+    current = date.fromordinal(start_day)
+    current = date(current.year, current.month, 1)
+    days = []
+    while current.toordinal() <= end_day:
+        if current.toordinal() >= start_day:
+            days.append(current.toordinal())
+        current = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+    return days
+
+
+def _nav_on_or_before(days, navs, day):
+    i = np.searchsorted(days, day, side='right') - 1
+    return navs[i] if i >= 0 else np.nan
+
+
+def evaluate_date(histories, day, formulas, top_n, holding_days):
+    """Pick the top ``top_n`` funds per formula as of ``day`` and measure their forward returns.
+
+    Eligibility only uses what was known at ``day``, so funds merged or wound
+    up during the holding period stay in the universe; their forward return
+    runs to their last NAV. Returns ``None`` when fewer than ``top_n`` funds
+    are eligible, otherwise
+    ``{"day", "universe", "benchmark", "formulas": {name: {"picks", "return"}}}``
+    with returns in %.
+    """
+    codes, series, forward = [], [], []
+    exit_day = day + holding_days
+    for code, (days, navs) in histories.items():
+        # Eligible: enough history before T and still reporting at T
+        cut = np.searchsorted(days, day, side='right')
+        if days[0] > day - MIN_HISTORY_DAYS or cut == 0 or days[cut - 1] < day - MAX_STALE_DAYS:
+            continue
+        entry = navs[cut - 1]
+        codes.append(code)
+        series.append((days[:cut], navs[:cut]))
+        forward.append((_nav_on_or_before(days, navs, exit_day) / entry - 1) * 100)
+    if len(codes) < top_n:
+        return None
+
+    results = compute_returns_batch([{"name": code, "code": code} for code in codes], series)
+    for result, metrics in zip(results, compute_risk_batch(series)):
+        result["risk_metrics"] = metrics
+    matrix = MetricsMatrix(results)
+    forward = np.asarray(forward)
+
+    picks = {}
+    for name in formulas:
+        chosen = [row["code"] for row in matrix.rank(name, limit=top_n)]
+        chosen_idx = [codes.index(code) for code in chosen]
+        picks[name] = {"picks": chosen, "return": float(forward[chosen_idx].mean())}
+    return {"day": day, "universe": len(codes), "benchmark": float(forward.mean()), "formulas": picks}
+
+
+def _init_worker(histories):
+    global _histories
+    _histories = histories
+
+
+def _evaluate_in_worker(args):
+    day, formulas, top_n, holding_days = args
+    return evaluate_date(_histories, day, formulas, top_n, holding_days)
+
+
+def summarize_runs(runs, formulas):
+    """Aggregate per-date results into per-formula statistics, best mean excess return first"""
+    summary = []
+    for name in formulas:
+        returns = np.array([run["formulas"][name]["return"] for run in runs])
+        excess = returns - np.array([run["benchmark"] for run in runs])
+        summary.append({
+            "formula": name,
+            "description": FORMULAS[name].description,
+            "periods": len(runs),
+            "mean_return": float(returns.mean()) if len(runs) else 0.0,
+            "mean_excess": float(excess.mean()) if len(runs) else 0.0,
+            "hit_rate": float((excess > 0).mean() * 100) if len(runs) else 0.0,
+            "worst_return": float(returns.min()) if len(runs) else 0.0,
+        })
+    return sorted(summary, key=lambda row: row["mean_excess"], reverse=True)
+
+
+def run_backtest(histories, rebalance_days, formulas=None, top_n=5, holding_days=365, workers=None):
+    """Evaluate ``formulas`` (default: all registered) at every rebalance day.
+
+    ``workers`` processes share the work (default: CPU count); ``workers=1``
+    runs in-process. Returns ``{"summary": [...], "runs": [...]}``.
+    """
+    formulas = list(formulas or FORMULAS)
+    unknown = [name for name in formulas if name not in FORMULAS]
+    if unknown:
+        raise ValueError(f"Unknown formulas: {', '.join(unknown)}")
+
+    tasks = [(day, formulas, top_n, holding_days) for day in rebalance_days]
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    if workers == 1 or len(tasks) < 2:
+        runs = [evaluate_date(histories, *task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(histories,)) as pool:
+            runs = list(pool.map(_evaluate_in_worker, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    runs = [run for run in runs if run is not None]
+    logger.info(f"Backtested {len(formulas)} formulas over {len(runs)} rebalance dates "
+                f"and {len(histories)} funds in {time.perf_counter() - started:.2f}s")
+    return {"summary": summarize_runs(runs, formulas), "runs": runs}
+
+
+def main():
+    from fetch_mf_returns import get_all_funds
+
+    parser = argparse.ArgumentParser(description="Backtest ranking formulas on stored NAV histories")
+    parser.add_argument("--years", type=int, default=10, help="how far back the first rebalance is")
+    parser.add_argument("--top", type=int, default=5, help="funds picked per formula")
+    parser.add_argument("--holding-days", type=int, default=365, help="holding period after each rebalance")
+    parser.add_argument("--formula", action="append", help="formula to test (repeatable, default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    histories = load_histories(f["code"] for f in get_all_funds())
+    if not histories:
+        print("No stored NAV histories; refresh the dashboard once to populate the store.")
+        return
+
+    last_day = max(series.latest_day for series in histories.values())
+    rebalance_days = monthly_rebalance_days(last_day - 365 * args.years, last_day - args.holding_days)
+    result = run_backtest(histories, rebalance_days, args.formula, args.top, args.holding_days, args.workers)
+
+    if not result["runs"]:
+        print("Not enough history for any rebalance date.")
+        return
+    print(f"\nTop {args.top} funds, {args.holding_days}-day holding, {len(result['runs'])} rebalances "
+          f"from {format_nav_date(result['runs'][0]['day'])} to {format_nav_date(result['runs'][-1]['day'])}")
+    print("=" * 100)
+    print(f"{'Formula':<28} {'Mean %':>8} {'Excess %':>9} {'Hit %':>7} {'Worst %':>8}  Description")
+    for row in result["summary"]:
+        print(f"{row['formula']:<28} {row['mean_return']:>8.2f} {row['mean_excess']:>9.2f} "
+              f"{row['hit_rate']:>7.1f} {row['worst_return']:>8.2f}  {row['description']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Benchmarks for the NAV parsing, lookup and returns hot path.
+
+Runs every registered stage at 10, 100, 1,000 and 10,000 funds with
+synthetic 15-year daily histories (the same generator as the mfapi
+stand-in) and reports wall time and peak traced memory per stage. Results
+can be stored as baselines and later runs compared against them; a stage
+more than ``REGRESSION_TOLERANCE`` slower than its baseline is flagged and
+makes the run exit non-zero.
+
+Legacy stages (the scalar ``parse_nav_data``/``find_closest_nav`` path that
+``NavSeries`` replaced) are skipped above ``--max-legacy-funds`` because they
+take minutes at 10,000 funds. New engines register their own stages with
+``@stage``.
+
+Usage:
+    python benchmark.py                      # compare against benchmark_baselines.json
+    python benchmark.py --sizes 10 100 --save-baseline
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+
+from analytics import ANCHOR_OFFSETS, asof_lookup, compute_returns_batch
+from fetch_mf_returns import find_closest_nav, parse_nav_data
+from mock_mfapi import SYNTHETIC_CODE_BASE, synthetic_history
+from nav_store import NavSeries, parse_new_rows
+from risk import compute_risk_batch
+
+SIZES = (10, 100, 1000, 10000)
+HISTORY_YEARS = 15
+# Distinct synthetic histories; fund i reuses template i % TEMPLATES so 10,000 funds fit in memory
+TEMPLATES = 64
+# Fixed end date keeps the synthetic data identical between runs
+END_DAY = date(2025, 1, 31).toordinal()
+
+# Funds used for the peak-memory run of per-fund stages: their peak does not grow with the
+# fund count, and tracemalloc makes pure-Python loops an order of magnitude slower
+PER_FUND_MEMORY_SAMPLE = 10
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baselines.json')
+REGRESSION_TOLERANCE = 1.25
+
+Stage = namedtuple("Stage", ["name", "engine", "fn", "legacy", "per_fund"])
+
+STAGES = {}
+
+
+def stage(name, engine, legacy=False, per_fund=False):
+    """Register ``fn(dataset)`` as a benchmark stage.
+
+    ``per_fund`` marks stages that process one fund at a time and keep no
+    per-fund state; their peak memory is measured on a small sample.
+    """
+    def decorator(fn):
+        STAGES[name] = Stage(name, engine, fn, legacy, per_fund)
+        return fn
+    return decorator
+
+
+class Dataset:
+    """``n`` funds backed by a pool of synthetic mfapi histories, with parsed forms cached per template"""
+
+    def __init__(self, n, years=HISTORY_YEARS, templates=TEMPLATES):
+        self.n = n
+        self.funds = [{"name": f"Fund {i}", "code": str(SYNTHETIC_CODE_BASE + i)} for i in range(n)]
+        self._rows = [synthetic_history(SYNTHETIC_CODE_BASE + t, years, END_DAY)["data"]
+                      for t in range(min(n, templates))]
+        self._parsed = {}
+        self._series = {}
+
+    def sample(self, n):
+        """A smaller dataset sharing this one's templates and parsed forms"""
+        subset = Dataset.__new__(Dataset)
+        subset.n = min(n, self.n)
+        subset.funds = self.funds[:subset.n]
+        subset._rows, subset._parsed, subset._series = self._rows, self._parsed, self._series
+        return subset
+
+    def rows(self, i):
+        """mfapi ``data`` rows (newest first) of fund ``i``"""
+        return self._rows[i % len(self._rows)]
+
+    def parsed(self, i):
+        t = i % len(self._rows)
+        if t not in self._parsed:
+            self._parsed[t] = parse_nav_data(self._rows[t])
+        return self._parsed[t]
+
+    def series(self, i):
+        """``NavSeries`` of fund ``i``, as loaded from the NAV store"""
+        t = i % len(self._rows)
+        if t not in self._series:
+            self._series[t] = NavSeries.from_mfapi(self._rows[t])
+        return self._series[t]
+
+    def series_list(self):
+        return [self.series(i) for i in range(self.n)]
+
+    def warm(self, stages):
+        """Build the inputs the stages need before anything is measured"""
+        if any(s.legacy for s in stages):
+            for i in range(min(self.n, len(self._rows))):
+                self.parsed(i)
+        for i in range(min(self.n, len(self._rows))):
+            self.series(i)
+
+
+@stage("parse_nav_data", "scalar", legacy=True, per_fund=True)
+def _parse_nav_data(ds):
+    for i in range(ds.n):
+        parse_nav_data(ds.rows(i))
+
+
+@stage("find_closest_nav", "scalar", legacy=True, per_fund=True)
+def _find_closest_nav(ds):
+    for i in range(ds.n):
+        parsed, dates = ds.parsed(i)
+        latest = dates[-1]
+        for offset in ANCHOR_OFFSETS:
+            find_closest_nav(parsed, dates, latest - timedelta(days=offset))
+
+
+@stage("parse_new_rows", "store", per_fund=True)
+def _parse_new_rows(ds):
+    for i in range(ds.n):
+        parse_new_rows(ds.rows(i))
+
+
+@stage("nav_series_from_mfapi", "numpy", per_fund=True)
+def _nav_series_from_mfapi(ds):
+    for i in range(ds.n):
+        NavSeries.from_mfapi(ds.rows(i))
+
+
+@stage("nav_series_asof", "numpy", per_fund=True)
+def _nav_series_asof(ds):
+    for i in range(ds.n):
+        series = ds.series(i)
+        latest = series.latest_day
+        for offset in ANCHOR_OFFSETS:
+            series.asof(latest - offset)
+
+
+@stage("asof_lookup", "numpy")
+def _asof_lookup(ds):
+    asof_lookup(ds.series_list())
+
+
+@stage("compute_returns_batch", "numpy")
+def _compute_returns_batch(ds):
+    compute_returns_batch(ds.funds, ds.series_list())
+
+
+@stage("compute_risk_batch", "numpy")
+def _compute_risk_batch(ds):
+    compute_risk_batch(ds.series_list())
+
+
+def measure(fn, dataset, repeat=1, memory=True, memory_dataset=None):
+    """Best wall time over ``repeat`` runs, then peak traced memory (MB) of one more run
+    (on ``memory_dataset`` when given)"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn(dataset)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    peak_mb = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn(memory_dataset or dataset)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return best, peak_mb
+
+
+def run(sizes=SIZES, stages=None, repeat=1, memory=True, max_legacy_funds=1000, report=print):
+    """Run the selected stages at each size; returns ``{"<stage>@<n>": {...}}``"""
+    selected = [STAGES[name] for name in (stages or STAGES)]
+    results = {}
+    for n in sizes:
+        dataset = Dataset(n)
+        dataset.warm(selected)
+        for s in selected:
+            key = f"{s.name}@{n}"
+            if s.legacy and n > max_legacy_funds:
+                report(f"{key:<32} skipped (legacy stage above {max_legacy_funds} funds)")
+                continue
+            sample = dataset.sample(PER_FUND_MEMORY_SAMPLE) if s.per_fund else None
+            seconds, peak_mb = measure(s.fn, dataset, repeat, memory, sample)
+            results[key] = {"stage": s.name, "engine": s.engine, "funds": n,
+                            "seconds": seconds, "peak_mb": peak_mb}
+            report(f"{key:<32} {seconds * 1000:>11.1f} ms" +
+                   (f" {peak_mb:>10.1f} MB" if peak_mb is not None else ""))
+    return results
+
+
+def compare(results, baselines, tolerance=REGRESSION_TOLERANCE):
+    """Return ``[(key, seconds, baseline_seconds)]`` for stages slower than the baseline allows"""
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get("results", {}).get(key)
+        if baseline and result["seconds"] > baseline["seconds"] * tolerance:
+            regressions.append((key, result["seconds"], baseline["seconds"]))
+    return regressions
+
+
+def load_baselines(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baselines(results, path=BASELINE_FILE):
+    """Merge ``results`` into the baseline file (other sizes/stages are kept)"""
+    baselines = load_baselines(path)
+    baselines.setdefault("results", {}).update(results)
+    baselines["machine"] = {"python": platform.python_version(), "numpy": np.__version__,
+                            "platform": platform.platform(), "cpus": os.cpu_count()}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NAV parsing, lookup and returns hot path")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--stage", action="append", choices=sorted(STAGES), help="stage to run (repeatable)")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per stage (best is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory run")
+    parser.add_argument("--max-legacy-funds", type=int, default=1000)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    args = parser.parse_args()
+
+    print(f"{'stage@funds':<32} {'time':>14} {'peak':>13}")
+    results = run(args.sizes, args.stage, args.repeat, not args.no_memory, args.max_legacy_funds)
+
+    if args.save_baseline:
+        save_baselines(results, args.baseline)
+        print(f"\nSaved {len(results)} baselines to {args.baseline}")
+        return
+
+    regressions = compare(results, load_baselines(args.baseline))
+    for key, seconds, baseline in regressions:
+        print(f"REGRESSION {key}: {seconds * 1000:.1f} ms vs baseline {baseline * 1000:.1f} ms")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Two-tier (in-process L1 + Redis L2) cache.
+
+Keys are deterministic across processes: they are built from a fixed prefix,
+a schema version, a namespace and either the literal key parts or a SHA-1
+digest of the call arguments, never from Python's randomized ``hash()``. L2
+hits are promoted into L1 so repeat reads in the same worker skip the Redis
+round-trip and the JSON decode. Each tier has its own TTL and the cache keeps
+hit/miss counters per tier.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import Counter
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "mf"
+# Bump to orphan every cached entry after an incompatible change to cached payloads
+KEY_VERSION = 1
+
+
+def args_digest(args=(), kwargs=None):
+    """Stable digest of call arguments (identical in every process)"""
+    payload = json.dumps([list(args), kwargs or {}], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]
+
+
+def make_key(namespace, *parts):
+    """Build a versioned, namespaced key such as ``mf:v1:fund:120828``"""
+    return ":".join([KEY_PREFIX, f"v{KEY_VERSION}", namespace] + [str(p) for p in parts])
+
+
+class TwoTierCache:
+    """JSON-serializable values cached in-process (L1) and in Redis (L2)"""
+
+    def __init__(self, redis_client=None, l1_maxsize=200, l1_ttl=600, l2_ttl=600):
+        self.redis = redis_client
+        self.l2_ttl = l2_ttl
+        self._l1 = TTLCache(maxsize=l1_maxsize, ttl=l1_ttl)
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._local_counters = {}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _l1_get(self, key):
+        with self._lock:
+            return self._l1.get(key)
+
+    def _l1_set(self, key, value):
+        with self._lock:
+            self._l1[key] = value
+
+    def get(self, key, default=None, use_l1=True):
+        return self.get_many([key], use_l1=use_l1).get(key, default)
+
+    def get_many(self, keys, use_l1=True):
+        """Return ``{key: value}`` for every key found in either tier"""
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._l1_get(key) if use_l1 else None
+            if value is not None:
+                found[key] = value
+            else:
+                missing.append(key)
+        self._count('l1_hits', len(found))
+
+        if missing and self.redis:
+            try:
+                raw = self.redis.mget(missing)
+            except Exception as e:
+                self._count('errors')
+                logger.warning(f"Redis cache get error: {e}")
+                raw = [None] * len(missing)
+            for key, value in zip(missing, raw):
+                if value is None:
+                    continue
+                value = json.loads(value)
+                found[key] = value
+                self._l1_set(key, value)  # promote into L1
+                self._count('l2_hits')
+
+        self._count('misses', len(keys) - len(found))
+        return found
+
+    def set(self, key, value, l2_ttl=None):
+        self.set_many({key: value}, l2_ttl=l2_ttl)
+
+    def set_many(self, items, l2_ttl=None):
+        if not items:
+            return
+        with self._lock:
+            for key, value in items.items():
+                self._l1[key] = value
+        self._count('sets', len(items))
+        if self.redis:
+            try:
+                pipe = self.redis.pipeline()
+                for key, value in items.items():
+                    pipe.setex(key, l2_ttl or self.l2_ttl, json.dumps(value))
+                pipe.execute()
+            except Exception as e:
+                self._count('errors')
+                logger.warning(f"Redis cache set error: {e}")
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._l1.pop(key, None)
+        if self.redis and keys:
+            try:
+                self.redis.delete(*keys)
+            except Exception as e:
+                self._count('errors')
+                logger.warning(f"Redis cache delete error: {e}")
+
+    def incr(self, key):
+        """Atomically increment a counter in Redis (process-local when Redis is unavailable)"""
+        if self.redis:
+            try:
+                return int(self.redis.incr(key))
+            except Exception as e:
+                self._count('errors')
+                logger.warning(f"Redis incr error: {e}")
+        with self._lock:
+            self._local_counters[key] = self._local_counters.get(key, 0) + 1
+            return self._local_counters[key]
+
+    def clear_local(self):
+        """Drop every L1 entry of this process"""
+        with self._lock:
+            self._l1.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            l1_size = len(self._l1)
+        lookups = counters.get('l1_hits', 0) + counters.get('l2_hits', 0) + counters.get('misses', 0)
+        return {
+            "l1_hits": counters.get('l1_hits', 0),
+            "l2_hits": counters.get('l2_hits', 0),
+            "misses": counters.get('misses', 0),
+            "sets": counters.get('sets', 0),
+            "errors": counters.get('errors', 0),
+            "l1_size": l1_size,
+            "hit_ratio": round((lookups - counters.get('misses', 0)) / lookups, 4) if lookups else None
+        }
@@ -22,11 +22,31 @@ class Config:
     # Cache settings
     MEMORY_CACHE_SIZE = int(os.getenv('MEMORY_CACHE_SIZE', 200))
     MEMORY_CACHE_TTL = int(os.getenv('MEMORY_CACHE_TTL', 600))  # 10 minutes
+
+    # Fund dataset freshness (stale-while-revalidate)
+    DATA_SOFT_TTL = int(os.getenv('DATA_SOFT_TTL', 600))  # older snapshots are served but refreshed in the background
+    DATA_HARD_TTL = int(os.getenv('DATA_HARD_TTL', 86400))  # older snapshots block the request on a fresh fetch
+    REFRESH_LEASE_TTL = int(os.getenv('REFRESH_LEASE_TTL', 120))  # seconds; renewed while a refresh runs
+    REFRESH_WAIT_TIMEOUT = int(os.getenv('REFRESH_WAIT_TIMEOUT', 120))  # max wait for another worker's refresh
+
+    # Scheduled jobs (run by the one worker holding the leader lease; times in IST)
+    SCHEDULER_LEADER_TTL = int(os.getenv('SCHEDULER_LEADER_TTL', 30))  # seconds; renewed every third of it
+    SCHEDULER_MISFIRE_GRACE = int(os.getenv('SCHEDULER_MISFIRE_GRACE', 3600))  # how late a missed run may still fire
+    SCHEDULER_WARMUP = os.getenv('SCHEDULER_WARMUP', 'True').lower() == 'true'  # fill the caches at startup
+    POST_MARKET_REFRESH_HOURS = os.getenv('POST_MARKET_REFRESH_HOURS', '21-23')  # evening NAV publication window; empty disables
+    POST_MARKET_REFRESH_MINUTES = os.getenv('POST_MARKET_REFRESH_MINUTES', '*/30')
+    NAV_PUBLISH_HOUR = int(os.getenv('NAV_PUBLISH_HOUR', 21))  # from this IST hour on, today's NAV is expected
+    LAGGARD_RETRY_MINUTES = int(os.getenv('LAGGARD_RETRY_MINUTES', 60))  # retry funds still behind after a refresh
+    LAGGARD_MAX_RETRIES = int(os.getenv('LAGGARD_MAX_RETRIES', 3))
     
     # API settings
     API_TIMEOUT = int(os.getenv('API_TIMEOUT', 15))
     API_RATE_LIMIT = int(os.getenv('API_RATE_LIMIT', 3))  # requests per second
     API_RATE_PERIOD = int(os.getenv('API_RATE_PERIOD', 1))  # seconds
+    API_MAX_RATE_LIMIT = float(os.getenv('API_MAX_RATE_LIMIT', 10))  # ceiling while upstream is healthy
+    API_MAX_CONCURRENCY_PER_HOST = int(os.getenv('API_MAX_CONCURRENCY_PER_HOST', 5))
+    API_MAX_RETRIES = int(os.getenv('API_MAX_RETRIES', 3))
+    API_RETRY_BUDGET = float(os.getenv('API_RETRY_BUDGET', 0.2))  # retries earned per first attempt
     
     # Logging settings
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -37,7 +57,22 @@ class Config:
     
     # External API settings
     MF_API_BASE_URL = os.getenv('MF_API_BASE_URL', 'https://api.mfapi.in/mf')
+    AMFI_NAVALL_URL = os.getenv('AMFI_NAVALL_URL', 'https://www.amfiindia.com/spages/NAVAll.txt')  # path or URL; empty disables the bulk ingest
     
+    # Fund search (local scheme-master index)
+    SCHEME_SEARCH_LIMIT = int(os.getenv('SCHEME_SEARCH_LIMIT', 20))  # results per query unless ?limit= asks for fewer/more
+    SCHEME_SEARCH_MAX_LIMIT = int(os.getenv('SCHEME_SEARCH_MAX_LIMIT', 100))
+    SCHEME_SEARCH_CACHE_SIZE = int(os.getenv('SCHEME_SEARCH_CACHE_SIZE', 1024))  # recent queries kept (LRU)
+
+    # Opt-in profiling: requests carrying X-Profile (or ?profile=) with PROFILING_TOKEN, or ?profile=1 from a
+    # logged-in user, and the jobs listed in PROFILE_JOBS are profiled into PROFILE_DIR (default DATA_DIR/profiles)
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+    PROFILING_TOKEN = os.getenv('PROFILING_TOKEN')
+    PROFILER = os.getenv('PROFILER', 'cprofile')  # 'cprofile' (pstats) or 'sampling' (speedscope)
+    PROFILE_DIR = os.getenv('PROFILE_DIR')
+    PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 50))  # most recent profiles kept on disk
+    PROFILE_JOBS = [job for job in os.getenv('PROFILE_JOBS', '').split(',') if job]  # e.g. daily-refresh,warm-up
+
     # Performance settings
     MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', 10))
     CONNECTION_POOL_SIZE = int(os.getenv('CONNECTION_POOL_SIZE', 5))
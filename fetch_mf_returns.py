@@ -1,21 +1,28 @@
 import aiohttp
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
-from asyncio_throttle import Throttler
 from cachetools import TTLCache
+from nav_store import get_nav_store, parse_new_rows
+from analytics import compute_returns_batch
+from risk import compute_risk_batch
+from config import get_config
+from upstream import UpstreamClient
+from fund_registry import FundRegistry
+from metrics import COMPUTE
 
 logger = logging.getLogger(__name__)
 
-# Cache for API responses (10 minutes TTL for better performance)
-api_cache = TTLCache(maxsize=100, ttl=600)
+# Cache for API responses (10 minutes TTL for better performance), never longer than the
+# dataset's soft TTL so a refresh of a stale fund does not get its old result back
+api_cache = TTLCache(maxsize=100, ttl=min(600, get_config().DATA_SOFT_TTL))
 
-import json
 import os
 DATA_DIR = os.getenv('DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
 os.makedirs(DATA_DIR, exist_ok=True)
 FUNDS_FILE = os.path.join(DATA_DIR, 'funds.json')
 RESEARCH_FUNDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'research_funds.json')
+MF_API_URL = get_config().MF_API_BASE_URL.rstrip("/")
 
 DEFAULT_FUNDS = [
     {"name": "Motilal Oswal Midcap Fund", "code": "127042"},
@@ -30,53 +37,20 @@ DEFAULT_FUNDS = [
     {"name": "HDFC Mid-Cap Opportunities Fund", "code": "118989"},
 ]
 
+# Parsed once and revalidated by file stat; add/remove are atomic under a file lock
+fund_registry = FundRegistry(FUNDS_FILE, RESEARCH_FUNDS_FILE, DEFAULT_FUNDS)
+
 def load_funds():
-    if not os.path.exists(FUNDS_FILE):
-        save_funds(DEFAULT_FUNDS)
-        return DEFAULT_FUNDS
-    try:
-        with open(FUNDS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading funds: {e}")
-        return DEFAULT_FUNDS
+    return fund_registry.portfolio()
 
 def load_research_funds():
-    if not os.path.exists(RESEARCH_FUNDS_FILE):
-        return []
-    try:
-        with open(RESEARCH_FUNDS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading research funds: {e}")
-        return []
-
-def save_funds(funds_list):
-    try:
-        with open(FUNDS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(funds_list, f, indent=4)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving funds: {e}")
-        return False
+    return fund_registry.research()
 
 def add_fund(name, code):
-    funds_list = load_funds()
-    if not any(f['code'] == code for f in funds_list):
-        funds_list.append({"name": name, "code": code})
-        if save_funds(funds_list):
-            return True
-        else:
-            return False
-    return False
+    return fund_registry.add(name, code)
 
 def remove_fund(code):
-    funds_list = load_funds()
-    new_funds = [f for f in funds_list if f['code'] != code]
-    if len(new_funds) != len(funds_list):
-        save_funds(new_funds)
-        return True
-    return False
+    return fund_registry.remove(code)
 
 
 import bisect
@@ -109,200 +83,279 @@ def find_closest_nav(parsed_navs, dates, target_date):
     _, nav, date_str = parsed_navs[idx-1]
     return nav, date_str
 
-async def fetch_fund_data_async(session, fund, throttler):
-    """Fetch fund data asynchronously with rate limiting and improved caching"""
+_upstream_client = None
+
+def get_upstream_client():
+    """Return the shared adaptive upstream client, configured from config.py"""
+    global _upstream_client
+    if _upstream_client is None:
+        cfg = get_config()
+        _upstream_client = UpstreamClient(
+            rate=cfg.API_RATE_LIMIT,
+            period=cfg.API_RATE_PERIOD,
+            max_rate=cfg.API_MAX_RATE_LIMIT,
+            max_concurrency=cfg.API_MAX_CONCURRENCY_PER_HOST,
+            timeout=cfg.API_TIMEOUT,
+            max_retries=cfg.API_MAX_RETRIES,
+            retry_budget_ratio=cfg.API_RETRY_BUDGET
+        )
+    return _upstream_client
+
+async def sync_fund_history(session, fund, client, store=None):
+    """Bring the stored NAV history of a fund up to date.
+
+    Known schemes first ask for ``/latest``; when that single point directly
+    follows the stored history (weekends and recorded holidays skipped) it is
+    merged without downloading the full history. Otherwise (new scheme, gap
+    of missing trading days) the full history is fetched but only the rows
+    newer than the stored date are parsed. Schemes whose stored history has
+    gaps (a bulk NAVAll point that skipped trading days) are downloaded in
+    full. Returns the number of new points, or None when upstream had no
+    usable data; retryable errors that outlast the client's retries are raised.
+    """
+    store = store or get_nav_store()
+    code = fund['code']
+    last_day = store.last_complete_day(code)
+
+    if last_day is not None:
+        latest = await client.get_json(session, f"{MF_API_URL}/{code}/latest")
+        if latest and latest.get("data"):
+            rows = parse_new_rows(latest["data"], after_day=last_day)
+            if not rows:
+                return 0
+            if store.is_continuous(last_day, rows[-1][0]):
+                return store.merge(code, rows)
+
+    data = await client.get_json(session, f"{MF_API_URL}/{code}")
+    if data is None:
+        return None
+    if "data" not in data:
+        logger.error(f"Invalid response format for {fund['name']}: 'data' key missing")
+        return None
+    if not data["data"]:
+        logger.error(f"Empty NAV data for {fund['name']}")
+        return None
+
+    return store.merge(code, parse_new_rows(data["data"], after_day=last_day))
+
+async def _sync_and_load(session, fund, client, store=None):
+    """``(new_points, series)``: the sync outcome (None when upstream failed) and the stored ``NavSeries``"""
+    store = store or get_nav_store()
+    try:
+        new_points = await sync_fund_history(session, fund, client, store=store)
+    except asyncio.TimeoutError:
+        logger.error(f"Timeout while fetching data for {fund['name']}")
+        new_points = None
+    except Exception as e:
+        logger.error(f"Error fetching {fund['name']}: {str(e)}")
+        new_points = None
+
+    series = store.load(fund['code'])
+    if not len(series):
+        logger.error(f"No stored NAV history for {fund['name']}")
+        return new_points, None
+    if new_points is None:
+        logger.warning(f"Upstream refresh failed for {fund['name']}, using stored history")
+    else:
+        logger.info(f"Merged {new_points} new NAV points for {fund['name']}")
+    return new_points, series
+
+async def load_fund_history(session, fund, client):
+    """Sync a fund's stored history with upstream and return its ``NavSeries``.
+
+    Falls back to whatever is already stored when the upstream call fails;
+    returns None only when nothing is stored for the scheme.
+    """
+    return (await _sync_and_load(session, fund, client))[1]
+
+def compute_fund_results(funds, histories):
+    """Returns (analytics) plus risk metrics (risk) for funds with loaded ``(days, navs)`` histories"""
+    with COMPUTE.time(stage="returns"):
+        results = compute_returns_batch(funds, histories)
+    with COMPUTE.time(stage="risk"):
+        risk_metrics = compute_risk_batch(histories)
+    for result, metrics in zip(results, risk_metrics):
+        result["risk_metrics"] = metrics
+    return results
+
+def _with_portfolio_flag(result, fund):
+    """Copy a cached result and inject is_portfolio for the current request"""
+    final_result = result.copy()
+    final_result["is_portfolio"] = fund.get("is_portfolio", False)
+    return final_result
+
+async def fetch_fund_data_async(session, fund, client=None):
+    """Fetch and compute a single fund's data with rate limiting and caching"""
     cache_key = f"fund_{fund['code']}"
     
     # Check cache first
     if cache_key in api_cache:
         logger.info(f"Cache hit for {fund['name']}")
-        cached_result = api_cache[cache_key].copy()
-        cached_result["is_portfolio"] = fund.get("is_portfolio", False)
-        return cached_result
-    
-    url = f"https://api.mfapi.in/mf/{fund['code']}"
+        return _with_portfolio_flag(api_cache[cache_key], fund)
     
     try:
-        async with throttler:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as response:
-                if response.status != 200:
-                    logger.error(f"HTTP {response.status} for {fund['name']}")
-                    return None
-                
-                data = await response.json()
-                
-                if "data" not in data:
-                    logger.error(f"Invalid response format for {fund['name']}: 'data' key missing")
-                    return None
-                
-                nav_data = data["data"]
-                if not nav_data:
-                    logger.error(f"Empty NAV data for {fund['name']}")
-                    return None
-                    
-                try:
-                    current_nav = float(nav_data[0]["nav"])
-                    current_date = datetime.strptime(nav_data[0]["date"], "%d-%m-%Y")
-                except (ValueError, KeyError, IndexError) as e:
-                    logger.error(f"Error parsing current NAV data for {fund['name']}: {str(e)}")
-                    return None
-                
-                parsed_navs, parsed_dates = parse_nav_data(nav_data)
-                
-                # Calculate returns for different periods
-                returns = {}
-                dates = {}
-                periods = {
-                    "1day": 1,
-                    "1week": 7,
-                    "1month": 30,
-                    "3month": 90,
-                    "6month": 180,
-                    "1year": 365,
-                    "2year": 730,
-                    "3year": 1095,
-                    "5year": 1825
-                }
-                
-                for period, days in periods.items():
-                    target_date = current_date - timedelta(days=days)
-                    historical_nav, historical_date = find_closest_nav(parsed_navs, parsed_dates, target_date)
-
-                    if historical_nav is not None and historical_nav != 0:
-                        # Annualize multi-year periods (>= 2 years). Keep others as trailing returns.
-                        if period in {"2year", "3year", "5year"}:
-                            try:
-                                years = days / 365.0
-                                cagr = ((current_nav / historical_nav) ** (1 / years) - 1) * 100
-                                returns[period] = cagr
-                            except Exception:
-                                returns[period] = ((current_nav - historical_nav) / historical_nav) * 100
-                        else:
-                            returns[period] = ((current_nav - historical_nav) / historical_nav) * 100
-                        dates[period] = historical_date
-                    else:
-                        returns[period] = 0  # Use 0 instead of "NA" for better sorting
-                        dates[period] = "NA"
-                
-                # Calculate year-on-year breakdown
-                year_breakdown = {}
-                for period_years in [2, 3, 5]:
-                    period_key = f"{period_years}year"
-                    period_data = {"year_dates": {}}
-                    
-                    for i in range(period_years):
-                        year_num = i + 1
-                        end_date_target = current_date - timedelta(days=365 * i)
-                        start_date_target = current_date - timedelta(days=365 * (i + 1))
-                        
-                        end_nav, end_date_str = find_closest_nav(parsed_navs, parsed_dates, end_date_target)
-                        start_nav, start_date_str = find_closest_nav(parsed_navs, parsed_dates, start_date_target)
-                        
-                        if end_nav is not None and start_nav is not None and start_nav != 0:
-                            ret = ((end_nav - start_nav) / start_nav) * 100
-                            period_data[f"year{year_num}"] = ret
-                            period_data["year_dates"][f"year{year_num}_start"] = start_date_str
-                            period_data["year_dates"][f"year{year_num}_end"] = end_date_str
-                        else:
-                            period_data[f"year{year_num}"] = 0
-                            period_data["year_dates"][f"year{year_num}_start"] = "NA"
-                            period_data["year_dates"][f"year{year_num}_end"] = "NA"
-                    
-                    # Add total absolute return for the period
-                    target_date = current_date - timedelta(days=365 * period_years)
-                    historical_nav, _ = find_closest_nav(parsed_navs, parsed_dates, target_date)
-                    if historical_nav is not None and historical_nav != 0:
-                        period_data["total_absolute"] = ((current_nav - historical_nav) / historical_nav) * 100
-                    else:
-                        period_data["total_absolute"] = 0
-
-                    year_breakdown[period_key] = period_data
-
-                # Calculate Consistency Score: (0.2 * 1Y) + (0.3 * 2Y) + (0.5 * 3Y)
-                # Handle missing data by re-normalizing weights
-                r1y = returns.get("1year", 0) or 0
-                r2y = returns.get("2year", 0) or 0
-                r3y = returns.get("3year", 0) or 0
-                
-                # Check for validity (non-zero or actually present) to determine weights
-                # Simplified approach: Use available returns. If return is 0 (and likely not 0% exact), it might be missing.
-                # But fetch logic sets missing to 0. Let's assume valid data if we have it.
-                # Strictly following the request: 1, 2, 3 year data.
-                
-                score = (r1y * 0.2) + (r2y * 0.3) + (r3y * 0.5)
-
-                result = {
-                    "name": fund["name"],
-                    "code": fund["code"],
-                    "current_nav": current_nav,
-                    "current_date": nav_data[0]["date"],
-                    "returns": returns,
-                    "consistency_score": score,  # New Field
-                    "dates": dates,
-                    "year_breakdown": year_breakdown
-                }
-                
-                # Cache the result WITHOUT is_portfolio
-                api_cache[cache_key] = result
-                logger.info(f"Successfully fetched and cached data for {fund['name']}")
-                
-                # Inject is_portfolio for the current request
-                final_result = result.copy()
-                final_result["is_portfolio"] = fund.get("is_portfolio", False)
-                return final_result
-                
-    except asyncio.TimeoutError:
-        logger.error(f"Timeout while fetching data for {fund['name']}")
-        return None
+        history = await load_fund_history(session, fund, client or get_upstream_client())
+        if history is None:
+            return None
+
+        result = compute_fund_results([fund], [history])[0]
+
+        # Cache the result WITHOUT is_portfolio
+        api_cache[cache_key] = result
+        logger.info(f"Successfully fetched and cached data for {fund['name']}")
+        return _with_portfolio_flag(result, fund)
     except Exception as e:
         logger.error(f"Error processing {fund['name']}: {str(e)}")
         return None
 
-async def fetch_all_funds_async():
-    """Fetch all fund data concurrently with improved rate limiting"""
-    # Rate limit: 3 requests per second for better performance
-    throttler = Throttler(rate_limit=3, period=1)
-    
-    portfolio_funds = load_funds()
-    research_funds = load_research_funds()
+def get_all_funds():
+    """Return portfolio funds followed by research funds not in the portfolio, flagged with is_portfolio"""
+    return fund_registry.all_funds()
+
+async def _load_histories(session, funds, client):
+    tasks = [load_fund_history(session, fund, client) for fund in funds]
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+async def fetch_all_funds_async(funds=None, session=None):
+    """Fetch fund histories concurrently, then compute returns in one batch.
+
+    ``funds`` defaults to every portfolio and research fund. Pass a
+    long-lived ``session`` to reuse pooled connections; otherwise a
+    short-lived one is opened for this call.
+    """
+    # Shared adaptive rate limiter with retries (starts at API_RATE_LIMIT/API_RATE_PERIOD)
+    client = get_upstream_client()
     
-    # Mark portfolio funds
-    portfolio_codes = {f["code"] for f in portfolio_funds}
-    for f in portfolio_funds:
-        f["is_portfolio"] = True
-        
-    # Add research funds uniquely
-    all_funds = list(portfolio_funds)
-    for f in research_funds:
-        if f["code"] not in portfolio_codes:
-            f["is_portfolio"] = False
-            all_funds.append(f)
+    all_funds = get_all_funds() if funds is None else funds
+
+    results = [None] * len(all_funds)
+    pending = []
+    for i, fund in enumerate(all_funds):
+        cached = api_cache.get(f"fund_{fund['code']}")
+        if cached is not None:
+            logger.info(f"Cache hit for {fund['name']}")
+            results[i] = _with_portfolio_flag(cached, fund)
+        else:
+            pending.append(i)
     
-    async with aiohttp.ClientSession(
-        timeout=aiohttp.ClientTimeout(total=30),
-        connector=aiohttp.TCPConnector(limit=10, limit_per_host=5)
-    ) as session:
-        tasks = [
-            fetch_fund_data_async(session, fund, throttler) 
-            for fund in all_funds
-        ]
-        
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Filter out None results and exceptions
-        valid_results = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                logger.error(f"Exception for fund {all_funds[i]['name']}: {str(result)}")
-            elif result is not None:
-                valid_results.append(result)
-        
-        return valid_results
+    if pending:
+        if session is None:
+            async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=30),
+                connector=aiohttp.TCPConnector(limit=10, limit_per_host=5)
+            ) as own_session:
+                histories = await _load_histories(own_session, [all_funds[i] for i in pending], client)
+        else:
+            histories = await _load_histories(session, [all_funds[i] for i in pending], client)
+
+        ready = []
+        for i, history in zip(pending, histories):
+            if isinstance(history, Exception):
+                logger.error(f"Exception for fund {all_funds[i]['name']}: {str(history)}")
+            elif history is not None:
+                ready.append((i, history))
+
+        computed = compute_fund_results(
+            [all_funds[i] for i, _ in ready],
+            [history for _, history in ready]
+        )
+        for (i, _), result in zip(ready, computed):
+            # Cache the result WITHOUT is_portfolio
+            api_cache[f"fund_{result['code']}"] = result
+            results[i] = _with_portfolio_flag(result, all_funds[i])
+        logger.info(f"Computed returns for {len(computed)} funds in one batch")
+
+    return [result for result in results if result is not None]
+
+
+async def iter_funds_async(funds=None, session=None):
+    """Yield each fund's computed result as soon as its history is available.
+
+    Unlike ``fetch_all_funds_async`` the slowest scheme does not hold back the
+    others: results come out in completion order. Funds that fail are skipped.
+    """
+    client = get_upstream_client()
+    all_funds = get_all_funds() if funds is None else funds
+    if not all_funds:
+        return
+
+    async def consume(active_session):
+        tasks = [fetch_fund_data_async(active_session, fund, client) for fund in all_funds]
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            if result is not None:
+                yield result
+
+    if session is None:
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=30),
+            connector=aiohttp.TCPConnector(limit=10, limit_per_host=5)
+        ) as own_session:
+            async for result in consume(own_session):
+                yield result
+    else:
+        async for result in consume(session):
+            yield result
+
+
+async def refresh_changed_funds(funds, known_days, expected_day=None, session=None, client=None, store=None):
+    """Sync ``funds`` and recompute only those whose stored history moved.
+
+    ``known_days`` maps codes to the latest NAV day their current result was
+    computed from. Schemes already stored up to ``expected_day`` (e.g. by the
+    NAVAll ingest) are not synced again. Returns ``(results, summary)``: the
+    recomputed results and ``{"fetched", "recomputed", "unchanged", "failed"}``
+    code lists, where ``recomputed`` funds moved in the store without any new
+    upstream points.
+    """
+    client = client or get_upstream_client()
+    store = store or get_nav_store()
+
+    async def outcome(active_session, fund):
+        last_day = store.last_complete_day(fund['code'])
+        if expected_day is not None and last_day is not None and last_day >= expected_day:
+            return 0, store.load(fund['code'])
+        return await _sync_and_load(active_session, fund, client, store)
+
+    async def gather(active_session):
+        return await asyncio.gather(*(outcome(active_session, f) for f in funds), return_exceptions=True)
+
+    if session is None:
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=30),
+            connector=aiohttp.TCPConnector(limit=10, limit_per_host=5)
+        ) as own_session:
+            outcomes = await gather(own_session)
+    else:
+        outcomes = await gather(session)
+
+    summary = {"fetched": [], "recomputed": [], "unchanged": [], "failed": []}
+    changed, from_upstream = [], set()
+    for fund, result in zip(funds, outcomes):
+        if isinstance(result, Exception):
+            logger.error(f"Exception for fund {fund['name']}: {str(result)}")
+            summary["failed"].append(fund['code'])
+            continue
+        new_points, series = result
+        if series is None or new_points is None:
+            summary["failed"].append(fund['code'])
+        elif new_points or series.latest_day != known_days.get(fund['code']):
+            changed.append((fund, series))
+            if new_points:
+                from_upstream.add(fund['code'])
+        else:
+            summary["unchanged"].append(fund['code'])
+
+    results = compute_fund_results([f for f, _ in changed], [series for _, series in changed]) if changed else []
+    for result in results:
+        api_cache[f"fund_{result['code']}"] = result
+        summary["fetched" if result['code'] in from_upstream else "recomputed"].append(result['code'])
+    return results, summary
 
 
-async def fetch_funds_data():
+async def fetch_funds_data(funds=None, session=None):
     """Main async function to fetch all funds data with improved performance"""
-    return await fetch_all_funds_async()
+    return await fetch_all_funds_async(funds, session=session)
 
 
 def main():
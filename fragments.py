@@ -0,0 +1,70 @@
+"""Rendered HTML fragments of the dashboard, cached per data version.
+
+The data-heavy partials (portfolio table, comparison matrix, research tab,
+manage-funds list) only change when a new dataset version is published, yet
+rendering them loops over every fund several times. ``FragmentCache`` keeps
+the rendered HTML of each partial for the current version, so a page view
+with unchanged data only assembles cached strings around the navbar.
+"""
+import logging
+import threading
+import time
+
+from markupsafe import Markup
+
+logger = logging.getLogger(__name__)
+
+# Context name -> template, in the order they appear on the page
+DASHBOARD_FRAGMENTS = {
+    "portfolio_table": "partials/_portfolio_table.html",
+    "comparison_matrix": "partials/_comparison_matrix.html",
+    "research_tab": "partials/_research_tab.html",
+    "manage_funds_modal": "partials/_manage_funds_modal.html",
+}
+
+
+class FragmentCache:
+    def __init__(self, jinja_env, partials=DASHBOARD_FRAGMENTS):
+        self.env = jinja_env
+        self.partials = partials
+        self._version = None
+        self._fragments = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.renders = 0
+
+    def render(self, context):
+        """Render every partial with ``context`` and log the time each one took"""
+        fragments = {}
+        for name, template_name in self.partials.items():
+            started = time.perf_counter()
+            fragments[name] = Markup(self.env.get_template(template_name).render(**context))
+            logger.info(f"Rendered {template_name} in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return fragments
+
+    def get(self, version, build_context):
+        """Return ``{name: Markup}`` for a data version.
+
+        ``build_context`` is only called on a miss, so the per-fund template
+        data is not rebuilt either when nothing changed. A ``None`` version
+        (no published dataset) is rendered but never cached.
+        """
+        if version is not None and self._version == version:
+            self.hits += 1
+            return self._fragments
+        with self._lock:
+            if version is not None and self._version == version:
+                self.hits += 1
+                return self._fragments
+            fragments = self.render(build_context())
+            self.renders += 1
+            if version is not None:
+                self._version, self._fragments = version, fragments
+            return fragments
+
+    def clear(self):
+        with self._lock:
+            self._version, self._fragments = None, None
+
+    def stats(self):
+        return {"version": self._version, "hits": self.hits, "renders": self.renders}
@@ -0,0 +1,107 @@
+"""Per-fund result cache with a versioned aggregate index.
+
+Each fund's computed result lives under its own key (``mf:v1:fund:<code>``) so
+adding, removing or refreshing one scheme only touches that entry. A small
+index (``mf:v1:index``) records which funds make up the dashboard, in order,
+with their portfolio flag, the ``fetched_at`` stamp of each entry and a
+version number. Workers compare index versions to decide whether their
+assembled dataset is current, and the per-fund stamps tell them when an
+entry promoted into their L1 tier has since been replaced by another worker.
+
+Both live in a TwoTierCache, so Redis stays optional: without it the L1 tier
+is the only tier and holds everything for the full TTL.
+"""
+import time
+
+from cache import TwoTierCache, make_key
+
+# With Redis available, how long a worker may serve its L1 copy of the index
+# before checking Redis for a version published by another worker
+INDEX_L1_TTL = 5
+
+
+class FundCache:
+    INDEX_KEY = make_key("index")
+    VERSION_KEY = make_key("index", "version")
+
+    def __init__(self, redis_client=None, ttl=86400, l1_maxsize=1000):
+        self.ttl = ttl
+        self.entries = TwoTierCache(redis_client, l1_maxsize=l1_maxsize, l1_ttl=ttl, l2_ttl=ttl)
+        self.index = TwoTierCache(redis_client, l1_maxsize=2,
+                                  l1_ttl=INDEX_L1_TTL if redis_client else ttl, l2_ttl=ttl)
+
+    def _fund_key(self, code):
+        return make_key("fund", code)
+
+    def get_many(self, codes, stamps=None):
+        """Return ``{code: {"result", "fetched_at"}}`` for the codes that are cached.
+
+        ``stamps`` maps codes to the ``fetched_at`` the caller expects; L1 copies
+        with a different stamp are re-read from Redis.
+        """
+        keys = {self._fund_key(code): code for code in codes}
+        entries = {keys[key]: entry for key, entry in self.entries.get_many(keys).items()}
+        if stamps:
+            outdated = [
+                self._fund_key(code) for code, entry in entries.items()
+                if code in stamps and entry["fetched_at"] != stamps[code]
+            ]
+            if outdated:
+                for key, entry in self.entries.get_many(outdated, use_l1=False).items():
+                    entries[keys[key]] = entry
+        return entries
+
+    def get(self, code):
+        return self.get_many([code]).get(code)
+
+    def put_many(self, results):
+        """Store computed fund results (without is_portfolio) stamped with the current time"""
+        now = time.time()
+        items = {}
+        for result in results:
+            result = {k: v for k, v in result.items() if k != "is_portfolio"}
+            items[self._fund_key(result["code"])] = {"result": result, "fetched_at": now}
+        self.entries.set_many(items)
+
+    def delete(self, code):
+        self.entries.delete(self._fund_key(code))
+
+    def get_index(self, use_l1=True):
+        """Return the published index, or None when nothing has been published yet.
+
+        ``use_l1=False`` reads Redis directly, for callers that know another
+        worker just published.
+        """
+        if not use_l1 and self.index.redis is None:
+            use_l1 = True
+        return self.index.get(self.INDEX_KEY, use_l1=use_l1)
+
+    def publish_index(self, funds):
+        """Publish the ordered fund list under a new version number and return the index.
+
+        The index's ``fetched_at`` is that of its oldest entry, so a dataset
+        whose refresh partly failed still reports its real age.
+        """
+        entries = self.get_many(f["code"] for f in funds)
+        stamps = [entry["fetched_at"] for entry in entries.values()]
+        index = {
+            "funds": [
+                {
+                    "code": f["code"],
+                    "is_portfolio": f.get("is_portfolio", False),
+                    "fetched_at": entries[f["code"]]["fetched_at"] if f["code"] in entries else None
+                }
+                for f in funds
+            ],
+            "fetched_at": min(stamps) if stamps else time.time(),
+            "version": self.index.incr(self.VERSION_KEY)
+        }
+        self.index.set(self.INDEX_KEY, index)
+        return index
+
+    def clear_index(self):
+        """Forget the index (fund entries are kept) so the next read rebuilds it"""
+        self.index.delete(self.INDEX_KEY)
+
+    def stats(self):
+        return {"entries": self.entries.stats(), "index": self.index.stats()}
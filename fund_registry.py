@@ -0,0 +1,220 @@
+"""Registry of the portfolio (``funds.json``) and research (``research_funds.json``) funds.
+
+The parsed lists are kept in memory and revalidated with a ``stat`` of both
+files, so a refresh no longer re-parses JSON and an edit made by another
+worker (or by hand) is picked up on the next call. Readers always get fresh
+copies of the fund dicts, never the registry's own.
+
+Writes re-read ``funds.json`` under an exclusive file lock and replace it
+atomically (temp file + ``os.replace``), so concurrent workers cannot lose
+each other's additions or removals.
+
+Every detected change bumps ``version`` and records the codes it touched;
+``changes_since(version)`` tells a cache exactly which schemes to invalidate.
+"""
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Changes remembered for changes_since; older versions get None (invalidate everything)
+CHANGE_HISTORY = 64
+
+_State = namedtuple("_State", ["portfolio", "research", "all_funds", "by_code"])
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive inter-process lock held on ``path`` (created if missing)"""
+    with open(path, "a+") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _file_mode(path):
+    """Permission bits of ``path``, or the umask default for a new file"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def atomic_write_json(path, data):
+    """Write JSON to a temp file in the same directory and rename it over ``path``"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file 0600; keep the mode readers of the original file rely on
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class FundRegistry:
+    """Portfolio and research fund lists with a change version"""
+
+    def __init__(self, funds_file, research_file, default_funds=()):
+        self.funds_file = funds_file
+        self.research_file = research_file
+        self.default_funds = [dict(f) for f in default_funds]
+        self.version = 0
+        self._changes = deque(maxlen=CHANGE_HISTORY)
+        self._signature = None
+        self._state = None
+        self._lock = threading.RLock()
+
+    def _read(self, path, label):
+        with open(path, "r", encoding="utf-8") as f:
+            funds = json.load(f)
+        if not isinstance(funds, list):
+            raise ValueError(f"{label} file must hold a list of funds")
+        return [{**f, "code": str(f["code"])} for f in funds]
+
+    def _load(self):
+        """Re-read both files and record which codes changed since the last load"""
+        if not os.path.exists(self.funds_file):
+            try:
+                with file_lock(self.funds_file + ".lock"):
+                    if not os.path.exists(self.funds_file):
+                        atomic_write_json(self.funds_file, self.default_funds)
+            except OSError as e:
+                logger.error(f"Error saving default funds: {e}")
+        signature = (_stat(self.funds_file), _stat(self.research_file))
+
+        try:
+            portfolio = self._read(self.funds_file, "Portfolio")
+        except Exception as e:
+            logger.error(f"Error loading funds: {e}")
+            portfolio = [dict(f) for f in self.default_funds]
+        research = []
+        if os.path.exists(self.research_file):
+            try:
+                research = self._read(self.research_file, "Research")
+            except Exception as e:
+                logger.error(f"Error loading research funds: {e}")
+
+        portfolio_codes = {f["code"] for f in portfolio}
+        all_funds = [dict(f, is_portfolio=True) for f in portfolio]
+        all_funds += [dict(f, is_portfolio=False) for f in research if f["code"] not in portfolio_codes]
+        by_code = {f["code"]: f for f in all_funds}
+
+        if self._state is not None:
+            before = self._state.by_code
+            changed = {code for code in before.keys() | by_code.keys() if before.get(code) != by_code.get(code)}
+            if changed:
+                self.version += 1
+                self._changes.append((self.version, frozenset(changed)))
+                logger.info(f"Fund registry version {self.version}: {len(changed)} funds changed")
+        self._state = _State(portfolio, research, all_funds, by_code)
+        self._signature = signature
+
+    def check(self):
+        """Reload when either file changed on disk; returns the current version"""
+        signature = (_stat(self.funds_file), _stat(self.research_file))
+        if self._state is None or signature != self._signature:
+            with self._lock:
+                if self._state is None or (_stat(self.funds_file), _stat(self.research_file)) != self._signature:
+                    self._load()
+        return self.version
+
+    def _current(self):
+        self.check()
+        return self._state
+
+    def portfolio(self):
+        return [dict(f) for f in self._current().portfolio]
+
+    def research(self):
+        return [dict(f) for f in self._current().research]
+
+    def all_funds(self):
+        """Portfolio funds followed by research funds not in the portfolio, flagged with is_portfolio"""
+        return [dict(f) for f in self._current().all_funds]
+
+    def get(self, code):
+        fund = self._current().by_code.get(str(code))
+        return dict(fund) if fund else None
+
+    def changes_since(self, version):
+        """Codes added, removed or edited after ``version``; None when that is too far back to tell"""
+        if version == self.version:
+            return set()
+        if version > self.version or not self._changes or self._changes[0][0] > version + 1:
+            return None
+        codes = set()
+        for change_version, changed in self._changes:
+            if change_version > version:
+                codes |= changed
+        return codes
+
+    def _update(self, change):
+        """Apply ``change(funds) -> new funds or None`` to funds.json under the file lock"""
+        with self._lock, file_lock(self.funds_file + ".lock"):
+            try:
+                funds = self._read(self.funds_file, "Portfolio") if os.path.exists(self.funds_file) \
+                    else [dict(f) for f in self.default_funds]
+            except Exception as e:
+                logger.error(f"Error loading funds: {e}")
+                return False
+            updated = change(funds)
+            if updated is None:
+                return False
+            try:
+                atomic_write_json(self.funds_file, updated)
+            except OSError as e:
+                logger.error(f"Error saving funds: {e}")
+                return False
+            self._load()
+        return True
+
+    def add(self, name, code):
+        """Add a portfolio fund; False when it is already there or the write failed"""
+        code = str(code)
+        return self._update(lambda funds: None if any(f["code"] == code for f in funds)
+                            else funds + [{"name": name, "code": code}])
+
+    def remove(self, code):
+        """Remove a portfolio fund; False when it was not there or the write failed"""
+        code = str(code)
+        return self._update(lambda funds: [f for f in funds if f["code"] != code]
+                            if any(f["code"] == code for f in funds) else None)
@@ -0,0 +1,191 @@
+"""Scheduled jobs that run in exactly one worker.
+
+Every gunicorn worker starts the same APScheduler, but a job only runs in the
+worker holding the leader lease: a Redis key taken with ``SET NX PX`` and
+renewed by the holder well within its TTL. When the leader dies its lease
+expires and the next worker to try becomes leader; without Redis every
+process is its own leader (single-worker deployments).
+
+Jobs are coalesced (a backlog of missed runs fires once) and may fire up to
+``misfire_grace_time`` late. A worker that becomes leader also catches up on
+a scheduled run missed while no leader was up (e.g. a deploy across 11:00).
+Each run's start, duration, outcome and summary (a dict the job returns) is
+recorded, in Redis when available so that every worker reports the leader's
+timings.
+"""
+import json
+import logging
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from cache import make_key
+from singleflight import _RELEASE_SCRIPT, _RENEW_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """Cluster-wide leadership held through a renewable Redis lease"""
+
+    def __init__(self, redis_client=None, name="scheduler", ttl=30):
+        self.redis = redis_client
+        self.key = make_key("lease", "leader", name)
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.is_leader = False
+        self._renewed_at = float('-inf')
+
+    def try_acquire(self):
+        """Take the lease, or renew it when already held; returns whether this process leads"""
+        if not self.redis:
+            self.is_leader = True
+            return True
+        now = time.monotonic()
+        try:
+            if self.is_leader:
+                held = bool(self.redis.eval(_RENEW_SCRIPT, 1, self.key, self.token, int(self.ttl * 1000)))
+            else:
+                held = bool(self.redis.set(self.key, self.token, nx=True, px=int(self.ttl * 1000)))
+        except Exception as e:
+            # Keep leading until the lease could have expired for the other workers
+            held = self.is_leader and now - self._renewed_at < self.ttl
+            logger.warning(f"Leader lease check failed: {e}")
+        else:
+            if held:
+                self._renewed_at = now
+        if held != self.is_leader:
+            logger.info(f"Scheduler leadership {'acquired' if held else 'lost'}")
+        self.is_leader = held
+        return held
+
+    def release(self):
+        if self.redis and self.is_leader:
+            try:
+                self.redis.eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+            except Exception as e:
+                logger.warning(f"Leader lease release failed: {e}")
+        self.is_leader = False
+
+
+class JobScheduler:
+    """APScheduler jobs gated on a ``LeaderLease``, with per-job run timings"""
+
+    def __init__(self, lease, timezone, redis_client=None, misfire_grace_time=3600):
+        self.lease = lease
+        self.timezone = timezone
+        self.redis = redis_client
+        self.misfire_grace_time = misfire_grace_time
+        self.scheduler = BackgroundScheduler(timezone=timezone, job_defaults={
+            "coalesce": True, "max_instances": 1, "misfire_grace_time": misfire_grace_time})
+        self._jobs = {}
+        self._runs = {}
+        self._skipped = {}
+        self._lock = threading.Lock()
+        self._runs_key = make_key("scheduler", "runs")
+
+    def add_job(self, name, fn, trigger, catch_up=True, **trigger_args):
+        """Schedule ``fn`` under ``name``; ``catch_up`` runs a missed fire when leadership is taken"""
+        job = self.scheduler.add_job(self._run, trigger, args=[name], id=name, name=name,
+                                     replace_existing=True, **trigger_args)
+        self._jobs[name] = (fn, job.trigger if catch_up else None)
+
+    def run_once(self, name, fn, delay=0):
+        """Run ``fn`` once on the scheduler's threads, after ``delay`` seconds (e.g. a startup warm-up)"""
+        self._jobs[name] = (fn, None)
+        self.scheduler.add_job(self._run, "date", args=[name], id=name, name=name, replace_existing=True,
+                               run_date=datetime.now(self.timezone) + timedelta(seconds=delay))
+
+    def start(self):
+        """Elect, start the jobs and keep renewing the lease in the background"""
+        self._check_leadership()
+        self.scheduler.add_job(self._check_leadership, "interval", seconds=max(self.lease.ttl / 3, 1),
+                               id="leader-lease", name="leader-lease", replace_existing=True)
+        self.scheduler.start()
+
+    def shutdown(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        self.lease.release()
+
+    def _check_leadership(self):
+        was_leader = self.lease.is_leader
+        if self.lease.try_acquire() and not was_leader:
+            self._catch_up()
+
+    def _catch_up(self):
+        """Run jobs whose latest fire time within the grace period has no completed run"""
+        now = datetime.now(self.timezone)
+        runs = self._load_runs()
+        for name, (fn, trigger) in self._jobs.items():
+            if trigger is None:
+                continue
+            due = trigger.get_next_fire_time(None, now - timedelta(seconds=self.misfire_grace_time))
+            last = runs.get(name, {}).get("started_at", 0)
+            if due is not None and due <= now and last < due.timestamp():
+                logger.info(f"Catching up on missed {name} run due at {due.isoformat()}")
+                self.scheduler.add_job(self._run, "date", args=[name], id=f"{name}-catch-up",
+                                       name=f"{name}-catch-up", replace_existing=True, run_date=now)
+
+    def _run(self, name):
+        if not self.lease.is_leader:
+            with self._lock:
+                self._skipped[name] = self._skipped.get(name, 0) + 1
+            return
+        fn = self._jobs[name][0]
+        previous = self._load_runs().get(name, {})
+        record = {"started_at": time.time(), "runs": previous.get("runs", 0) + 1,
+                  "failures": previous.get("failures", 0)}
+        started = time.perf_counter()
+        try:
+            summary = fn()
+            record["status"] = "ok"
+            if isinstance(summary, dict):
+                record["summary"] = summary
+        except Exception as e:
+            logger.error(f"Scheduled job {name} failed: {e}")
+            logger.error(traceback.format_exc())
+            record.update(status="failed", error=str(e), failures=record["failures"] + 1)
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Scheduled job {name} {record['status']} in {record['duration_ms']:.0f}ms")
+        self._save_run(name, record)
+
+    def _load_runs(self):
+        with self._lock:
+            runs = dict(self._runs)
+        if self.redis:
+            try:
+                stored = self.redis.hgetall(self._runs_key)
+                runs.update({(k.decode() if isinstance(k, bytes) else k): json.loads(v) for k, v in stored.items()})
+            except Exception as e:
+                logger.warning(f"Could not read scheduler runs from Redis: {e}")
+        return runs
+
+    def _save_run(self, name, record):
+        with self._lock:
+            self._runs[name] = record
+        if self.redis:
+            try:
+                self.redis.hset(self._runs_key, name, json.dumps(record))
+            except Exception as e:
+                logger.warning(f"Could not store scheduler run in Redis: {e}")
+
+    def stats(self):
+        """Leadership plus, per job, the next fire time and the latest run (from whichever worker ran it)"""
+        runs = self._load_runs()
+        jobs = {}
+        for name in self._jobs:
+            # Jobs of a scheduler that has not started have no next_run_time yet
+            next_run = getattr(self.scheduler.get_job(name), "next_run_time", None)
+            run = runs.get(name)
+            jobs[name] = {
+                "next_run": next_run.isoformat() if next_run else None,
+                "last_run": dict(run, started_at=datetime.fromtimestamp(run["started_at"], self.timezone).isoformat())
+                if run else None,
+                "skipped_here": self._skipped.get(name, 0),
+            }
+        return {"leader": self.lease.is_leader, "running": self.scheduler.running, "jobs": jobs}
@@ -0,0 +1,239 @@
+"""In-process metrics served in the Prometheus text format (``/metrics``).
+
+A minimal registry of counters and histograms, plus gauges read from
+callbacks at scrape time (cache hit ratios come straight from the caches'
+own counters). Updates take one lock and cost well under a microsecond, so
+the hot path can be timed unconditionally.
+
+Metrics are per process: with several gunicorn workers each scrape sees the
+worker that served it, so every sample carries a ``pid`` label and Prometheus
+``sum``/``rate`` across the series gives the whole deployment.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from sub-millisecond parses to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Bytes, from a /latest response to a full NAV history or the dashboard payload
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self, base_labels):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name + "_total", base_labels + list(zip(self.labelnames, key)), value)
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the ``with`` block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self, base_labels):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        samples = []
+        for key, (counts, total, count) in sorted(series.items()):
+            labels = base_labels + list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket", labels + [("le", _format_value(bound))], cumulative))
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, count))
+        return samples
+
+
+class _Callback:
+    def __init__(self, name, documentation, callback, kind):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.kind = kind
+
+    header = _Metric.header
+
+    def samples(self, base_labels):
+        """``callback()`` returns a number or ``{tuple of (label, value) pairs: number}``"""
+        value = self.callback()
+        if not isinstance(value, dict):
+            value = {(): value}
+        name = self.name + "_total" if self.kind == "counter" else self.name
+        return [(name, base_labels + list(labels), v) for labels, v in sorted(value.items()) if v is not None]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric {metric.name} already registered as a {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, callback, kind="gauge"):
+        """A gauge (or counter) read from ``callback`` at scrape time"""
+        with self._lock:
+            self._metrics[name] = _Callback(name, documentation, callback, kind)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        base_labels = [("pid", os.getpid())]
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            samples = metric.samples(base_labels)
+            if not samples:
+                continue
+            lines.extend(metric.header())
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "mf_upstream_request_seconds", "Time to response headers of upstream requests", ["endpoint", "status"])
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "mf_upstream_errors", "Upstream requests that failed without a response (timeouts, connection errors)",
+    ["endpoint", "error"])
+UPSTREAM_THROTTLE_WAIT = REGISTRY.histogram(
+    "mf_upstream_throttle_wait_seconds", "Time spent waiting for the per-host rate limiter and concurrency cap")
+UPSTREAM_RESPONSE_BYTES = REGISTRY.histogram(
+    "mf_upstream_response_bytes", "Body size of successful upstream responses", ["endpoint"], buckets=SIZE_BUCKETS)
+JSON_DECODE = REGISTRY.histogram("mf_json_decode_seconds", "Decoding upstream JSON bodies", ["endpoint"])
+NAV_PARSE = REGISTRY.histogram("mf_nav_parse_seconds", "Parsing mfapi NAV rows into a NavSeries")
+COMPUTE = REGISTRY.histogram("mf_compute_seconds", "Batch computation of derived metrics", ["stage"])
+REFRESH = REGISTRY.histogram("mf_refresh_seconds", "Dataset refreshes, end to end", ["kind", "outcome"])
+REFRESH_FUNDS = REGISTRY.counter("mf_refresh_funds", "Funds handled by scheduled refreshes, by outcome", ["result"])
+PAYLOAD_BYTES = REGISTRY.histogram(
+    "mf_payload_bytes", "Serialized response payloads", ["endpoint", "encoding"], buckets=SIZE_BUCKETS)
+
+
+_caches = {}
+
+
+def register_cache(name, stats):
+    """Expose a TwoTierCache's ``stats()`` counters as lookups and L1/L2 hit ratios under ``cache=name``"""
+    _caches[name] = stats
+
+
+def _cache_lookups():
+    samples = {}
+    for name, stats in list(_caches.items()):
+        s = stats()
+        for result, key in (("l1_hit", "l1_hits"), ("l2_hit", "l2_hits"), ("miss", "misses")):
+            samples[(("cache", name), ("result", result))] = s[key]
+    return samples
+
+
+def _cache_hit_ratios():
+    samples = {}
+    for name, stats in list(_caches.items()):
+        s = stats()
+        total = s["l1_hits"] + s["l2_hits"] + s["misses"]
+        # L2 only sees the lookups that missed L1
+        below_l1 = s["l2_hits"] + s["misses"]
+        samples[(("cache", name), ("tier", "l1"))] = s["l1_hits"] / total if total else None
+        samples[(("cache", name), ("tier", "l2"))] = s["l2_hits"] / below_l1 if below_l1 else None
+    return samples
+
+
+REGISTRY.callback("mf_cache_lookups", "Cache lookups by outcome", _cache_lookups, kind="counter")
+REGISTRY.callback("mf_cache_hit_ratio", "Cache hit ratio per tier (L2 over the lookups that missed L1)",
+                  _cache_hit_ratios)
@@ -0,0 +1,253 @@
+"""Local stand-in for api.mfapi.in, for tests and benchmarks that must not touch the network.
+
+Serves the routes the app uses, in mfapi's response format:
+
+* ``/mf`` - scheme list, ``/mf/search?q=`` - scheme search
+* ``/mf/{code}`` - full NAV history (newest first), ``/mf/{code}/latest``
+* ``/NAVAll.txt`` - AMFI-format latest NAV of every listed scheme
+
+Responses come from recorded fixtures (``<fixtures>/<code>.json`` and
+``<fixtures>/search/<query>.json``) when present; any other scheme code gets
+a deterministic synthetic history of the configured length, so universes of
+any size can be simulated. Latency, 5xx error rate and 429 rate are
+controllable, and ``/_stats`` reports what was served.
+
+Point the app at it with ``MF_API_BASE_URL=http://127.0.0.1:8765/mf`` and
+``AMFI_NAVALL_URL=http://127.0.0.1:8765/NAVAll.txt``.
+
+Usage:
+    python mock_mfapi.py serve --port 8765 --funds 1000 --years 15 --latency 0.02 0.2 --throttle-rate 0.05
+    python mock_mfapi.py record 120828 127042 --search "small cap"   # refresh fixtures from the real API
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from collections import Counter
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'fixtures', 'mfapi')
+
+# Synthetic schemes listed by /mf are numbered from here (clear of real AMFI codes)
+SYNTHETIC_CODE_BASE = 900000
+
+
+@lru_cache(maxsize=4)
+def _weekday_calendar(end_day, years):
+    """Weekday ordinals and their dd-mm-YYYY strings, newest first, for ``years`` before ``end_day``"""
+    days = [d for d in range(end_day, end_day - 365 * years, -1) if date.fromordinal(d).weekday() < 5]
+    return days, [date.fromordinal(d).strftime("%d-%m-%Y") for d in days]
+
+
+def synthetic_funds(count):
+    """Fund dicts (``name``/``code``) for the synthetic schemes the stand-in lists"""
+    return [{"name": f"Synthetic Fund {i}", "code": str(SYNTHETIC_CODE_BASE + i)} for i in range(1, count + 1)]
+
+
+def _synthetic_walk(code, length):
+    """Geometric random walk with a per-scheme drift and volatility, oldest first"""
+    seed = int(hashlib.sha1(str(code).encode()).hexdigest()[:8], 16)
+    rng = np.random.default_rng(seed)
+    drift = rng.uniform(0.0001, 0.0008)
+    vol = rng.uniform(0.005, 0.015)
+    return 10 * np.cumprod(np.exp(rng.normal(drift, vol, length)))
+
+
+def synthetic_history(code, years=15, end_day=None):
+    """Deterministic mfapi ``/mf/{code}`` document with ``years`` of weekday NAVs"""
+    end_day = end_day or date.today().toordinal()
+    days, labels = _weekday_calendar(end_day, years)
+    navs = _synthetic_walk(code, len(days))[::-1]
+    return {
+        "meta": {
+            "fund_house": "Synthetic AMC",
+            "scheme_type": "Open Ended Schemes",
+            "scheme_category": "Equity Scheme - Synthetic",
+            "scheme_code": int(code) if str(code).isdigit() else code,
+            "scheme_name": f"Synthetic Fund {code}",
+        },
+        "data": [{"date": label, "nav": f"{nav:.5f}"} for label, nav in zip(labels, navs.tolist())],
+        "status": "SUCCESS"
+    }
+
+
+def synthetic_latest(code, years=15, end_day=None):
+    """``(day, nav)`` of the newest point of ``synthetic_history`` without building the document"""
+    end_day = end_day or date.today().toordinal()
+    days, _ = _weekday_calendar(end_day, years)
+    return days[0], float(f"{_synthetic_walk(code, len(days))[-1]:.5f}")
+
+
+class MockMfApi:
+    def __init__(self, fixtures_dir=FIXTURES_DIR, fund_count=100, history_years=15,
+                 latency=(0.0, 0.0), error_rate=0.0, throttle_rate=0.0, retry_after=1, seed=None):
+        self.fixtures_dir = fixtures_dir
+        self.fund_count = fund_count
+        self.history_years = history_years
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.stats = Counter()
+        self._bodies = {}
+        self._navall = None
+
+    def _fixture(self, *parts):
+        path = os.path.join(self.fixtures_dir, *parts)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def history(self, code):
+        """The ``/mf/{code}`` document: recorded fixture, else synthetic"""
+        doc = self._bodies.get(code)
+        if doc is None:
+            doc = self._fixture(f"{code}.json") or synthetic_history(code, self.history_years)
+            if len(self._bodies) < 256:
+                self._bodies[code] = doc
+        return doc
+
+    def schemes(self):
+        listed = [{"schemeCode": int(f["code"]), "schemeName": f["name"]} for f in synthetic_funds(self.fund_count)]
+        if os.path.isdir(self.fixtures_dir):
+            for name in sorted(os.listdir(self.fixtures_dir)):
+                if name.endswith(".json"):
+                    meta = self.history(name[:-5]).get("meta", {})
+                    listed.append({"schemeCode": meta.get("scheme_code"), "schemeName": meta.get("scheme_name")})
+        return listed
+
+    def navall(self):
+        """AMFI ``NAVAll.txt`` body with the latest NAV of every listed scheme (built once per day)"""
+        today = date.today().toordinal()
+        if self._navall and self._navall[0] == today:
+            return self._navall[1]
+        lines = ["Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;Date",
+                 "", "Open Ended Schemes(Equity Scheme - Synthetic)", "", "Synthetic AMC", ""]
+        for scheme in self.schemes():
+            code = scheme["schemeCode"]
+            if code >= SYNTHETIC_CODE_BASE:
+                day, nav = synthetic_latest(code, self.history_years, today)
+            else:
+                latest = self.history(str(code))["data"][0]
+                day, nav = datetime.strptime(latest["date"], "%d-%m-%Y").toordinal(), float(latest["nav"])
+            lines.append(f"{code};-;-;{scheme['schemeName']};{nav:.5f};"
+                         f"{date.fromordinal(day).strftime('%d-%b-%Y')}")
+        self._navall = (today, "\n".join(lines) + "\n")
+        return self._navall[1]
+
+    @web.middleware
+    async def faults(self, request, handler):
+        """Inject latency, 429s and 5xx errors in front of every mfapi route"""
+        if request.path.startswith("/_"):
+            return await handler(request)
+        low, high = self.latency
+        if high > 0:
+            await asyncio.sleep(self.random.uniform(low, high))
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            self.stats["429"] += 1
+            return web.json_response({"error": "Too Many Requests"}, status=429,
+                                     headers={"Retry-After": str(self.retry_after)})
+        if roll < self.throttle_rate + self.error_rate:
+            status = self.random.choice((500, 502, 503))
+            self.stats[str(status)] += 1
+            return web.json_response({"error": "upstream error"}, status=status)
+        response = await handler(request)
+        self.stats[str(response.status)] += 1
+        return response
+
+    async def list_schemes(self, request):
+        return web.json_response(self.schemes())
+
+    async def search(self, request):
+        query = request.query.get("q", "").strip().lower()
+        recorded = self._fixture("search", f"{query}.json")
+        if recorded is not None:
+            return web.json_response(recorded)
+        return web.json_response([s for s in self.schemes() if query and query in s["schemeName"].lower()])
+
+    async def scheme(self, request):
+        return web.json_response(self.history(request.match_info["code"]))
+
+    async def latest(self, request):
+        doc = self.history(request.match_info["code"])
+        return web.json_response(dict(doc, data=doc["data"][:1]))
+
+    async def navall_view(self, request):
+        return web.Response(text=self.navall(), content_type="text/plain")
+
+    async def stats_view(self, request):
+        return web.json_response(dict(self.stats))
+
+    def make_app(self):
+        app = web.Application(middlewares=[self.faults])
+        app.router.add_get("/mf", self.list_schemes)
+        app.router.add_get("/mf/search", self.search)
+        app.router.add_get("/mf/{code}", self.scheme)
+        app.router.add_get("/mf/{code}/latest", self.latest)
+        app.router.add_get("/NAVAll.txt", self.navall_view)
+        app.router.add_get("/_stats", self.stats_view)
+        return app
+
+
+def record(codes, queries, fixtures_dir=FIXTURES_DIR, base_url="https://api.mfapi.in/mf"):
+    """Save real mfapi responses as fixtures"""
+    import requests
+
+    os.makedirs(os.path.join(fixtures_dir, "search"), exist_ok=True)
+    for code in codes:
+        response = requests.get(f"{base_url}/{code}", timeout=30)
+        response.raise_for_status()
+        with open(os.path.join(fixtures_dir, f"{code}.json"), 'w', encoding='utf-8') as f:
+            json.dump(response.json(), f)
+        print(f"Recorded {code}")
+    for query in queries:
+        response = requests.get(f"{base_url}/search", params={"q": query}, timeout=30)
+        response.raise_for_status()
+        with open(os.path.join(fixtures_dir, "search", f"{query.strip().lower()}.json"), 'w', encoding='utf-8') as f:
+            json.dump(response.json(), f)
+        print(f"Recorded search '{query}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mfapi stand-in")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the stand-in server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--fixtures", default=FIXTURES_DIR)
+    serve.add_argument("--funds", type=int, default=100, help="synthetic schemes listed by /mf")
+    serve.add_argument("--years", type=int, default=15, help="synthetic history length")
+    serve.add_argument("--latency", type=float, nargs=2, default=(0.0, 0.0), metavar=("MIN", "MAX"))
+    serve.add_argument("--error-rate", type=float, default=0.0)
+    serve.add_argument("--throttle-rate", type=float, default=0.0)
+    serve.add_argument("--retry-after", type=int, default=1)
+    serve.add_argument("--seed", type=int, default=None)
+
+    rec = commands.add_parser("record", help="save real mfapi responses as fixtures")
+    rec.add_argument("codes", nargs="*")
+    rec.add_argument("--search", action="append", default=[])
+    rec.add_argument("--fixtures", default=FIXTURES_DIR)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.codes, args.search, args.fixtures)
+        return
+
+    mock = MockMfApi(args.fixtures, args.funds, args.years, tuple(args.latency),
+                     args.error_rate, args.throttle_rate, args.retry_after, args.seed)
+    print(f"Serving mfapi stand-in on http://{args.host}:{args.port}/mf")
+    web.run_app(mock.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
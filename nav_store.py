@@ -0,0 +1,439 @@
+"""Persistent on-disk NAV history store.
+
+Every NAV point already downloaded from mfapi is kept in a SQLite database
+under ``DATA_DIR`` so a refresh only has to merge the days published since a
+scheme's last stored date instead of re-downloading its whole history.
+
+In memory a history is a ``NavSeries``: int32 day ordinals and float64 NAVs
+in two NumPy arrays. mfapi rows are parsed into it in bulk (no per-row
+``strptime``), and ``dd-mm-YYYY`` strings are only produced again when
+results are formatted for output.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+
+import numpy as np
+
+from metrics import NAV_PARSE
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
+NAV_DB_FILE = os.path.join(DATA_DIR, 'nav_history.db')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nav (
+    code TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    nav REAL NOT NULL,
+    PRIMARY KEY (code, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS scheme (
+    code TEXT PRIMARY KEY,
+    last_day INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS market_closed (
+    day INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS scheme_master (
+    code TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    category TEXT,
+    fund_house TEXT,
+    updated_at TEXT NOT NULL
+);
+"""
+
+
+def parse_nav_date(date_str):
+    """Convert an mfapi ``dd-mm-YYYY`` date string to a proleptic day ordinal"""
+    return date(int(date_str[6:10]), int(date_str[3:5]), int(date_str[0:2])).toordinal()
+
+
+def format_nav_date(day):
+    """Convert a day ordinal back to the ``dd-mm-YYYY`` form mfapi uses"""
+    return date.fromordinal(day).strftime("%d-%m-%Y")
+
+
+# Longest run of days a NAVAll file may lag "today" and still be read as exchange holidays
+MAX_CLOSED_RUN = 10
+
+
+def weekdays_between(last_day, day):
+    """Weekday ordinals strictly between two day ordinals"""
+    return [d for d in range(last_day + 1, day) if date.fromordinal(d).weekday() < 5]
+
+
+def is_next_trading_day(last_day, day, closed_days=()):
+    """True when every weekday strictly between two day ordinals is in ``closed_days``"""
+    return all(d in closed_days for d in weekdays_between(last_day, day))
+
+
+def expected_nav_day(now, publish_hour=21):
+    """Ordinal of the latest trading day whose NAV should be published by ``now`` (local IST time).
+
+    A day's NAVs come out that evening, from ``publish_hour`` on. Weekends are
+    skipped; exchange holidays are not known here (callers can cap the result
+    with the latest day AMFI actually published).
+    """
+    day = now.date().toordinal() - (0 if now.hour >= publish_hour else 1)
+    while date.fromordinal(day).weekday() >= 5:
+        day -= 1
+    return day
+
+
+# numpy's datetime64 epoch (1970-01-01) as a proleptic day ordinal
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Byte positions of the digits and separators in "dd-mm-YYYY"
+_DATE_DIGITS = [0, 1, 3, 4, 6, 7, 8, 9]
+_DATE_SEPARATORS = [2, 5]
+
+
+def parse_nav_dates(date_strs):
+    """Convert many ``dd-mm-YYYY`` strings to day ordinals at once.
+
+    Returns ``(days, valid)``: an int32 ordinal array and a mask of the
+    strings that were well-formed dates (their ``days`` entry is 0).
+    """
+    strs = [s if isinstance(s, str) else "" for s in date_strs]
+    # One spare byte per string: a longer string leaves it non-zero
+    try:
+        raw = np.array(strs, dtype='S11')
+    except UnicodeEncodeError:
+        raw = np.array([s.encode('ascii', 'replace') for s in strs], dtype='S11')
+    raw = raw.view(np.uint8).reshape(len(strs), 11)
+
+    digits = raw[:, _DATE_DIGITS] - ord('0')  # non-digits wrap around to > 9
+    valid = ((digits <= 9).all(axis=1) & (raw[:, _DATE_SEPARATORS] == ord('-')).all(axis=1)
+             & (raw[:, 10] == 0))
+    digits = digits.astype(np.int32)
+    day = digits[:, 0] * 10 + digits[:, 1]
+    month = digits[:, 2] * 10 + digits[:, 3]
+    year = digits[:, 4] * 1000 + digits[:, 5] * 100 + digits[:, 6] * 10 + digits[:, 7]
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (year >= 1)
+
+    month_start = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype('M8[M]')
+    month_length = ((month_start + 1).astype('M8[D]') - month_start.astype('M8[D]')).astype(np.int32)
+    valid &= day <= month_length
+    days = month_start.astype('M8[D]').astype(np.int64) + day - 1 + _EPOCH_ORDINAL
+    return np.where(valid, days, 0).astype(np.int32), valid
+
+
+def _parse_navs(values):
+    """Convert NAV strings to float64, nan where a value is not a number"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        navs = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):
+            try:
+                navs[i] = float(value)
+            except (ValueError, TypeError):
+                navs[i] = np.nan
+        return navs
+
+
+class NavSeries:
+    """One scheme's NAV history: ascending int32 day ordinals and float64 NAVs.
+
+    Unpacks as ``days, navs`` so it can be passed wherever the returns, risk
+    and backtest engines expect a ``(days, navs)`` pair.
+    """
+    __slots__ = ("days", "navs")
+
+    def __init__(self, days, navs):
+        self.days = np.ascontiguousarray(days, dtype=np.int32)
+        self.navs = np.ascontiguousarray(navs, dtype=np.float64)
+
+    @classmethod
+    def from_mfapi(cls, nav_data, after_day=None):
+        """Parse mfapi ``data`` rows (any order; mfapi lists newest first), skipping malformed rows.
+
+        Only rows newer than ``after_day`` are kept, so a refresh keeps just
+        the days that are not in the store yet.
+        """
+        with NAV_PARSE.time():
+            dates, navs = [], []
+            for item in nav_data:
+                if isinstance(item, dict):
+                    dates.append(item.get('date'))
+                    navs.append(item.get('nav'))
+            days, valid = parse_nav_dates(dates)
+            navs = _parse_navs(navs)
+            valid &= np.isfinite(navs)
+            days, navs = days[valid][::-1], navs[valid][::-1]
+            # Already oldest first once reversed, so the stable sort is cheap; it only matters for stray rows
+            order = np.argsort(days, kind="stable")
+            days, navs = days[order], navs[order]
+            if after_day is not None:
+                newer = days > after_day
+                days, navs = days[newer], navs[newer]
+            return cls(days, navs)
+
+    def __len__(self):
+        return len(self.days)
+
+    def __iter__(self):
+        return iter((self.days, self.navs))
+
+    def __repr__(self):
+        if not len(self):
+            return "NavSeries([])"
+        return (f"NavSeries({len(self)} points, {format_nav_date(self.latest_day)} "
+                f"back to {format_nav_date(int(self.days[0]))})")
+
+    @property
+    def latest_day(self):
+        return int(self.days[-1]) if len(self.days) else None
+
+    def asof(self, day):
+        """``(nav, day)`` of the last point on or before ``day``, or ``(None, None)``"""
+        i = int(np.searchsorted(self.days, day, side='right')) - 1
+        if i < 0:
+            return None, None
+        return float(self.navs[i]), int(self.days[i])
+
+    def points(self):
+        """``(day, nav)`` tuples, newest first (the order mfapi uses)"""
+        return list(zip(self.days[::-1].tolist(), self.navs[::-1].tolist()))
+
+
+def parse_new_rows(nav_data, after_day=None):
+    """Parse mfapi rows (newest first) into ``(day, nav)`` tuples, newest first.
+
+    Only rows newer than ``after_day`` are returned so a refresh only merges
+    the days that are not in the store yet.
+    """
+    return NavSeries.from_mfapi(nav_data, after_day).points()
+
+
+class NavStore:
+    """Thread-safe SQLite store of ``(code, day, nav)`` points"""
+
+    def __init__(self, path=NAV_DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._write_lock:
+            conn = self._conn()
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(scheme)")}
+            if "complete" not in columns:
+                # Stores created before bulk ingest only ever held full downloads
+                conn.execute("ALTER TABLE scheme ADD COLUMN complete INTEGER NOT NULL DEFAULT 1")
+            conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def last_day(self, code):
+        """Return the most recent stored day ordinal for a scheme, or None"""
+        row = self._conn().execute(
+            "SELECT last_day FROM scheme WHERE code = ?", (str(code),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def last_complete_day(self, code):
+        """Like ``last_day``, but None when the stored history has gaps and needs a full download"""
+        row = self._conn().execute(
+            "SELECT last_day FROM scheme WHERE code = ? AND complete = 1", (str(code),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def last_days(self):
+        """Return ``{code: last_day}`` for every stored scheme"""
+        return dict(self._conn().execute("SELECT code, last_day FROM scheme"))
+
+    def merge(self, code, rows):
+        """Merge ``(day, nav)`` points for a scheme, returning how many were new or changed.
+
+        The rows must continue the stored history without gaps (a full
+        download, or the days after ``last_complete_day``); the scheme is
+        marked complete.
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        code = str(code)
+        with self._write_lock:
+            conn = self._conn()
+            before = conn.total_changes
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO nav (code, day, nav) VALUES (?, ?, ?)",
+                    ((code, day, nav) for day, nav in rows)
+                )
+                merged = conn.total_changes - before
+                self._reopen_days(conn, (day for day, _ in rows))
+                conn.execute(
+                    "INSERT INTO scheme (code, last_day, updated_at, complete) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT(code) DO UPDATE SET "
+                    "last_day = MAX(scheme.last_day, excluded.last_day), "
+                    "updated_at = excluded.updated_at, complete = 1",
+                    (code, max(day for day, _ in rows), datetime.now().isoformat())
+                )
+        return merged
+
+    def merge_latest(self, points):
+        """Merge one ``(code, day, nav)`` point per scheme in a single transaction.
+
+        Used by the whole-market bulk ingest. A point that does not directly
+        follow a scheme's complete history (new scheme, missed trading days;
+        recorded holidays do not count) leaves the scheme marked incomplete,
+        so the next per-scheme sync backfills it. Returns how many points were
+        new or changed.
+        """
+        points = [(str(code), day, nav) for code, day, nav in points]
+        if not points:
+            return 0
+        now = datetime.now().isoformat()
+        with self._write_lock:
+            conn = self._conn()
+            state = {code: (last_day, complete) for code, last_day, complete
+                     in conn.execute("SELECT code, last_day, complete FROM scheme")}
+            closed = self._closed_days(conn)
+            schemes = []
+            for code, day, nav in points:
+                last_day, complete = state.get(code, (None, 0))
+                if last_day is None or day > last_day:
+                    complete = int(bool(complete) and is_next_trading_day(last_day, day, closed))
+                    last_day = day
+                state[code] = (last_day, complete)
+                schemes.append((code, last_day, now, complete))
+            before = conn.total_changes
+            with conn:
+                # Re-ingesting the same file leaves unchanged points untouched (and uncounted)
+                conn.executemany(
+                    "INSERT INTO nav (code, day, nav) VALUES (?, ?, ?) "
+                    "ON CONFLICT(code, day) DO UPDATE SET nav = excluded.nav WHERE nav != excluded.nav",
+                    points
+                )
+                merged = conn.total_changes - before
+                self._reopen_days(conn, (day for _, day, _ in points), closed)
+                conn.executemany(
+                    "INSERT INTO scheme (code, last_day, updated_at, complete) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(code) DO UPDATE SET last_day = excluded.last_day, "
+                    "updated_at = excluded.updated_at, complete = excluded.complete",
+                    schemes
+                )
+        return merged
+
+    @staticmethod
+    def _closed_days(conn):
+        return {day for day, in conn.execute("SELECT day FROM market_closed")}
+
+    def _reopen_days(self, conn, days, closed=None):
+        """Forget recorded holidays on which NAVs turned up after all (a late AMFI publication)"""
+        closed = self._closed_days(conn) if closed is None else closed
+        reopened = closed.intersection(days)
+        if reopened:
+            conn.executemany("DELETE FROM market_closed WHERE day = ?", ((day,) for day in reopened))
+            closed.difference_update(reopened)
+
+    def record_closed_days(self, latest_day, today):
+        """Record the weekdays between a whole-market file's ``latest_day`` and ``today`` as holidays.
+
+        A NAVAll file read on ``today`` whose newest NAV is from ``latest_day``
+        shows that no scheme had a NAV on the weekdays in between (the
+        current day may still be published later, so it is not included).
+        Days that already have NAVs stored are left out. Returns the days
+        recorded.
+        """
+        days = weekdays_between(latest_day, today)
+        if not days or today - latest_day > MAX_CLOSED_RUN:
+            return []
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                # Rare (only after a holiday), so the unindexed scan of nav is acceptable
+                days = [d for d in days
+                        if conn.execute("SELECT 1 FROM nav WHERE day = ? LIMIT 1", (d,)).fetchone() is None]
+                conn.executemany("INSERT OR IGNORE INTO market_closed (day) VALUES (?)", ((d,) for d in days))
+        return days
+
+    def is_continuous(self, last_day, day):
+        """True when ``day`` directly follows ``last_day`` once weekends and recorded holidays are skipped"""
+        if not weekdays_between(last_day, day):
+            return True
+        return is_next_trading_day(last_day, day, self._closed_days(self._conn()))
+
+    def load(self, code):
+        """Return a scheme's ``NavSeries`` (empty when nothing is stored)"""
+        cursor = self._conn().execute(
+            "SELECT day, nav FROM nav WHERE code = ? ORDER BY day", (str(code),)
+        )
+        points = np.fromiter(cursor, dtype=[("day", np.int32), ("nav", np.float64)])
+        return NavSeries(points["day"], points["nav"])
+
+    def save_schemes(self, schemes):
+        """Upsert ``(code, name, category, fund_house)`` scheme-master rows, returning how many changed.
+
+        A missing category or fund house keeps the stored one, so a name-only
+        source (the mfapi scheme list) does not erase what NAVAll provided.
+        """
+        schemes = [(str(code), name, category, fund_house, datetime.now().isoformat())
+                   for code, name, category, fund_house in schemes if name]
+        if not schemes:
+            return 0
+        with self._write_lock:
+            conn = self._conn()
+            before = conn.total_changes
+            with conn:
+                conn.executemany(
+                    "INSERT INTO scheme_master (code, name, category, fund_house, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT(code) DO UPDATE SET name = excluded.name, "
+                    "category = COALESCE(excluded.category, category), "
+                    "fund_house = COALESCE(excluded.fund_house, fund_house), "
+                    "updated_at = excluded.updated_at "
+                    "WHERE name != excluded.name OR category IS NOT COALESCE(excluded.category, category) "
+                    "OR fund_house IS NOT COALESCE(excluded.fund_house, fund_house)",
+                    schemes
+                )
+            return conn.total_changes - before
+
+    def load_schemes(self):
+        """Return every scheme-master row as a ``code``/``name``/``category``/``fund_house`` dict"""
+        cursor = self._conn().execute("SELECT code, name, category, fund_house FROM scheme_master ORDER BY code")
+        return [{"code": code, "name": name, "category": category, "fund_house": fund_house}
+                for code, name, category, fund_house in cursor]
+
+    def schemes_version(self):
+        """Changes whenever a scheme-master row is added or updated"""
+        return tuple(self._conn().execute("SELECT COUNT(*), MAX(updated_at) FROM scheme_master").fetchone())
+
+    def delete(self, code):
+        """Drop every stored point for a scheme"""
+        code = str(code)
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM nav WHERE code = ?", (code,))
+                conn.execute("DELETE FROM scheme WHERE code = ?", (code,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_nav_store():
+    """Return the process-wide NavStore, opening it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = NavStore(NAV_DB_FILE)
+                logger.info(f"NAV history store opened at {NAV_DB_FILE}")
+    return _store
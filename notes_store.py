@@ -0,0 +1,134 @@
+"""Concurrent-safe storage for dashboard notes.
+
+Notes live in a SQLite database in WAL mode, so several gunicorn workers can
+add and delete notes without losing each other's writes. Every note gets a
+stable integer ID (never reused), which deletes address instead of a list
+position that shifts under concurrent edits; both are single-row statements.
+
+Listing is served from an in-memory copy that is revalidated with a ``stat``
+of the database and its WAL file: any commit, by any process, appends to the
+WAL or (after a checkpoint) rewrites the database, changing one of them.
+
+An existing ``notes.json`` is imported once when the database is created.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS note (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+
+class NotesStore:
+    """Notes with stable IDs in a WAL-mode SQLite database"""
+
+    def __init__(self, path, legacy_json=None):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._cached = None
+        # Bumped on every local write, in case the file stat does not change within one tick
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._write_lock:
+            conn = self._conn()
+            conn.executescript(_SCHEMA)
+            conn.commit()
+            if legacy_json and conn.execute("PRAGMA user_version").fetchone()[0] == 0:
+                self._import_json(conn, legacy_json)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _import_json(self, conn, legacy_json):
+        """Copy notes from the old JSON file, once (tracked with ``user_version``).
+
+        The version is re-read inside a ``BEGIN IMMEDIATE`` transaction, so of
+        several workers starting together only the first one imports.
+        """
+        notes = []
+        if os.path.exists(legacy_json):
+            try:
+                with open(legacy_json, 'r') as f:
+                    notes = json.load(f)
+            except Exception as e:
+                logger.error(f"Error importing notes from {legacy_json}: {e}")
+                return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != 0:
+                conn.rollback()
+                return
+            conn.executemany(
+                "INSERT INTO note (date, text, created_at) VALUES (?, ?, ?)",
+                ((n.get("date", ""), n.get("text", ""), n.get("created_at") or datetime.now().isoformat())
+                 for n in notes if isinstance(n, dict))
+            )
+            conn.execute("PRAGMA user_version = 1")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if notes:
+            logger.info(f"Imported {len(notes)} notes from {legacy_json}")
+
+    def _signature(self):
+        signature = [self._writes]
+        for path in (self.path, self.path + "-wal"):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def list(self):
+        """All notes, oldest first, as ``id``/``date``/``text``/``created_at`` dicts"""
+        signature = self._signature()
+        cached = self._cached
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with self._cache_lock:
+            cursor = self._conn().execute("SELECT id, date, text, created_at FROM note ORDER BY id")
+            notes = [{"id": note_id, "date": date, "text": text, "created_at": created_at}
+                     for note_id, date, text, created_at in cursor]
+            self._cached = (signature, notes)
+        return notes
+
+    def add(self, date, text):
+        """Append a note and return it with its new ID"""
+        note = {"date": date, "text": text, "created_at": datetime.now().isoformat()}
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                cursor = conn.execute("INSERT INTO note (date, text, created_at) VALUES (?, ?, ?)",
+                                      (note["date"], note["text"], note["created_at"]))
+            self._writes += 1
+        return dict(note, id=cursor.lastrowid)
+
+    def delete(self, note_id):
+        """Delete a note by ID; False when no such note exists"""
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                deleted = conn.execute("DELETE FROM note WHERE id = ?", (note_id,)).rowcount
+            self._writes += 1
+        return deleted > 0
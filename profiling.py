@@ -0,0 +1,193 @@
+"""Opt-in profiling of single requests and scheduled jobs.
+
+Two profilers, both standard-library only:
+
+* ``cprofile``: deterministic; every call is timed. Written as a ``.prof``
+  pstats file (``python -m pstats``, snakeviz, ...).
+* ``sampling``: a background thread records the profiled thread's stack
+  every ``interval`` seconds, adding almost nothing to the code under test.
+  Written as a ``.speedscope.json`` file (open at https://www.speedscope.app).
+
+Only one profile runs at a time (cProfile cannot profile two threads at
+once); a second request while one is running is served unprofiled. Profile
+files are kept in one directory, trimmed to the most recent ``keep``.
+
+Callers install their hooks only when profiling is enabled, so requests and
+jobs pay nothing otherwise.
+"""
+import cProfile
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ("cprofile", "sampling")
+EXTENSIONS = {"cprofile": ".prof", "sampling": ".speedscope.json"}
+SAMPLE_INTERVAL = 0.001
+
+_active = threading.Lock()
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.frames = []
+        self._frame_ids = {}
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = self.stopped = None
+
+    def _frame_id(self, code):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        frame_id = self._frame_ids.get(key)
+        if frame_id is None:
+            frame_id = self._frame_ids[key] = len(self.frames)
+            self.frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return frame_id
+
+    def _sample(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_id(frame.f_code))
+                    frame = frame.f_back
+                # Weight each sample by the time it stands for, so sleeps of the sampler do not skew it
+                key = tuple(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0.0) + (now - last)
+            last = now
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.stopped = time.perf_counter()
+
+    def to_speedscope(self, name):
+        """The samples in speedscope's file format (one "sampled" profile, weights in seconds)"""
+        stacks = list(self.stacks.items())
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "mf-tracker profiling.py",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(self.stopped - self.started, 6),
+                "samples": [list(stack) for stack, _ in stacks],
+                "weights": [round(weight, 6) for _, weight in stacks],
+            }],
+        }
+
+
+def _slug(name):
+    return re.sub(r"[^A-Za-z0-9]+", "-", name).strip("-")[:60] or "profile"
+
+
+def _trim(directory, keep):
+    files = sorted((entry for entry in os.scandir(directory)
+                    if entry.is_file() and entry.name.endswith(tuple(EXTENSIONS.values()))),
+                   key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in files[keep:]:
+        try:
+            os.remove(entry.path)
+        except OSError as e:
+            logger.warning(f"Could not remove old profile {entry.name}: {e}")
+
+
+class ProfileRun:
+    """Outcome of ``profile()``: ``path`` is set once the profile is written (None when skipped)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.path = None
+
+
+@contextmanager
+def profile(name, directory, profiler="cprofile", keep=50):
+    """Profile the ``with`` block and write the result to ``directory``.
+
+    Yields a ``ProfileRun`` whose ``path`` names the written file. When another
+    profile is already running the block runs unprofiled and ``path`` stays None.
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler {profiler!r}, expected one of {PROFILERS}")
+    run = ProfileRun(name)
+    if not _active.acquire(blocking=False):
+        logger.info(f"Profile of {name} skipped: another profile is running")
+        yield run
+        return
+    try:
+        if profiler == "cprofile":
+            prof = cProfile.Profile()
+            prof.enable()
+        else:
+            prof = SamplingProfiler()
+            prof.start()
+        started = time.perf_counter()
+        try:
+            yield run
+        finally:
+            if profiler == "cprofile":
+                prof.disable()
+            else:
+                prof.stop()
+            elapsed = time.perf_counter() - started
+            try:
+                os.makedirs(directory, exist_ok=True)
+                filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{_slug(name)}{EXTENSIONS[profiler]}"
+                path = os.path.join(directory, filename)
+                if profiler == "cprofile":
+                    prof.dump_stats(path)
+                else:
+                    with open(path, "w", encoding="utf-8") as f:
+                        json.dump(prof.to_speedscope(name), f)
+                run.path = path
+                _trim(directory, keep)
+                logger.info(f"Profiled {name} ({elapsed * 1000:.0f}ms) to {path}")
+            except OSError as e:
+                logger.error(f"Could not write profile of {name}: {e}")
+    finally:
+        _active.release()
+
+
+def list_profiles(directory, limit=50):
+    """Most recent profile files first, as ``name``/``format``/``bytes``/``created_at`` dicts"""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in os.scandir(directory):
+        fmt = next((p for p, ext in EXTENSIONS.items() if entry.name.endswith(ext)), None)
+        if fmt is None or not entry.is_file():
+            continue
+        stat = entry.stat()
+        profiles.append({
+            "name": entry.name,
+            "format": "pstats" if fmt == "cprofile" else "speedscope",
+            "bytes": stat.st_size,
+            "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+        })
+    profiles.sort(key=lambda p: p["created_at"], reverse=True)
+    return profiles[:limit]
@@ -0,0 +1,105 @@
+"""Risk analytics over stored NAV histories.
+
+Rolling CAGR distributions and drawdown statistics for each fund, computed
+with vectorized NumPy passes over the ``(days, navs)`` arrays already loaded
+for the returns engine, so no second trip to the history is needed:
+
+* rolling N-year CAGR: one ``searchsorted`` finds the start of every window;
+* drawdowns: a running maximum (``np.maximum.accumulate``) gives the peak,
+  depth and time under water at every point in a single pass.
+
+Drawdowns are reported as positive percentages (25.0 means a 25% fall from
+the peak), the convention used by the ranking formulas in ``experiments/``.
+"""
+import numpy as np
+
+from nav_store import format_nav_date
+
+# Rolling CAGR windows, in years
+ROLLING_YEARS = (1, 3, 5)
+
+# Window for the recent max drawdown the ranking formulas use
+RECENT_DRAWDOWN_YEARS = 5
+
+
+def rolling_cagr(days, navs, years):
+    """Annualized return of every ``years``-long window ending on a stored NAV.
+
+    The window start is the NAV on or before ``day - 365 * years``; windows
+    that would start before the first NAV are skipped. Returns % values.
+    """
+    targets = days - 365 * years
+    start = np.searchsorted(days, targets, side='right') - 1
+    valid = start >= 0
+    end_navs = navs[valid]
+    start_navs = navs[start[valid]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cagr = ((end_navs / start_navs) ** (1 / years) - 1) * 100
+    return cagr[np.isfinite(cagr)]
+
+
+def summarize(values):
+    """Distribution summary of rolling returns (zeros when there are none)"""
+    if len(values) == 0:
+        return {"count": 0, "mean": 0, "median": 0, "min": 0, "max": 0, "p25": 0, "p75": 0, "positive_pct": 0}
+    p25, median, p75 = np.percentile(values, [25, 50, 75])
+    return {
+        "count": int(len(values)),
+        "mean": float(values.mean()),
+        "median": float(median),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "p25": float(p25),
+        "p75": float(p75),
+        "positive_pct": float((values > 0).mean() * 100)
+    }
+
+
+def drawdown_stats(days, navs):
+    """Max drawdown with its peak, trough and recovery, plus time under water.
+
+    Returns a dict of plain Python values; dates are ``dd-mm-yyyy`` strings
+    and ``recovery_date``/``recovery_days`` are "NA"/None while the fund is
+    still below the peak of its worst drawdown.
+    """
+    peaks = np.maximum.accumulate(navs)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        depth = np.where(peaks > 0, (1 - navs / peaks) * 100, 0.0)
+
+    # Index of the latest peak at every point: time under water is measured from it
+    positions = np.arange(len(navs))
+    peak_idx = np.maximum.accumulate(np.where(navs >= peaks, positions, 0))
+    underwater_days = days - days[peak_idx]
+
+    trough = int(np.argmax(depth))
+    peak = int(peak_idx[trough])
+    recovered = np.nonzero(navs[trough:] >= navs[peak])[0]
+    recovery = trough + int(recovered[0]) if depth[trough] > 0 and len(recovered) else None
+
+    return {
+        "max_drawdown": float(depth[trough]),
+        "drawdown_peak": format_nav_date(int(days[peak])),
+        "drawdown_trough": format_nav_date(int(days[trough])),
+        "drawdown_days": int(days[trough] - days[peak]),
+        "recovery_date": format_nav_date(int(days[recovery])) if recovery is not None else "NA",
+        "recovery_days": int(days[recovery] - days[trough]) if recovery is not None else None,
+        "longest_drawdown_days": int(underwater_days.max()),
+        "current_drawdown": float(depth[-1])
+    }
+
+
+def compute_risk_metrics(days, navs):
+    """Rolling CAGR distributions and drawdown statistics for one non-empty history"""
+    days = np.asarray(days, dtype=np.int64)
+    navs = np.asarray(navs, dtype=np.float64)
+
+    metrics = drawdown_stats(days, navs)
+    recent = np.searchsorted(days, days[-1] - 365 * RECENT_DRAWDOWN_YEARS, side='left')
+    metrics[f"max_drawdown_{RECENT_DRAWDOWN_YEARS}y"] = drawdown_stats(days[recent:], navs[recent:])["max_drawdown"]
+    metrics["rolling"] = {f"{years}year": summarize(rolling_cagr(days, navs, years)) for years in ROLLING_YEARS}
+    return metrics
+
+
+def compute_risk_batch(series_list):
+    """``compute_risk_metrics`` for every ``(days, navs)`` pair"""
+    return [compute_risk_metrics(days, navs) for days, navs in series_list]
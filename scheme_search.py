@@ -0,0 +1,359 @@
+"""Local fund search over the scheme master.
+
+Every scheme in the master table (refreshed by the daily NAVAll ingest, or
+from mfapi's scheme list) is indexed in memory, so ``/api/funds/search``
+answers from this process with no upstream traffic:
+
+* name tokens are kept sorted, so a query word matches every token it is a
+  prefix of with one ``bisect`` ("flexi" -> "flexicap");
+* a trigram index over the tokens catches misspellings ("parag flexy"),
+  and a bounded edit distance over the tokens with the same first letters
+  catches transpositions the trigrams miss ("paarg flexi");
+* a scheme matches when every query word matches one of its tokens
+  (falling back to the most words matched), ranked by match quality and
+  then by the shorter name. Broad queries that match most of the master
+  walk the names in that order and stop after ``limit`` hits.
+
+Numeric queries match scheme codes by prefix. Recent queries are answered
+from an LRU.
+"""
+import bisect
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from cachetools import LRUCache
+
+from config import get_config
+from nav_store import get_nav_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = get_config().SCHEME_SEARCH_LIMIT
+QUERY_CACHE_SIZE = get_config().SCHEME_SEARCH_CACHE_SIZE
+
+# Seconds between checks of the stored master for changes by other workers
+INDEX_CHECK_INTERVAL = 60
+
+# Score of a query word per kind of match with a scheme token
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.8
+FUZZY_SCORE = 0.6
+# Minimum trigram (Dice) similarity for a fuzzy token match
+FUZZY_MIN_SIMILARITY = 0.4
+# Edits (insert, delete, substitute, swap adjacent) allowed for a fuzzy token match, by word length
+MAX_EDITS = ((4, 1), (8, 2))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lower-case alphanumeric words of ``text``"""
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def _trigrams(token):
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_edits(word):
+    edits = 0
+    for min_length, allowed in MAX_EDITS:
+        if len(word) >= min_length:
+            edits = allowed
+    return edits
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between ``a`` and ``b``, or ``limit + 1`` once it exceeds ``limit``"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class SchemeIndex:
+    """Prefix and trigram index over scheme names"""
+
+    def __init__(self, schemes, cache_size=QUERY_CACHE_SIZE):
+        self.schemes = [{"code": str(s["code"]), "name": s["name"]} for s in schemes]
+        token_ids = {}
+        postings = []
+        self.scheme_tokens = []
+        for i, scheme in enumerate(self.schemes):
+            ids = []
+            for token in set(tokenize(scheme["name"])):
+                t = token_ids.get(token)
+                if t is None:
+                    t = token_ids[token] = len(postings)
+                    postings.append([])
+                postings[t].append(i)
+                ids.append(t)
+            self.scheme_tokens.append(frozenset(ids))
+
+        # Tokens sorted for prefix ranges; ids map back into postings
+        order = sorted(token_ids, key=token_ids.get)
+        self.vocabulary = sorted(token_ids)
+        self.vocabulary_ids = [token_ids[token] for token in self.vocabulary]
+        self.postings = [frozenset(schemes) for schemes in postings]
+        self.trigram_tokens = defaultdict(list)
+        self.token_trigrams = []
+        # Edit-distance candidates: tokens by (first letter, length)
+        self.tokens_by_head = defaultdict(list)
+        for t, token in enumerate(order):
+            grams = frozenset(_trigrams(token))
+            self.token_trigrams.append(grams)
+            for gram in grams:
+                self.trigram_tokens[gram].append(t)
+            self.tokens_by_head[token[0], len(token)].append((t, token))
+        self.codes = sorted((s["code"], i) for i, s in enumerate(self.schemes))
+        # Tie-break between equally good matches: shorter names first
+        self.name_order = [0] * len(self.schemes)
+        by_name = sorted(range(len(self.schemes)), key=lambda i: (len(self.schemes[i]["name"]), self.schemes[i]["name"]))
+        for position, i in enumerate(by_name):
+            self.name_order[i] = position
+        self.by_name = by_name
+        self.postings_by_name = [sorted(schemes, key=self.name_order.__getitem__) for schemes in postings]
+
+        self._cache = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.schemes)
+
+    def _match_word(self, word):
+        """``{token_id: score}`` of the tokens a query word matches"""
+        matches = {}
+        lo = bisect.bisect_left(self.vocabulary, word)
+        hi = bisect.bisect_left(self.vocabulary, word + "\uffff", lo)
+        for k in range(lo, hi):
+            token = self.vocabulary[k]
+            matches[self.vocabulary_ids[k]] = (
+                EXACT_SCORE if token == word else PREFIX_SCORE + (EXACT_SCORE - PREFIX_SCORE) * len(word) / len(token))
+        if matches or len(word) < 3:
+            return matches
+
+        grams = _trigrams(word)
+        # A token this similar shares at least `needed` trigrams with the word, so it holds one
+        # of the len(grams) - needed + 1 rarest: only their (short) token lists are read
+        needed = max(1, math.ceil(FUZZY_MIN_SIMILARITY * (len(grams) + 1) / 2))
+        rarest = sorted(grams, key=lambda gram: len(self.trigram_tokens.get(gram, ())))[:len(grams) - needed + 1]
+        candidates = set().union(*(self.trigram_tokens.get(gram, ()) for gram in rarest))
+        for t in candidates:
+            token_grams = self.token_trigrams[t]
+            similarity = 2 * len(grams & token_grams) / (len(grams) + len(token_grams))
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                matches[t] = FUZZY_SCORE * similarity
+
+        max_edits = _max_edits(word)
+        if max_edits:
+            # Swapped letters break most trigrams; a close spelling starting with the same letter
+            # (or the swapped second one) still matches
+            for head in {word[0], word[1]}:
+                for length in range(len(word) - max_edits, len(word) + max_edits + 1):
+                    for t, token in self.tokens_by_head.get((head, length), ()):
+                        distance = edit_distance(word, token, max_edits)
+                        if distance <= max_edits:
+                            score = FUZZY_SCORE * (1 - distance / max(len(word), len(token)))
+                            matches[t] = max(matches.get(t, 0.0), score)
+        return matches
+
+    def _postings(self, matches):
+        """Schemes containing any of the matched tokens"""
+        if len(matches) == 1:
+            return self.postings[next(iter(matches))]
+        return frozenset().union(*(self.postings[t] for t in matches))
+
+    def _search_names(self, words, limit):
+        word_matches = [m for m in (self._match_word(word) for word in words) if m]
+        if not word_matches:
+            return []
+        # Intersect from the rarest word up; each step either intersects posting
+        # sets or, when the candidates are already fewer, checks their tokens
+        sizes = [sum(len(self.postings[t]) for t in m) for m in word_matches]
+        order = sorted(range(len(word_matches)), key=sizes.__getitem__)
+        if all(len(m) == 1 for m in word_matches):
+            # Each word is one token, so every scheme holding them all ranks alike: walk the rarest
+            # token's schemes in name order and stop at the first `limit` holding the others too
+            tokens = [next(iter(word_matches[w])) for w in order]
+            hits = []
+            for i in self.postings_by_name[tokens[0]]:
+                if all(t in self.scheme_tokens[i] for t in tokens[1:]):
+                    hits.append(i)
+                    if len(hits) >= limit:
+                        break
+            if hits:
+                return hits
+        matching = self._postings(word_matches[order[0]])
+        for w in order[1:]:
+            if not matching:
+                break
+            if len(matching) < sizes[w]:
+                keys = word_matches[w].keys()
+                matching = {i for i in matching if not keys.isdisjoint(self.scheme_tokens[i])}
+            else:
+                matching = matching & self._postings(word_matches[w])
+        if matching:
+            # Every candidate matches every word, so words matching a single token score them all alike
+            scored_words = [m for m in word_matches if len(m) > 1]
+        else:
+            # No scheme has every word: rank everything that matches any of them
+            matching = set().union(*(self._postings(m) for m in word_matches))
+            scored_words = word_matches
+
+        if scored_words is not word_matches and len(scored_words) <= 1:
+            return self._rank_tiers(matching, scored_words[0] if scored_words else {}, limit)
+
+        def rank(i):
+            tokens = self.scheme_tokens[i]
+            matched = 0
+            score = 0.0
+            for m in scored_words:
+                hits = m.keys() & tokens
+                if hits:
+                    matched += 1
+                    score += max(m[t] for t in hits)
+            return -matched, -score, self.name_order[i]
+
+        return heapq.nsmallest(limit, matching, key=rank)
+
+    def _rank_tiers(self, matching, matches, limit):
+        """Top ``limit`` of candidates that all match every word, where at most one word matched several tokens.
+
+        Such candidates rank by that word's best token score alone, so they
+        are taken tier by tier (one tier per score), each in name order.
+        """
+        if not matches:
+            return self._first_by_name(matching, limit)
+        tiers = defaultdict(list)
+        for t, score in matches.items():
+            tiers[score].append(t)
+        hits, seen = [], set()
+        for score in sorted(tiers, reverse=True):
+            tokens = tiers[score]
+            if len(matching) < sum(len(self.postings[t]) for t in tokens):
+                tier = {i for i in matching if i not in seen and not self.scheme_tokens[i].isdisjoint(tokens)}
+            else:
+                tier = set().union(*(self.postings[t] for t in tokens)).intersection(matching) - seen
+            hits.extend(self._first_by_name(tier, limit - len(hits)))
+            if len(hits) >= limit:
+                break
+            seen |= tier
+        return hits
+
+    def _walk_names(self, contains, expected, limit):
+        """The first ``limit`` schemes in name order passing ``contains``.
+
+        Gives up (None) after a few times the steps that ``expected`` matches
+        spread evenly would need, e.g. when they all have long names.
+        """
+        budget = 4 * len(self.schemes) * limit / max(expected, 1)
+        hits = []
+        for step, i in enumerate(self.by_name):
+            if step > budget:
+                return None
+            if contains(i):
+                hits.append(i)
+                if len(hits) >= limit:
+                    break
+        return hits
+
+    def _first_by_name(self, candidates, limit):
+        """The ``limit`` candidates with the shortest names"""
+        if len(candidates) * len(candidates) > len(self.schemes) * limit:
+            # Dense candidates: walking the names in order usually finds them after few steps
+            hits = self._walk_names(candidates.__contains__, len(candidates), limit)
+            if hits is not None:
+                return hits
+        return heapq.nsmallest(limit, candidates, key=self.name_order.__getitem__)
+
+    def _search_codes(self, query, limit):
+        lo = bisect.bisect_left(self.codes, (query,))
+        hits = []
+        for code, i in self.codes[lo:]:
+            if not code.startswith(query) or len(hits) >= limit:
+                break
+            hits.append(i)
+        return hits
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Best matching schemes in mfapi's search format (``schemeCode``/``schemeName``)"""
+        words = tokenize(query)
+        key = (" ".join(words), limit)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        if len(words) == 1 and words[0].isdigit():
+            hits = self._search_codes(words[0], limit)
+        else:
+            hits = self._search_names(words, limit)
+        results = [{"schemeCode": int(self.schemes[i]["code"]) if self.schemes[i]["code"].isdigit()
+                    else self.schemes[i]["code"], "schemeName": self.schemes[i]["name"]} for i in hits]
+        with self._lock:
+            self._cache[key] = results
+        return results
+
+
+def fetch_mfapi_schemes(base_url, timeout=30):
+    """The mfapi scheme list as ``(code, name, category, fund_house)`` master rows"""
+    import requests
+
+    response = requests.get(base_url.rstrip("/"), timeout=timeout)
+    response.raise_for_status()
+    return [(s["schemeCode"], s["schemeName"], None, None) for s in response.json()
+            if s.get("schemeCode") and s.get("schemeName")]
+
+
+_index = None
+_index_version = None
+_index_checked = float('-inf')
+_index_lock = threading.Lock()
+
+
+def get_scheme_index(store=None):
+    """The process-wide index, rebuilt when the stored scheme master has changed.
+
+    The store is consulted at most every ``INDEX_CHECK_INTERVAL`` seconds, so
+    a refresh done by another worker is picked up without a per-query cost.
+    """
+    global _index, _index_version, _index_checked
+    now = time.monotonic()
+    if _index is not None and now - _index_checked < INDEX_CHECK_INTERVAL:
+        return _index
+    with _index_lock:
+        if _index is not None and now - _index_checked < INDEX_CHECK_INTERVAL:
+            return _index
+        store = store or get_nav_store()
+        version = store.schemes_version()
+        if _index is None or version != _index_version:
+            started = time.perf_counter()
+            _index = SchemeIndex(store.load_schemes())
+            _index_version = version
+            logger.info(f"Scheme search index built over {len(_index)} schemes "
+                        f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+        _index_checked = now
+        return _index
+
+
+def invalidate_scheme_index():
+    """Force the next ``get_scheme_index`` call to check the store"""
+    global _index_checked
+    _index_checked = float('-inf')
@@ -0,0 +1,195 @@
+"""Registry of fund scoring formulas, evaluated for all funds at once.
+
+Every formula is a vectorized expression over the columns of a metrics
+matrix (one row per fund), so ranking the whole universe with any formula is
+a handful of NumPy operations on data that is already cached. The candidates
+from ``experiments/test-consistency-formulas.js`` are registered alongside
+the dashboard's consistency score.
+
+New formulas are added with ``@register_formula(name, description)``.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from analytics import CONSISTENCY_WEIGHTS
+
+# Drawdown assumed for funds without one (too young, or no fall yet), as in the experiments
+DEFAULT_DRAWDOWN = 30.0
+
+METRIC_COLUMNS = (
+    "return_1y", "return_2y", "return_3y", "return_5y",
+    "mean_return",       # mean of the five year-on-year returns
+    "max_drawdown",      # max drawdown over the last five years, in %
+    "rolling_3y_median", "rolling_3y_positive_pct",
+    "consistency_score",
+)
+
+Formula = namedtuple("Formula", ["name", "description", "fn"])
+
+FORMULAS = {}
+
+DEFAULT_FORMULA = "consistency"
+
+
+def register_formula(name, description):
+    """Decorator registering ``fn(m) -> scores`` where ``m`` maps metric names to column arrays"""
+    def decorator(fn):
+        FORMULAS[name] = Formula(name, description, fn)
+        return fn
+    return decorator
+
+
+def _pow(values, exponent):
+    """Power that leaves negative bases as nan instead of warning (they rank last)"""
+    with np.errstate(invalid='ignore'):
+        return np.power(values, exponent)
+
+
+@register_formula("consistency", "0.2 x 1Y + 0.3 x 2Y + 0.5 x 3Y (dashboard default)")
+def _consistency(m):
+    return sum(weight * m["return_" + period.replace("year", "y")] for period, weight in CONSISTENCY_WEIGHTS.items())
+
+
+@register_formula("return_pow1.5_drawdown", "Return^1.5 / Drawdown")
+def _return_pow_drawdown(m):
+    return _pow(m["mean_return"], 1.5) / m["max_drawdown"]
+
+
+@register_formula("calmar", "Return / Drawdown")
+def _calmar(m):
+    return m["mean_return"] / m["max_drawdown"]
+
+
+@register_formula("sqrt_drawdown", "Return / sqrt(Drawdown)")
+def _sqrt_drawdown(m):
+    return m["mean_return"] / np.sqrt(m["max_drawdown"])
+
+
+@register_formula("return_minus_drawdown", "Return - Drawdown")
+def _return_minus_drawdown(m):
+    return m["mean_return"] - m["max_drawdown"]
+
+
+@register_formula("squared_drawdown", "Return / Drawdown^2")
+def _squared_drawdown(m):
+    return m["mean_return"] / m["max_drawdown"] ** 2
+
+
+@register_formula("multiplicative", "Return x (1 - Drawdown/100)")
+def _multiplicative(m):
+    return m["mean_return"] * (1 - m["max_drawdown"] / 100)
+
+
+def _power_ratio(name, return_exp, drawdown_exp):
+    @register_formula(name, f"Return^{return_exp:g} / Drawdown^{drawdown_exp:g}")
+    def formula(m):
+        return _pow(m["mean_return"], return_exp) / m["max_drawdown"] ** drawdown_exp
+
+
+for _name, _return_exp, _drawdown_exp in (
+    ("hybrid_1.2_1.5", 1.2, 1.5),
+    ("return_drawdown_1.3", 1.0, 1.3),
+    ("return_drawdown_1.1_1.2", 1.1, 1.2),
+    ("return_drawdown_1.05", 1.0, 1.05),
+    ("return_drawdown_1.15_1.25", 1.15, 1.25),
+    ("return_drawdown_1.25_1.35", 1.25, 1.35),
+    ("return_drawdown_1.35_1.45", 1.35, 1.45),
+    ("return_drawdown_1.05_1.15", 1.05, 1.15),
+):
+    _power_ratio(_name, _return_exp, _drawdown_exp)
+
+
+def _min_max(values):
+    """Scale a column to 0-100 over the fund set (50 for all when the column is flat), as the experiments do"""
+    if not len(values):
+        return values
+    low, high = np.nanmin(values), np.nanmax(values)
+    if high == low:
+        return np.full_like(values, 50.0)
+    return (values - low) / (high - low) * 100
+
+
+def _composite(name, return_weight):
+    drawdown_weight = round(1 - return_weight, 2)
+
+    @register_formula(name, f"{return_weight:.0%} Return - {drawdown_weight:.0%} Drawdown (both scaled 0-100)")
+    def formula(m):
+        return return_weight * _min_max(m["mean_return"]) - drawdown_weight * _min_max(m["max_drawdown"])
+
+
+for _name, _weight in (("composite_70_30", 0.7), ("composite_60_40", 0.6), ("composite_80_20", 0.8),
+                       ("composite_75_25", 0.75), ("composite_65_35", 0.65)):
+    _composite(_name, _weight)
+
+
+@register_formula("rolling_3y", "Median rolling 3Y CAGR x share of positive 3Y windows")
+def _rolling_3y(m):
+    return m["rolling_3y_median"] * m["rolling_3y_positive_pct"] / 100
+
+
+class MetricsMatrix:
+    """Per-fund metrics as one ``(n_funds, len(METRIC_COLUMNS))`` float array"""
+
+    def __init__(self, results):
+        self.funds = [
+            {"code": r["code"], "name": r["name"], "is_portfolio": r.get("is_portfolio", False)}
+            for r in results
+        ]
+        self.values = np.array([self._row(r) for r in results], dtype=np.float64).reshape(
+            len(results), len(METRIC_COLUMNS))
+        self.columns = {name: self.values[:, i] for i, name in enumerate(METRIC_COLUMNS)}
+
+    @staticmethod
+    def _row(result):
+        returns = result.get("returns", {})
+        breakdown = result.get("year_breakdown", {}).get("5year", {})
+        risk = result.get("risk_metrics", {})
+        rolling = risk.get("rolling", {}).get("3year", {})
+        drawdown = risk.get("max_drawdown_5y") or DEFAULT_DRAWDOWN
+        return [
+            returns.get("1year", 0) or 0,
+            returns.get("2year", 0) or 0,
+            returns.get("3year", 0) or 0,
+            returns.get("5year", 0) or 0,
+            np.mean([breakdown.get(f"year{i}", 0) or 0 for i in range(1, 6)]),
+            drawdown,
+            rolling.get("median", 0),
+            rolling.get("positive_pct", 0),
+            result.get("consistency_score", 0) or 0,
+        ]
+
+    def score(self, formula):
+        """Raw scores for every fund (nan where the formula is undefined)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.asarray(FORMULAS[formula].fn(self.columns), dtype=np.float64)
+        return np.where(np.isfinite(scores), scores, np.nan)
+
+    def rank(self, formula=DEFAULT_FORMULA, limit=None, portfolio_only=False):
+        """Funds ordered best first, with raw and 0-100 normalized scores"""
+        scores = self.score(formula)
+        rows = np.arange(len(self.funds))
+        if portfolio_only:
+            rows = rows[np.array([f["is_portfolio"] for f in self.funds], dtype=bool)]
+        # nan scores sort last; stable so ties keep dashboard order
+        order = rows[np.argsort(np.where(np.isnan(scores[rows]), np.inf, -scores[rows]), kind='stable')]
+        if limit:
+            order = order[:limit]
+
+        finite = scores[rows][np.isfinite(scores[rows])]
+        low, high = (finite.min(), finite.max()) if len(finite) else (0.0, 0.0)
+        ranking = []
+        for position, i in enumerate(order.tolist(), 1):
+            score = scores[i]
+            if np.isnan(score):
+                normalized = None
+            else:
+                normalized = 50.0 if high == low else float((score - low) / (high - low) * 100)
+            ranking.append(dict(
+                self.funds[i],
+                rank=position,
+                score=None if np.isnan(score) else float(score),
+                normalized_score=normalized,
+                metrics={name: float(self.values[i, c]) for c, name in enumerate(METRIC_COLUMNS)}
+            ))
+        return ranking
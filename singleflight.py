@@ -0,0 +1,133 @@
+"""Single-flight coordination for expensive jobs such as a full upstream refresh.
+
+A job name maps to an in-process lock (threads of one worker) plus a Redis
+lease (``SET NX PX`` with an owner token) that serializes the job across every
+gunicorn worker. The lease is renewed while the job runs and released with a
+compare-and-delete, so a crashed worker only blocks others until the lease
+expires. When Redis is unavailable the in-process lock alone is used.
+"""
+import logging
+import threading
+import time
+import uuid
+
+from cache import make_key
+
+logger = logging.getLogger(__name__)
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    def __init__(self, redis_client=None, lease_ttl=120, wait_timeout=120, poll_interval=0.25):
+        self.redis = redis_client
+        self.lease_ttl = lease_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _local_lock(self, name):
+        with self._locks_guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _lease_key(self, name):
+        return make_key("lease", name)
+
+    def _try_lease(self, name, token):
+        """Try to take the cluster-wide lease; True when Redis is unavailable (local lock only)"""
+        if not self.redis:
+            return True
+        try:
+            return bool(self.redis.set(self._lease_key(name), token, nx=True, px=int(self.lease_ttl * 1000)))
+        except Exception as e:
+            logger.warning(f"Redis lease unavailable for {name}, using in-process lock only: {e}")
+            return True
+
+    def _lease_held(self, name):
+        if not self.redis:
+            return False
+        try:
+            return bool(self.redis.exists(self._lease_key(name)))
+        except Exception:
+            return False
+
+    def _release_lease(self, name, token):
+        if not self.redis:
+            return
+        try:
+            self.redis.eval(_RELEASE_SCRIPT, 1, self._lease_key(name), token)
+        except Exception as e:
+            logger.warning(f"Redis lease release failed for {name}: {e}")
+
+    def _keep_alive(self, name, token, stop):
+        interval = max(self.lease_ttl / 3, 0.1)
+        while not stop.wait(interval):
+            try:
+                self.redis.eval(_RENEW_SCRIPT, 1, self._lease_key(name), token, int(self.lease_ttl * 1000))
+            except Exception as e:
+                logger.warning(f"Redis lease renewal failed for {name}: {e}")
+
+    def is_running(self, name):
+        """True when this process or another worker is currently running the job"""
+        return self._local_lock(name).locked() or self._lease_held(name)
+
+    def run(self, name, fn, wait=True, coalesce=True):
+        """Run ``fn`` unless the same job is already in flight.
+
+        Returns ``(ran, result)``. With ``coalesce`` (the default) a caller that
+        finds the job in flight does not run it: with ``wait`` it blocks until
+        the running job finishes, then returns ``(False, None)`` so it can read
+        the shared result; without ``wait`` it returns immediately. With
+        ``coalesce=False`` the caller waits its turn and then runs ``fn``
+        itself, which serializes mutations against the job.
+        """
+        lock = self._local_lock(name)
+        if not lock.acquire(blocking=False):
+            if not wait:
+                return False, None
+            if coalesce:
+                if lock.acquire(timeout=self.wait_timeout):
+                    lock.release()
+                return False, None
+            if not lock.acquire(timeout=self.wait_timeout):
+                raise TimeoutError(f"Timed out waiting for {name}")
+
+        try:
+            token = uuid.uuid4().hex
+            deadline = time.monotonic() + self.wait_timeout
+            while not self._try_lease(name, token):
+                if not wait:
+                    return False, None
+                if time.monotonic() >= deadline:
+                    if coalesce:
+                        return False, None
+                    raise TimeoutError(f"Timed out waiting for the {name} lease")
+                time.sleep(self.poll_interval)
+                if coalesce and not self._lease_held(name):
+                    # Another worker finished the job while we waited
+                    return False, None
+
+            stop = threading.Event()
+            if self.redis:
+                threading.Thread(target=self._keep_alive, args=(name, token, stop),
+                                 name=f"lease-{name}", daemon=True).start()
+            try:
+                return True, fn()
+            finally:
+                stop.set()
+                self._release_lease(name, token)
+        finally:
+            lock.release()
@@ -98,7 +98,7 @@
                     if (response.ok) {
                         notes = await response.json();
                         notesList.innerHTML = '';
-                        notes.forEach((note, index) => {
+                        notes.forEach(note => {
                             const li = document.createElement('li');
                             li.className = 'list-group-item d-flex justify-content-between align-items-center';
                             li.innerHTML = `
@@ -106,7 +106,7 @@
                                 <strong></strong>
                                 <p class="mb-0"></p>
                             </div>
-                            <button class="btn btn-danger btn-sm" onclick="deleteNote(${index})">Delete</button>
+                            <button class="btn btn-danger btn-sm" onclick="deleteNote(${note.id})">Delete</button>
                         `;
                             li.querySelector('strong').textContent = note.date;
                             li.querySelector('p').textContent = note.text;
@@ -118,10 +118,10 @@
                 }
             }
 
-            window.deleteNote = async function (index) {
+            window.deleteNote = async function (id) {
                 if (confirm('Are you sure you want to delete this note?')) {
                     try {
-                        const response = await fetch(`/api/notes/${index}`, {
+                        const response = await fetch(`/api/notes/${id}`, {
                             method: 'DELETE'
                         });
                         if (response.ok) {
@@ -532,3 +532,86 @@
             refreshAfterManageBtn?.addEventListener('click', () => {
                 window.location.reload();
             });
+
+            // --- Progressive loading on a cold cache ---
+            // The server sends an empty page shell and streams one NDJSON line per fund
+            // as soon as it is computed; rows are appended as they arrive and the page
+            // reloads once the full dataset has been published.
+            const RETURN_COLUMNS = [
+                ['returns1d', ''], ['returns1w', ''], ['returns1m', ''],
+                ['returns3m', 'd-none d-md-table-cell'], ['returns6m', 'd-none d-md-table-cell'],
+                ['returns1y', ''], ['returns2y', ''], ['returns3y', ''], ['returns5y', '']
+            ];
+
+            function renderStreamedRow(fund) {
+                const row = document.createElement('tr');
+                row.className = 'fund-row';
+
+                const nameCell = row.insertCell();
+                nameCell.className = 'fund-name-cell';
+                nameCell.innerHTML = '<span class="fund-name"></span>';
+                nameCell.querySelector('span').textContent = fund.name;
+
+                const codeCell = row.insertCell();
+                codeCell.innerHTML = '<span class="amfi-code"></span>';
+                codeCell.querySelector('span').textContent = fund.code;
+
+                const navCell = row.insertCell();
+                navCell.innerHTML = '<span class="current-nav-value"></span>';
+                navCell.querySelector('span').textContent = `₹${fund.nav}`;
+
+                RETURN_COLUMNS.forEach(([key, extraClass]) => {
+                    const value = fund[key] || 0;
+                    const cell = row.insertCell();
+                    const tone = value === 0 ? 'text-muted' : (value < 0 ? 'text-danger' : 'text-success');
+                    cell.className = `${tone} ${extraClass}`.trim();
+                    cell.setAttribute('data-value', value);
+                    cell.textContent = value === 0 ? 'NA' : `${value.toFixed(2)}%`;
+                });
+                return row;
+            }
+
+            async function streamFunds(url) {
+                const tbody = table.querySelector('tbody');
+                let buffer = '';
+                let done = null;
+
+                const handleLine = line => {
+                    if (!line.trim()) return;
+                    const message = JSON.parse(line);
+                    if (message.type === 'fund' && message.data.is_portfolio) {
+                        tbody.appendChild(renderStreamedRow(message.data));
+                    } else if (message.type === 'done' || message.type === 'error') {
+                        done = message;
+                    }
+                };
+
+                try {
+                    const response = await fetch(url, { headers: { 'Accept': 'application/x-ndjson' } });
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    while (true) {
+                        const { value, done: finished } = await reader.read();
+                        if (finished) break;
+                        buffer += decoder.decode(value, { stream: true });
+                        const lines = buffer.split('\n');
+                        buffer = lines.pop();
+                        lines.forEach(handleLine);
+                    }
+                    handleLine(buffer);
+                } catch (error) {
+                    console.error('Error streaming fund data:', error);
+                }
+
+                if (done && done.type === 'done' && done.data.count > 0) {
+                    // The dataset is now cached, so the full page renders straight away
+                    window.location.reload();
+                } else {
+                    const row = tbody.insertRow();
+                    row.innerHTML = '<td colspan="12" class="text-center text-danger">Unable to fetch fund data from the API</td>';
+                }
+            }
+
+            if (document.body.dataset.streamUrl) {
+                streamFunds(document.body.dataset.streamUrl);
+            }
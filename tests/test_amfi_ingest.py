@@ -0,0 +1,121 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import date, datetime, timezone
+
+from aiohttp.test_utils import TestServer
+
+import amfi_ingest
+from amfi_ingest import ingest_navall, parse_amfi_date, parse_navall
+from mock_mfapi import MockMfApi, synthetic_latest
+from nav_store import NavStore
+
+NAVALL = """Scheme Code;ISIN Div Payout/ ISIN Growth;ISIN Div Reinvestment;Scheme Name;Net Asset Value;Date
+
+Open Ended Schemes(Equity Scheme - Small Cap Fund)
+
+Quant Mutual Fund
+
+120828;INF966L01689;-;quant Small Cap Fund - Growth Option - Direct Plan;262.4180;16-Oct-2024
+120829;INF966L01671;-;quant Small Cap Fund - IDCW Option - Direct Plan;N.A.;16-Oct-2024
+
+Close Ended Schemes(Income)
+
+Other AMC
+
+100001;-;-;Old Scheme;10.5;31-Sep-2024
+100002;-;-;Older Scheme;11.25;15-Oct-2024
+"""
+
+OCT_15 = date(2024, 10, 15).toordinal()
+OCT_16 = date(2024, 10, 16).toordinal()
+
+
+class TestParseNavAll(unittest.TestCase):
+    def test_rows_headings_and_skips(self):
+        stats = {}
+        rows = list(parse_navall(NAVALL.splitlines(), stats))
+        self.assertEqual([r.code for r in rows], ["120828", "100002"])
+        self.assertEqual(rows[0].category, "Open Ended Schemes(Equity Scheme - Small Cap Fund)")
+        self.assertEqual(rows[0].fund_house, "Quant Mutual Fund")
+        self.assertEqual((rows[0].day, rows[0].nav), (OCT_16, 262.418))
+        self.assertEqual(rows[1].fund_house, "Other AMC")
+        self.assertEqual(stats, {"rows": 4, "skipped": 2})
+
+    def test_date_format(self):
+        self.assertEqual(parse_amfi_date("01-JAN-2024"), date(2024, 1, 1).toordinal())
+        with self.assertRaises(ValueError):
+            parse_amfi_date("01-01-2024")
+
+
+class TestIngestNavAll(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = NavStore(os.path.join(self.tmp.name, 'nav.db'))
+        self.path = os.path.join(self.tmp.name, 'NAVAll.txt')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(NAVALL)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ingest_is_idempotent(self):
+        stats = ingest_navall(self.path, store=self.store, batch_size=1)
+        self.assertEqual((stats["schemes"], stats["merged"], stats["latest_day"]), (2, 2, OCT_16))
+        self.assertEqual(self.store.load("120828").navs.tolist(), [262.418])
+        self.assertEqual(ingest_navall(self.path, store=self.store)["merged"], 0)
+
+    def test_only_contiguous_histories_stay_complete(self):
+        # 120828 has a full history up to the previous trading day, 100002 missed some days
+        self.store.merge("120828", [(OCT_15, 260.0)])
+        self.store.merge("100002", [(OCT_15 - 7, 11.0)])
+        ingest_navall(self.path, store=self.store)
+        self.assertEqual(self.store.last_complete_day("120828"), OCT_16)
+        self.assertIsNone(self.store.last_complete_day("100002"))
+        self.assertEqual(self.store.last_day("100002"), OCT_15)
+
+    def test_recorded_holiday_keeps_histories_complete(self):
+        # OCT_15 was a holiday: the NAVAll file read on OCT_16 still showed OCT_15 - 1
+        self.store.merge("120828", [(OCT_15 - 1, 259.0)])
+        self.store.record_closed_days(OCT_15 - 1, OCT_16)
+        ingest_navall(self.path, store=self.store)
+        self.assertEqual(self.store.last_complete_day("120828"), OCT_16)
+
+    def test_holidays_are_counted_up_to_the_indian_market_day(self):
+        class EarlyMorningInIndia(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                # 02:00 IST on Fri 18 Oct is still Thu 17 Oct on a UTC host
+                return datetime(2024, 10, 17, 20, 30, tzinfo=timezone.utc).astimezone(tz)
+
+        self.store.merge("120828", [(OCT_15, 260.0)])
+        amfi_ingest.datetime = EarlyMorningInIndia
+        try:
+            ingest_navall(self.path, store=self.store)
+        finally:
+            amfi_ingest.datetime = datetime
+        # No NAVs for Thu 17 Oct by the next morning: a holiday
+        self.assertTrue(self.store.is_continuous(OCT_16, OCT_16 + 2))
+
+    def test_new_scheme_needs_backfill(self):
+        ingest_navall(self.path, store=self.store)
+        self.assertEqual(self.store.last_day("120828"), OCT_16)
+        self.assertIsNone(self.store.last_complete_day("120828"))
+
+    def test_stand_in_navall_endpoint(self):
+        mock = MockMfApi(fund_count=3, history_years=1)
+
+        async def scenario():
+            async with TestServer(mock.make_app()) as server:
+                return await asyncio.to_thread(ingest_navall, str(server.make_url("/NAVAll.txt")), self.store)
+
+        stats = asyncio.run(scenario())
+        # Three synthetic schemes plus the recorded fixture
+        self.assertEqual(stats["schemes"], 4)
+        day, nav = synthetic_latest(900002, 1)
+        self.assertEqual(self.store.load("900002").asof(day), (nav, day))
+
+
+if __name__ == '__main__':
+    unittest.main()
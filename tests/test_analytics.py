@@ -0,0 +1,74 @@
+import unittest
+from datetime import date, datetime, timedelta
+
+from analytics import compute_returns_batch, asof_lookup, PERIOD_DAYS
+from fetch_mf_returns import find_closest_nav
+from nav_store import format_nav_date
+
+
+def daily_series(start, n_days, growth):
+    """Weekday-only NAV series compounding by ``growth`` per calendar day"""
+    days, navs = [], []
+    first = start.toordinal()
+    for d in range(first, first + n_days):
+        if date.fromordinal(d).weekday() < 5:
+            days.append(d)
+            navs.append(10.0 * growth ** (d - first))
+    return days, navs
+
+
+class TestAsofLookup(unittest.TestCase):
+    def test_matches_bisect_per_fund(self):
+        funds = [daily_series(date(2018, 1, 1), 2500, 1.0003),
+                 daily_series(date(2023, 6, 1), 400, 1.0001),
+                 ([date(2024, 1, 1).toordinal()], [12.5])]
+        current_days, current_navs, anchor_days, anchor_navs = asof_lookup(funds, (0, 1, 30, 365, 1825))
+
+        for f, (days, navs) in enumerate(funds):
+            parsed = [(datetime.fromordinal(d), n, format_nav_date(d)) for d, n in zip(days, navs)]
+            dts = [p[0] for p in parsed]
+            self.assertEqual(current_days[f], days[-1])
+            for k, offset in enumerate((0, 1, 30, 365, 1825)):
+                expected, _ = find_closest_nav(parsed, dts, datetime.fromordinal(days[-1]) - timedelta(days=offset))
+                if expected is None:
+                    self.assertEqual(anchor_days[f][k], -1)
+                else:
+                    self.assertAlmostEqual(anchor_navs[f][k], expected)
+
+
+class TestComputeReturnsBatch(unittest.TestCase):
+    def setUp(self):
+        self.funds = [{"name": "Long", "code": "1"}, {"name": "Young", "code": "2"}]
+        self.series = [daily_series(date(2015, 1, 5), 3650, 1.0002),
+                       daily_series(date(2024, 1, 1), 200, 1.0002)]
+        self.results = compute_returns_batch(self.funds, self.series)
+
+    def test_output_shape(self):
+        result = self.results[0]
+        self.assertEqual(list(result), ["name", "code", "current_nav", "current_date", "returns",
+                                        "consistency_score", "dates", "year_breakdown"])
+        self.assertEqual(list(result["returns"]), list(PERIOD_DAYS))
+        self.assertEqual(sorted(result["year_breakdown"]), ["2year", "3year", "5year"])
+        self.assertIn("year5_start", result["year_breakdown"]["5year"]["year_dates"])
+
+    def test_cagr_of_constant_growth(self):
+        returns = self.results[0]["returns"]
+        # Anchors are exact calendar days apart unless they fall on a weekend
+        expected = (1.0002 ** 365 - 1) * 100
+        self.assertAlmostEqual(returns["3year"], expected, delta=0.2)
+        self.assertAlmostEqual(self.results[0]["consistency_score"],
+                               0.2 * returns["1year"] + 0.3 * returns["2year"] + 0.5 * returns["3year"])
+
+    def test_missing_history_reports_zero_and_na(self):
+        young = self.results[1]
+        self.assertEqual(young["returns"]["1year"], 0)
+        self.assertEqual(young["dates"]["5year"], "NA")
+        self.assertEqual(young["year_breakdown"]["2year"]["year1"], 0)
+        self.assertNotEqual(young["returns"]["1month"], 0)
+
+    def test_empty_batch(self):
+        self.assertEqual(compute_returns_batch([], []), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
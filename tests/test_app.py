@@ -0,0 +1,448 @@
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import app as app_module
+from fund_cache import FundCache
+from fund_registry import FundRegistry
+from nav_store import NavStore
+from singleflight import SingleFlight
+
+
+def fake_result(code):
+    return {"name": f"Fund {code}", "code": code, "current_nav": 10.0, "current_date": "01-01-2024",
+            "returns": {}, "dates": {}, "year_breakdown": {}, "consistency_score": 0}
+
+
+class AppDataTestCase(unittest.TestCase):
+    """Runs the dataset layer against an in-process FundCache and a fake upstream"""
+
+    def setUp(self):
+        self.fetched = []
+        self.funds = [{"name": "Fund 1", "code": "1", "is_portfolio": True},
+                      {"name": "Fund 2", "code": "2", "is_portfolio": False}]
+        self.originals = {name: getattr(app_module, name)
+                          for name in ("fetch_funds_data", "iter_funds_async", "get_all_funds", "fund_cache", "redis_client",
+                                       "refresh_flight")}
+
+        async def fetch(funds=None, session=None):
+            self.fetched.append([f["code"] for f in funds])
+            return [fake_result(f["code"]) for f in funds]
+
+        async def stream(funds=None, session=None):
+            # Completion order differs from list order
+            self.fetched.append([f["code"] for f in funds])
+            for f in reversed(funds):
+                yield dict(fake_result(f["code"]), is_portfolio=f.get("is_portfolio", False))
+
+        app_module.fetch_funds_data = fetch
+        app_module.iter_funds_async = stream
+        app_module.get_all_funds = lambda: [dict(f) for f in self.funds]
+        app_module.fund_cache = FundCache(None, ttl=app_module.DATA_HARD_TTL)
+        app_module.redis_client = None
+        app_module.refresh_flight = SingleFlight(None)
+        app_module._snapshot = None
+
+    def tearDown(self):
+        for name, value in self.originals.items():
+            setattr(app_module, name, value)
+        app_module._snapshot = None
+
+    def age_everything(self, seconds):
+        app_module._snapshot["fetched_at"] -= seconds
+        index = app_module.fund_cache.get_index()
+        index["fetched_at"] -= seconds
+        for f in index["funds"]:
+            app_module.fund_cache.get(f["code"])["fetched_at"] -= seconds
+            f["fetched_at"] -= seconds
+
+    def wait_for_background_refresh(self):
+        time.sleep(0.05)
+        while app_module.refresh_flight.is_running(app_module.REFRESH_JOB):
+            time.sleep(0.01)
+
+
+class TestStaleWhileRevalidate(AppDataTestCase):
+    def test_cold_cache_blocks_once(self):
+        data = app_module.get_cached_data()
+        self.assertEqual(self.fetched, [["1", "2"]])
+        self.assertFalse(data["stale"])
+        app_module.get_cached_data()
+        self.assertEqual(len(self.fetched), 1)
+
+    def test_soft_expired_snapshot_served_and_refreshed_in_background(self):
+        app_module.get_cached_data()
+        self.age_everything(app_module.DATA_SOFT_TTL + 1)
+        data = app_module.get_cached_data()
+        self.assertTrue(data["stale"])
+        self.assertEqual(len(data["funds"]), 2)
+        self.wait_for_background_refresh()
+        self.assertEqual(len(self.fetched), 2)
+        self.assertFalse(app_module.get_cached_data()["stale"])
+
+    def test_hard_expired_snapshot_served_when_refresh_fails(self):
+        app_module.get_cached_data()
+        self.age_everything(app_module.DATA_HARD_TTL + 1)
+
+        async def failing(funds=None, session=None):
+            return []
+
+        app_module.fetch_funds_data = failing
+        data = app_module.get_cached_data()
+        self.assertTrue(data["stale"])
+        self.assertEqual(len(data["funds"]), 2)
+
+
+class TestTargetedInvalidation(AppDataTestCase):
+    def test_refresh_only_pulls_stale_funds(self):
+        app_module.get_cached_data()
+        app_module.fund_cache.get("2")["fetched_at"] -= app_module.DATA_SOFT_TTL + 1
+        app_module.refresh_snapshot()
+        self.assertEqual(self.fetched[-1], ["2"])
+
+    def test_adding_a_fund_fetches_only_that_fund(self):
+        app_module.get_cached_data()
+        version = app_module.fund_cache.get_index()["version"]
+        self.funds.append({"name": "Fund 3", "code": "3", "is_portfolio": True})
+        app_module.apply_fund_change("3")
+        self.assertEqual(self.fetched[-1], ["3"])
+        self.assertGreater(app_module.fund_cache.get_index()["version"], version)
+        codes = [f["code"] for f in app_module.get_cached_data()["funds"]]
+        self.assertEqual(codes, ["1", "2", "3"])
+
+    def test_removing_a_fund_touches_no_upstream(self):
+        app_module.get_cached_data()
+        self.funds.pop(0)
+        app_module.apply_fund_change("1")
+        self.assertEqual(len(self.fetched), 1)
+        self.assertIsNone(app_module.fund_cache.get("1"))
+        self.assertEqual([f["code"] for f in app_module.get_cached_data()["funds"]], ["2"])
+
+    def test_scheduled_refresh_pulls_only_laggards(self):
+        original = app_module.refresh_changed_funds
+        app_module.get_cached_data()
+        app_module.fund_cache.put_many([dict(fake_result("2"), current_date="31-12-2023")])
+        calls = []
+
+        async def refresh(funds, known_days, expected_day=None, session=None):
+            calls.append([f["code"] for f in funds])
+            return [], {"fetched": [], "recomputed": [], "unchanged": ["2"], "failed": []}
+
+        app_module.refresh_changed_funds = refresh
+        try:
+            summary = app_module.refresh_laggards(app_module.parse_nav_date("01-01-2024"))
+        finally:
+            app_module.refresh_changed_funds = original
+        self.assertEqual(calls, [["2"]])
+        self.assertEqual((summary["fetched"], summary["unchanged"], summary["failed"], summary["skipped"]), (0, 1, 0, 1))
+        self.assertEqual(summary["behind"], ["2"])
+
+    def test_failed_registry_change_falls_back_to_a_rebuild(self):
+        originals = app_module.fund_registry, app_module._registry_version, app_module.apply_fund_change
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = FundRegistry(os.path.join(tmp, "funds.json"), os.path.join(tmp, "research.json"),
+                                    [{"name": f["name"], "code": f["code"]} for f in self.funds])
+            app_module.fund_registry = registry
+            app_module._registry_version = registry.check()
+            app_module.get_all_funds = registry.all_funds
+            try:
+                app_module.get_cached_data()
+                registry.add("Fund 3", "3")
+
+                def timed_out(code):
+                    raise TimeoutError("Timed out waiting for refresh")
+
+                app_module.apply_fund_change = timed_out
+                app_module.apply_registry_changes()
+                self.assertIsNone(app_module.fund_cache.get_index())
+                self.assertEqual(app_module._registry_version, registry.version)
+                app_module.apply_fund_change = originals[2]
+                codes = [f["code"] for f in app_module.get_cached_data()["funds"]]
+                self.assertEqual(codes, ["1", "2", "3"])
+            finally:
+                app_module.fund_registry, app_module._registry_version, app_module.apply_fund_change = originals
+
+    def test_warm_up_loads_an_empty_scheme_master(self):
+        originals = {name: getattr(app_module, name)
+                     for name in ("get_nav_store", "refresh_market_data", "get_scheme_index")}
+        calls = []
+        with tempfile.TemporaryDirectory() as tmp:
+            store = NavStore(os.path.join(tmp, "nav.db"))
+            app_module.get_nav_store = lambda: store
+            app_module.refresh_market_data = lambda: calls.append("market") or store.save_schemes(
+                [("1", "Fund 1", None, None)])
+            app_module.get_scheme_index = lambda: calls.append("index")
+            try:
+                app_module.warm_up()
+                app_module.warm_up()
+            finally:
+                for name, value in originals.items():
+                    setattr(app_module, name, value)
+        self.assertEqual(calls, ["market", "index", "index"])
+
+    def test_registry_edit_refreshes_only_changed_funds(self):
+        originals = app_module.fund_registry, app_module._registry_version
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = FundRegistry(os.path.join(tmp, "funds.json"), os.path.join(tmp, "research.json"),
+                                    [{"name": f["name"], "code": f["code"]} for f in self.funds])
+            app_module.fund_registry = registry
+            app_module._registry_version = registry.check()
+            app_module.get_all_funds = registry.all_funds
+            try:
+                app_module.get_cached_data()
+                # Another worker adds a fund
+                FundRegistry(registry.funds_file, registry.research_file).add("Fund 3", "3")
+                codes = [f["code"] for f in app_module.get_cached_data()["funds"]]
+                self.assertEqual(self.fetched[-1], ["3"])
+                self.assertEqual(codes, ["1", "2", "3"])
+            finally:
+                app_module.fund_registry, app_module._registry_version = originals
+
+
+class TestFundsApiPayload(AppDataTestCase):
+    def setUp(self):
+        super().setUp()
+        app_module.app.config['LOGIN_DISABLED'] = True
+        app_module._funds_payload = None
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        app_module.app.config['LOGIN_DISABLED'] = False
+        super().tearDown()
+
+    def test_payload_serialized_once_per_version(self):
+        first = self.client.get('/api/funds')
+        payload = app_module._funds_payload
+        second = self.client.get('/api/funds')
+        self.assertIs(app_module._funds_payload, payload)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first.get_json()["count"], 2)
+        self.assertTrue(first.headers['ETag'])
+        self.assertIn('Last-Modified', first.headers)
+
+    def test_last_modified_is_the_fetch_time_in_utc(self):
+        original_tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Asia/Kolkata'
+        time.tzset()
+        try:
+            response = self.client.get('/api/funds')
+        finally:
+            if original_tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = original_tz
+            time.tzset()
+        fetched_at = app_module.fund_cache.get_index()["fetched_at"]
+        self.assertAlmostEqual(response.last_modified.timestamp(), fetched_at, delta=1)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/api/funds').headers['ETag']
+        response = self.client.get('/api/funds', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_gzip_variant(self):
+        response = self.client.get('/api/funds', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.data), app_module._funds_payload["body"])
+
+    def test_new_version_changes_etag(self):
+        etag = self.client.get('/api/funds').headers['ETag']
+        self.funds.pop()
+        app_module.apply_fund_change("2")
+        response = self.client.get('/api/funds', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["count"], 1)
+
+
+class TestMonitoringEndpoints(AppDataTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = app_module.app.test_client()
+
+    def test_health_never_fetches(self):
+        data = self.client.get('/health').get_json()
+        self.assertEqual((data["status"], data["funds_count"]), ("degraded", 0))
+        self.assertEqual(self.fetched, [])
+        app_module.get_cached_data()
+        data = self.client.get('/health').get_json()
+        self.assertEqual((data["status"], data["funds_count"]), ("healthy", 2))
+        self.assertEqual(len(self.fetched), 1)
+
+    def test_metrics_exposes_refresh_and_cache_ratios(self):
+        app_module.get_cached_data()
+        app_module.get_cached_data()
+        response = self.client.get('/metrics')
+        self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+        text = response.get_data(as_text=True)
+        self.assertIn('mf_refresh_seconds_count{', text)
+        self.assertIn('kind="snapshot",outcome="ok"', text)
+        self.assertRegex(text, r'mf_cache_hit_ratio\{pid="\d+",cache="fund_entries",tier="l1"\} ')
+
+
+class TestRankApi(AppDataTestCase):
+    def setUp(self):
+        super().setUp()
+        app_module._rank_metrics = None
+        app_module.app.config['LOGIN_DISABLED'] = True
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        app_module.app.config['LOGIN_DISABLED'] = False
+        super().tearDown()
+
+    def test_rank_reuses_metrics_for_the_version(self):
+        data = self.client.get('/api/rank?formula=calmar&limit=1').get_json()
+        self.assertEqual(data["formula"], "calmar")
+        self.assertEqual(data["count"], 1)
+        matrix = app_module._rank_metrics[1]
+        self.client.get('/api/rank?formula=consistency')
+        self.assertIs(app_module._rank_metrics[1], matrix)
+        self.assertEqual(self.fetched, [["1", "2"]])
+
+    def test_unknown_formula_lists_registry(self):
+        response = self.client.get('/api/rank?formula=nope')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("consistency", response.get_json()["formulas"])
+
+
+class TestFundsStream(AppDataTestCase):
+    def setUp(self):
+        super().setUp()
+        app_module.app.config['LOGIN_DISABLED'] = True
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        app_module.app.config['LOGIN_DISABLED'] = False
+        super().tearDown()
+
+    def read_ndjson(self):
+        response = self.client.get('/api/funds/stream')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        return [json.loads(line) for line in response.data.decode().splitlines()]
+
+    def test_cold_stream_emits_in_completion_order_and_publishes(self):
+        messages = self.read_ndjson()
+        self.assertEqual([m["data"]["code"] for m in messages[:-1]], ["2", "1"])
+        self.assertEqual(messages[-1], {"type": "done", "data": {"count": 2, "fetched": 2, "failed": 0}})
+        self.assertTrue(messages[1]["data"]["is_portfolio"])
+        self.assertEqual(len(app_module.get_cached_data()["funds"]), 2)
+        self.assertEqual(self.fetched, [["1", "2"]])
+
+    def test_cached_funds_emitted_without_fetching(self):
+        app_module.get_cached_data()
+        self.funds.append({"name": "Fund 3", "code": "3", "is_portfolio": True})
+        messages = self.read_ndjson()
+        self.assertEqual([m["data"]["code"] for m in messages[:-1]], ["1", "2", "3"])
+        self.assertEqual(messages[-1]["data"]["fetched"], 1)
+        self.assertEqual(self.fetched[-1], ["3"])
+
+    def test_concurrent_cold_streams_fetch_once(self):
+        started, release = threading.Event(), threading.Event()
+        
+        async def gated_stream(funds=None, session=None):
+            self.fetched.append([f["code"] for f in funds])
+            started.set()
+            await asyncio.get_running_loop().run_in_executor(None, release.wait, 2)
+            for f in funds:
+                yield dict(fake_result(f["code"]), is_portfolio=f.get("is_portfolio", False))
+        
+        app_module.iter_funds_async = gated_stream
+        outputs = []
+        
+        def read():
+            outputs.append(self.read_ndjson())
+        
+        first = threading.Thread(target=read)
+        first.start()
+        started.wait(2)
+        second = threading.Thread(target=read)
+        second.start()
+        time.sleep(0.1)
+        release.set()
+        first.join(5)
+        second.join(5)
+        
+        self.assertEqual(self.fetched, [["1", "2"]])
+        self.assertEqual(len(outputs), 2)
+        for messages in outputs:
+            self.assertEqual(sorted(m["data"]["code"] for m in messages[:-1]), ["1", "2"])
+            self.assertEqual(messages[-1]["data"]["count"], 2)
+            self.assertEqual(messages[-1]["data"]["failed"], 0)
+        self.assertEqual(sorted(m[-1]["data"]["fetched"] for m in outputs), [0, 2])
+
+    def test_stream_from_cache_republishes_a_dropped_index(self):
+        app_module.get_cached_data()
+        app_module.invalidate_snapshot()
+        self.assertIsNone(app_module._load_snapshot())
+        messages = self.read_ndjson()
+        self.assertEqual(messages[-1], {"type": "done", "data": {"count": 2, "fetched": 0, "failed": 0}})
+        self.assertIsNotNone(app_module._load_snapshot())
+        self.assertEqual(self.fetched, [["1", "2"]])
+
+    def test_sse_format(self):
+        response = self.client.get('/api/funds/stream?format=sse')
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = response.data.decode().strip().split("\n\n")
+        self.assertEqual(len(events), 3)
+        self.assertTrue(events[-1].startswith("event: done\ndata: "))
+
+    def test_cold_dashboard_renders_streaming_shell(self):
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'data-stream-url="/api/funds/stream"', response.data)
+        self.assertEqual(self.fetched, [])
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.originals = {name: getattr(app_module, name) for name in ("PROFILING_ENABLED", "PROFILE_DIR")}
+        app_module.PROFILING_ENABLED = True
+        app_module.PROFILE_DIR = self.tmp.name
+        app_module.app.config['PROFILING_TOKEN'] = "secret"
+        app_module.app.config['PROFILE_JOBS'] = ["warm-up"]
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        for name, value in self.originals.items():
+            setattr(app_module, name, value)
+        app_module.app.config.pop('PROFILING_TOKEN', None)
+        app_module.app.config.pop('PROFILE_JOBS', None)
+
+    def test_admin_endpoints_need_profiling_and_credentials(self):
+        self.assertEqual(self.client.get('/api/admin/profiles', headers={"X-Profile": "wrong"}).status_code, 403)
+        app_module.PROFILING_ENABLED = False
+        self.assertEqual(self.client.get('/api/admin/profiles', headers={"X-Profile": "secret"}).status_code, 404)
+
+    def test_profiled_request_is_listed_and_downloadable(self):
+        # The hooks are only installed when profiling is enabled at startup, so use a separate app
+        from flask import Flask
+        flask_app = Flask(__name__)
+        flask_app.add_url_rule('/work', 'work', lambda: "done")
+        app_module.install_request_profiling(flask_app)
+        response = flask_app.test_client().get('/work', headers={"X-Profile": "secret"})
+        name = response.headers["X-Profile"]
+        self.assertTrue(name.endswith("-GET-work.prof"))
+
+        listed = self.client.get('/api/admin/profiles?profile=secret').get_json()
+        self.assertEqual([p["name"] for p in listed["profiles"]], [name])
+        download = self.client.get(f'/api/admin/profiles/{name}', headers={"X-Profile": "secret"})
+        self.assertEqual(download.status_code, 200)
+        download.close()
+
+    def test_only_listed_jobs_are_profiled(self):
+        job = lambda: {"warmed": True}
+        self.assertIs(app_module.profiled_job("daily-refresh", job), job)
+        self.assertEqual(app_module.profiled_job("warm-up", job)(), {"warmed": True})
+        self.assertEqual(len(os.listdir(self.tmp.name)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
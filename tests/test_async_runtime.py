@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import unittest
+
+from async_runtime import AsyncRuntime
+
+
+class TestAsyncRuntime(unittest.TestCase):
+    def setUp(self):
+        self.runtime = AsyncRuntime(max_connections=4, connections_per_host=2)
+
+    def tearDown(self):
+        self.runtime.stop()
+
+    def test_calls_share_one_loop_and_session(self):
+        seen = []
+
+        async def work(value, session=None):
+            seen.append((threading.current_thread().name, session))
+            return value * 2
+
+        self.assertEqual(self.runtime.call(work, 2), 4)
+        self.assertEqual(self.runtime.call(work, 3), 6)
+        (thread_a, session_a), (thread_b, session_b) = seen
+        self.assertEqual(thread_a, "async-runtime")
+        self.assertEqual(thread_a, thread_b)
+        self.assertIs(session_a, session_b)
+        self.assertEqual(session_a.connector.limit, 4)
+        self.assertEqual(session_a.connector.limit_per_host, 2)
+
+    def test_exceptions_propagate_to_caller(self):
+        async def boom(session=None):
+            raise ValueError("upstream")
+
+        with self.assertRaises(ValueError):
+            self.runtime.call(boom)
+
+
+    def test_hung_call_times_out_and_is_cancelled(self):
+        cancelled = threading.Event()
+
+        async def hang(session=None):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        runtime = AsyncRuntime(call_timeout=0.05)
+        self.addCleanup(runtime.stop)
+        with self.assertRaises(TimeoutError):
+            runtime.call(hang)
+        self.assertTrue(cancelled.wait(2))
+        self.assertEqual(self.runtime.call_timeout, 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+import numpy as np
+
+from backtest import evaluate_date, load_histories, monthly_rebalance_days, run_backtest
+from nav_store import NavStore
+
+
+def growth_series(start, n_days, daily_growth):
+    days = np.arange(start, start + n_days, dtype=np.int64)
+    return days, 10.0 * daily_growth ** (days - start)
+
+
+class TestBacktest(unittest.TestCase):
+    def setUp(self):
+        self.start = date(2015, 1, 1).toordinal()
+        # Steady growers keep their ordering, so every return-based formula should pick "fast"
+        self.histories = {
+            "fast": growth_series(self.start, 365 * 6, 1.0006),
+            "mid": growth_series(self.start, 365 * 6, 1.0004),
+            "slow": growth_series(self.start, 365 * 6, 1.0001),
+            "young": growth_series(self.start + 365 * 5, 200, 1.001),
+        }
+
+    def test_monthly_rebalance_days(self):
+        days = monthly_rebalance_days(date(2020, 11, 15).toordinal(), date(2021, 2, 1).toordinal())
+        self.assertEqual([date.fromordinal(d) for d in days],
+                         [date(2020, 12, 1), date(2021, 1, 1), date(2021, 2, 1)])
+
+    def test_picks_and_forward_returns(self):
+        day = self.start + 365 * 3
+        run = evaluate_date(self.histories, day, ["consistency"], 1, 365)
+        self.assertEqual(run["universe"], 3)
+        self.assertEqual(run["formulas"]["consistency"]["picks"], ["fast"])
+        self.assertAlmostEqual(run["formulas"]["consistency"]["return"], (1.0006 ** 365 - 1) * 100)
+        self.assertGreater(run["formulas"]["consistency"]["return"], run["benchmark"])
+
+    def test_funds_closing_during_the_holding_period_stay_in(self):
+        day = self.start + 365 * 3
+        days, navs = growth_series(self.start, 365 * 3 + 100, 1.0006)
+        navs = navs.copy()
+        navs[-1] = navs[-2] * 0.5  # wound up at a loss 100 days after T
+        histories = dict(self.histories, closed=(days, navs))
+        # A fund that had already stopped reporting before T is not eligible
+        histories["gone"] = growth_series(self.start, 365 * 2, 1.0006)
+        run = evaluate_date(histories, day, ["consistency"], 1, 365)
+        self.assertEqual(run["universe"], 4)
+        closed_return = (navs[-1] / navs[365 * 3] - 1) * 100
+        fast_return = (1.0006 ** 365 - 1) * 100
+        mid_return = (1.0004 ** 365 - 1) * 100
+        slow_return = (1.0001 ** 365 - 1) * 100
+        self.assertAlmostEqual(run["benchmark"], np.mean([fast_return, mid_return, slow_return, closed_return]))
+
+    def test_too_small_universe_is_skipped(self):
+        self.assertIsNone(evaluate_date(self.histories, self.start + 100, ["consistency"], 1, 365))
+
+    def test_run_backtest_summary(self):
+        days = monthly_rebalance_days(self.start + 365 * 2, self.start + 365 * 5)
+        result = run_backtest(self.histories, days, ["consistency", "calmar"], top_n=1, workers=1)
+        self.assertEqual(len(result["runs"]), len(days))
+        consistency = next(row for row in result["summary"] if row["formula"] == "consistency")
+        self.assertEqual(consistency["hit_rate"], 100)
+        with self.assertRaises(ValueError):
+            run_backtest(self.histories, days, ["nope"])
+
+    def test_process_pool_matches_serial(self):
+        days = monthly_rebalance_days(self.start + 365 * 2, self.start + 365 * 3)
+        serial = run_backtest(self.histories, days, ["calmar"], top_n=2, workers=1)
+        pooled = run_backtest(self.histories, days, ["calmar"], top_n=2, workers=2)
+        self.assertEqual(serial["summary"], pooled["summary"])
+
+    def test_load_histories_from_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = NavStore(os.path.join(tmp, 'nav.db'))
+            store.merge("1", [(self.start, 10.0), (self.start + 1, 10.5)])
+            histories = load_histories(["1", "2"], store=store)
+            self.assertEqual(list(histories), ["1"])
+            np.testing.assert_array_equal(histories["1"].navs, [10.0, 10.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
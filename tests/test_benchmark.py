@@ -0,0 +1,32 @@
+import os
+import tempfile
+import unittest
+
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_run_reports_every_stage(self):
+        results = benchmark.run(sizes=[2], report=lambda line: None)
+        self.assertEqual(sorted(results), sorted(f"{name}@2" for name in benchmark.STAGES))
+        self.assertGreater(results["asof_lookup@2"]["peak_mb"], 0)
+
+    def test_legacy_stages_skipped_above_limit(self):
+        results = benchmark.run(sizes=[3], stages=["parse_nav_data", "asof_lookup"], memory=False,
+                                max_legacy_funds=2, report=lambda line: None)
+        self.assertEqual(list(results), ["asof_lookup@3"])
+        self.assertIsNone(results["asof_lookup@3"]["peak_mb"])
+
+    def test_baselines_round_trip_and_regressions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baselines.json")
+            benchmark.save_baselines({"asof_lookup@10": {"seconds": 1.0}}, path)
+            baselines = benchmark.load_baselines(path)
+            self.assertIn("machine", baselines)
+            slower = {"asof_lookup@10": {"seconds": 1.5}, "new_stage@10": {"seconds": 9.0}}
+            self.assertEqual(benchmark.compare(slower, baselines), [("asof_lookup@10", 1.5, 1.0)])
+            self.assertEqual(benchmark.compare({"asof_lookup@10": {"seconds": 1.1}}, baselines), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
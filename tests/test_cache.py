@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from cache import TwoTierCache, args_digest, make_key
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the redis-py calls the cache uses"""
+
+    def __init__(self):
+        self.data = {}
+        self.mget_calls = 0
+
+    def mget(self, keys):
+        self.mget_calls += 1
+        return [self.data.get(k) for k in keys]
+
+    def pipeline(self):
+        return self
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value.encode('utf-8')
+
+    def execute(self):
+        return []
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        return self.data[key]
+
+
+class TestKeys(unittest.TestCase):
+    def test_digest_is_stable_and_order_independent(self):
+        self.assertEqual(args_digest(("a",), {"x": 1, "y": 2}), args_digest(("a",), {"y": 2, "x": 1}))
+        self.assertNotEqual(args_digest(("a",)), args_digest(("b",)))
+
+    def test_digest_survives_hash_randomization(self):
+        code = "from cache import args_digest; print(args_digest(('parag flexi',), {'limit': 5}))"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        outputs = {
+            subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True,
+                           env=dict(os.environ, PYTHONHASHSEED=seed)).stdout
+            for seed in ("1", "2")
+        }
+        self.assertEqual(len(outputs), 1)
+
+    def test_keys_are_versioned_and_namespaced(self):
+        self.assertEqual(make_key("fund", "120828"), "mf:v1:fund:120828")
+
+
+class TestTwoTierCache(unittest.TestCase):
+    def test_l2_hit_is_promoted_into_l1(self):
+        redis = FakeRedis()
+        writer = TwoTierCache(redis)
+        writer.set("k", {"v": 1})
+
+        reader = TwoTierCache(redis)  # another worker
+        self.assertEqual(reader.get("k"), {"v": 1})
+        self.assertEqual(reader.get("k"), {"v": 1})
+        self.assertEqual(redis.mget_calls, 1)
+        stats = reader.stats()
+        self.assertEqual((stats["l1_hits"], stats["l2_hits"], stats["misses"]), (1, 1, 0))
+
+    def test_misses_and_delete(self):
+        cache = TwoTierCache(FakeRedis())
+        self.assertIsNone(cache.get("missing"))
+        cache.set("k", [1])
+        cache.delete("k")
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_works_without_redis(self):
+        cache = TwoTierCache(None)
+        cache.set("k", "v")
+        self.assertEqual(cache.get("k"), "v")
+        self.assertEqual(cache.incr("counter"), 1)
+        self.assertEqual(cache.incr("counter"), 2)
+
+    def test_redis_errors_fall_back_to_l1(self):
+        class BrokenRedis(FakeRedis):
+            def mget(self, keys):
+                raise ConnectionError("down")
+
+        cache = TwoTierCache(BrokenRedis())
+        cache.set("k", "v")
+        self.assertEqual(cache.get("k"), "v")
+        self.assertIsNone(cache.get("other"))
+        self.assertEqual(cache.stats()["errors"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
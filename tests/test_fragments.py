@@ -0,0 +1,47 @@
+import unittest
+
+from jinja2 import DictLoader, Environment
+
+from fragments import FragmentCache
+
+
+class TestFragmentCache(unittest.TestCase):
+    def setUp(self):
+        env = Environment(loader=DictLoader({
+            "rows.html": "{% for fund in funds %}<tr>{{ fund }}</tr>{% endfor %}",
+            "count.html": "{{ funds|length }} funds",
+        }), autoescape=True)
+        self.cache = FragmentCache(env, {"rows": "rows.html", "count": "count.html"})
+        self.contexts_built = 0
+
+    def context(self, funds):
+        def build():
+            self.contexts_built += 1
+            return {"funds": funds}
+        return build
+
+    def test_renders_once_per_version(self):
+        first = self.cache.get(1, self.context(["a", "b"]))
+        self.assertEqual(first["rows"], "<tr>a</tr><tr>b</tr>")
+        self.assertEqual(first["count"], "2 funds")
+        self.assertIs(self.cache.get(1, self.context(["ignored"])), first)
+        self.assertEqual(self.contexts_built, 1)
+
+        second = self.cache.get(2, self.context(["c"]))
+        self.assertEqual(second["count"], "1 funds")
+        self.assertEqual(self.cache.stats(), {"version": 2, "hits": 1, "renders": 2})
+
+    def test_unversioned_render_is_not_cached(self):
+        self.cache.get(None, self.context([]))
+        self.cache.get(None, self.context([]))
+        self.assertEqual(self.contexts_built, 2)
+        self.assertIsNone(self.cache.stats()["version"])
+
+    def test_fragments_are_not_escaped_again(self):
+        fragments = self.cache.get(1, self.context(["<b>"]))
+        env = Environment(autoescape=True)
+        self.assertEqual(env.from_string("{{ rows }}").render(rows=fragments["rows"]), "<tr>&lt;b&gt;</tr>")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import os
+import stat
+import tempfile
+import threading
+import unittest
+
+from fund_registry import FundRegistry
+
+DEFAULTS = [{"name": "Fund 1", "code": "1"}, {"name": "Fund 2", "code": "2"}]
+
+
+class TestFundRegistry(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.funds_file = os.path.join(self.dir.name, "funds.json")
+        self.research_file = os.path.join(self.dir.name, "research_funds.json")
+        with open(self.research_file, "w") as f:
+            json.dump([{"name": "Fund 2", "code": "2"}, {"name": "Fund 9", "code": 9}], f)
+        self.registry = FundRegistry(self.funds_file, self.research_file, DEFAULTS)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write_funds(self, funds):
+        with open(self.funds_file, "w") as f:
+            json.dump(funds, f)
+        # Make the edit visible even on filesystems with coarse mtimes
+        st = os.stat(self.funds_file)
+        os.utime(self.funds_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+    def test_missing_file_gets_defaults(self):
+        funds = self.registry.all_funds()
+        self.assertEqual([(f["code"], f["is_portfolio"]) for f in funds], [("1", True), ("2", True), ("9", False)])
+        with open(self.funds_file) as f:
+            self.assertEqual(json.load(f), DEFAULTS)
+
+    def test_readers_get_copies(self):
+        self.registry.all_funds()[0]["name"] = "changed"
+        self.registry.portfolio()[0]["is_portfolio"] = False
+        self.assertEqual(self.registry.get("1"), {"name": "Fund 1", "code": "1", "is_portfolio": True})
+        self.assertNotIn("is_portfolio", self.registry.portfolio()[0])
+
+    def test_add_and_remove_record_changed_codes(self):
+        version = self.registry.check()
+        self.assertTrue(self.registry.add("Fund 3", "3"))
+        self.assertFalse(self.registry.add("Fund 3", "3"))
+        self.assertTrue(self.registry.remove("1"))
+        self.assertFalse(self.registry.remove("1"))
+        self.assertEqual(self.registry.changes_since(version), {"1", "3"})
+        self.assertEqual(self.registry.changes_since(self.registry.version), set())
+        self.assertEqual([f["code"] for f in self.registry.portfolio()], ["2", "3"])
+
+    def test_moving_a_research_fund_into_the_portfolio(self):
+        version = self.registry.check()
+        self.registry.add("Fund 9", "9")
+        self.assertEqual(self.registry.changes_since(version), {"9"})
+        self.assertTrue(self.registry.get("9")["is_portfolio"])
+
+    def test_external_edit_is_picked_up(self):
+        version = self.registry.check()
+        self.write_funds([{"name": "Fund 1 renamed", "code": "1"}, {"name": "Fund 2", "code": "2"}])
+        self.assertEqual(self.registry.get("1")["name"], "Fund 1 renamed")
+        self.assertEqual(self.registry.changes_since(version), {"1"})
+
+    def test_writes_keep_the_file_mode(self):
+        self.write_funds(DEFAULTS)
+        os.chmod(self.funds_file, 0o644)
+        self.registry.add("Fund 3", "3")
+        self.assertEqual(stat.S_IMODE(os.stat(self.funds_file).st_mode), 0o644)
+
+    def test_new_file_gets_the_umask_default(self):
+        umask = os.umask(0o022)
+        try:
+            self.registry.all_funds()
+        finally:
+            os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(self.funds_file).st_mode), 0o644)
+
+    def test_unchanged_file_is_not_reparsed(self):
+        self.registry.check()
+        state = self.registry._state
+        self.registry.all_funds()
+        self.assertIs(self.registry._state, state)
+
+    def test_forgotten_history_asks_for_full_invalidation(self):
+        version = self.registry.check()
+        for i in range(70):
+            self.registry.add(f"Fund {i}", f"x{i}")
+        self.assertIsNone(self.registry.changes_since(version))
+        self.assertEqual(self.registry.changes_since(self.registry.version - 1), {"x69"})
+
+    def test_concurrent_adds_from_separate_registries_are_all_kept(self):
+        # Each registry stands in for a worker process sharing funds.json
+        self.registry.check()
+        registries = [FundRegistry(self.funds_file, self.research_file, DEFAULTS) for _ in range(4)]
+        threads = [threading.Thread(target=lambda r=r, i=i: [r.add(f"Fund {i}-{j}", f"{i}-{j}") for j in range(10)])
+                   for i, r in enumerate(registries)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.registry.portfolio()), 2 + 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
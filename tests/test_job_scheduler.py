@@ -0,0 +1,122 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+import pytz
+
+from job_scheduler import JobScheduler, LeaderLease
+from singleflight import _RELEASE_SCRIPT
+
+IST = pytz.timezone('Asia/Kolkata')
+
+
+class FakeRedis:
+    """One Redis shared by several simulated workers"""
+
+    def __init__(self):
+        self.data = {}
+        self.hashes = {}
+        self.lock = threading.Lock()
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def eval(self, script, numkeys, key, token, *args):
+        with self.lock:
+            if self.data.get(key) != token:
+                return 0
+            if script == _RELEASE_SCRIPT:
+                del self.data[key]
+            return 1
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field.encode()] = value.encode()
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+
+class TestLeaderLease(unittest.TestCase):
+    def test_only_one_worker_leads(self):
+        redis = FakeRedis()
+        leases = [LeaderLease(redis, ttl=30) for _ in range(3)]
+        self.assertEqual([lease.try_acquire() for lease in leases], [True, False, False])
+        # Renewal keeps the leader, the others keep failing
+        self.assertEqual([lease.try_acquire() for lease in leases], [True, False, False])
+        leases[0].release()
+        self.assertTrue(leases[1].try_acquire())
+        self.assertFalse(leases[0].try_acquire())
+
+    def test_lost_lease_is_noticed_on_renewal(self):
+        redis = FakeRedis()
+        lease = LeaderLease(redis, ttl=30)
+        lease.try_acquire()
+        redis.data.clear()  # expired
+        redis.set(lease.key, "other-worker")
+        self.assertFalse(lease.try_acquire())
+
+    def test_without_redis_every_process_leads(self):
+        self.assertTrue(LeaderLease(None).try_acquire())
+
+
+class TestJobScheduler(unittest.TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        self.calls = []
+
+    def make(self):
+        scheduler = JobScheduler(LeaderLease(self.redis, ttl=30), IST, redis_client=self.redis)
+        self.addCleanup(scheduler.shutdown)
+        return scheduler
+
+    def test_only_the_leader_runs_jobs_and_timings_are_shared(self):
+        leader, follower = self.make(), self.make()
+        for scheduler in (leader, follower):
+            scheduler.add_job("refresh", lambda: self.calls.append("run"), "cron", hour=11)
+            scheduler._check_leadership()
+            scheduler._run("refresh")
+        self.assertEqual(self.calls, ["run"])
+        self.assertEqual(follower.stats()["jobs"]["refresh"]["skipped_here"], 1)
+        last_run = follower.stats()["jobs"]["refresh"]["last_run"]
+        self.assertEqual((last_run["status"], last_run["runs"]), ("ok", 1))
+        self.assertIn("duration_ms", last_run)
+
+    def test_failures_are_recorded(self):
+        scheduler = self.make()
+
+        def fail():
+            raise RuntimeError("upstream down")
+
+        scheduler.add_job("refresh", fail, "cron", hour=11)
+        scheduler._check_leadership()
+        scheduler._run("refresh")
+        last_run = scheduler.stats()["jobs"]["refresh"]["last_run"]
+        self.assertEqual((last_run["status"], last_run["failures"], last_run["error"]), ("failed", 1, "upstream down"))
+
+    def test_new_leader_catches_up_on_a_missed_run(self):
+        now = datetime.now(IST)
+        due = now - timedelta(minutes=5)
+        scheduler = self.make()
+        scheduler.add_job("refresh", lambda: self.calls.append("run"), "cron", hour=due.hour, minute=due.minute)
+        scheduler.add_job("later", lambda: self.calls.append("later"), "interval", hours=1)
+        scheduler.start()
+        deadline = time.monotonic() + 2
+        while not self.calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.calls, ["run"])
+
+        # A run recorded after the due time is not repeated by the next leader
+        successor = self.make()
+        successor.add_job("refresh", lambda: self.calls.append("again"), "cron", hour=due.hour, minute=due.minute)
+        successor.lease.try_acquire = lambda: True
+        successor._check_leadership()
+        self.assertIsNone(successor.scheduler.get_job("refresh-catch-up"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from metrics import Registry
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.registry.histogram("parse_seconds", "Parsing", ["stage"], buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value, stage="nav")
+        text = self.registry.render()
+        self.assertIn("# TYPE parse_seconds histogram", text)
+        self.assertRegex(text, r'parse_seconds_bucket\{pid="\d+",stage="nav",le="0.1"\} 1\n')
+        self.assertRegex(text, r'parse_seconds_bucket\{pid="\d+",stage="nav",le="1"\} 3\n')
+        self.assertRegex(text, r'parse_seconds_bucket\{pid="\d+",stage="nav",le="\+Inf"\} 4\n')
+        self.assertRegex(text, r'parse_seconds_sum\{pid="\d+",stage="nav"\} 6.05\n')
+        self.assertRegex(text, r'parse_seconds_count\{pid="\d+",stage="nav"\} 4\n')
+
+    def test_counter_and_callback_gauge(self):
+        counter = self.registry.counter("errors", "Errors", ["error"])
+        counter.inc(error="Timeout")
+        counter.inc(2, error="Timeout")
+        self.registry.callback("hit_ratio", "Ratio", lambda: {(("tier", "l1"),): 0.5, (("tier", "l2"),): None})
+        text = self.registry.render()
+        self.assertRegex(text, r'errors_total\{pid="\d+",error="Timeout"\} 3\n')
+        self.assertRegex(text, r'hit_ratio\{pid="\d+",tier="l1"\} 0.5\n')
+        self.assertNotIn('tier="l2"', text)
+
+    def test_labels_must_match(self):
+        histogram = self.registry.histogram("latency", "Latency", ["endpoint"])
+        with self.assertRaises(ValueError):
+            histogram.observe(1.0)
+
+    def test_unused_metrics_are_not_rendered(self):
+        self.registry.histogram("idle_seconds", "Never observed")
+        self.assertEqual(self.registry.render(), "\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
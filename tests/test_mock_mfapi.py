@@ -0,0 +1,83 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import aiohttp
+from aiohttp.test_utils import TestServer
+
+import fetch_mf_returns
+from mock_mfapi import MockMfApi, synthetic_funds, synthetic_history
+from nav_store import NavStore
+from upstream import UpstreamClient
+
+
+class TestSyntheticHistory(unittest.TestCase):
+    def test_deterministic_weekday_history(self):
+        first = synthetic_history("900001", years=2)
+        self.assertEqual(first, synthetic_history("900001", years=2))
+        self.assertNotEqual(first["data"][0]["nav"], synthetic_history("900002", years=2)["data"][0]["nav"])
+        self.assertAlmostEqual(len(first["data"]), 2 * 261, delta=3)
+        self.assertEqual(first["status"], "SUCCESS")
+
+
+class TestFetchPipelineAgainstStandIn(unittest.TestCase):
+    """Runs the real fetch path (upstream client, NAV store, returns engine) against the stand-in"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        store = NavStore(os.path.join(self.tmp.name, 'nav.db'))
+        self.originals = {name: getattr(fetch_mf_returns, name)
+                          for name in ("MF_API_URL", "get_nav_store", "_upstream_client")}
+        fetch_mf_returns.get_nav_store = lambda: store
+        fetch_mf_returns._upstream_client = UpstreamClient(rate=1000, backoff_base=0.001, backoff_max=0.01,
+                                                           max_retries=10, retry_budget_ratio=5)
+        fetch_mf_returns.api_cache.clear()
+
+    def tearDown(self):
+        for name, value in self.originals.items():
+            setattr(fetch_mf_returns, name, value)
+        fetch_mf_returns.api_cache.clear()
+        self.tmp.cleanup()
+
+    def run_against(self, mock, coro_fn):
+        async def scenario():
+            async with TestServer(mock.make_app()) as server:
+                fetch_mf_returns.MF_API_URL = str(server.make_url("/mf"))
+                async with aiohttp.ClientSession() as session:
+                    return await coro_fn(session)
+        return asyncio.run(scenario())
+
+    def test_fixture_and_synthetic_funds(self):
+        funds = [{"name": "Quant Small Cap", "code": "120828"}] + synthetic_funds(3)
+        results = self.run_against(MockMfApi(history_years=6),
+                                   lambda session: fetch_mf_returns.fetch_all_funds_async(funds, session=session))
+        self.assertEqual(sorted(r["code"] for r in results), sorted(f["code"] for f in funds))
+        quant = next(r for r in results if r["code"] == "120828")
+        self.assertEqual(quant["current_date"], "31-01-2024")
+        synthetic = next(r for r in results if r["code"] == "900001")
+        self.assertNotEqual(synthetic["returns"]["5year"], 0)
+
+    def test_throttling_and_errors_are_retried(self):
+        mock = MockMfApi(history_years=1, throttle_rate=0.2, error_rate=0.1, retry_after=0, seed=3)
+        results = self.run_against(mock, lambda session: fetch_mf_returns.fetch_all_funds_async(
+            synthetic_funds(5), session=session))
+        self.assertEqual(len(results), 5)
+        self.assertGreater(mock.stats["429"], 0)
+        self.assertEqual(mock.stats["200"], 5)
+
+    def test_search_fixture_and_fallback(self):
+        async def search(session, query):
+            async with session.get(fetch_mf_returns.MF_API_URL + "/search", params={"q": query}) as response:
+                return await response.json()
+
+        async def both(session):
+            return await search(session, "quant"), await search(session, "synthetic fund 2")
+
+        recorded, synthetic = self.run_against(MockMfApi(fund_count=3), both)
+        self.assertEqual(recorded[0]["schemeCode"], 120828)
+        self.assertEqual(synthetic, [{"schemeCode": 900002, "schemeName": "Synthetic Fund 2"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
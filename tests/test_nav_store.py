@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from datetime import date, datetime
+
+from nav_store import (NavSeries, NavStore, expected_nav_day, parse_nav_date, parse_nav_dates, format_nav_date,
+                       parse_new_rows)
+import fetch_mf_returns
+from upstream import UpstreamClient
+
+
+class FakeResponse:
+    def __init__(self, status, payload, headers=None):
+        self.status = status
+        self._payload = payload
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self):
+        return json.dumps(self._payload).encode()
+
+
+class FakeSession:
+    """Serves canned mfapi payloads keyed by URL and records every request"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        if url not in self.routes:
+            return FakeResponse(404, {})
+        return FakeResponse(200, self.routes[url])
+
+
+def rows(*pairs):
+    return [{"date": d, "nav": str(n)} for d, n in pairs]
+
+
+class TestNavStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = NavStore(os.path.join(self.tmp.name, 'nav.db'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_date_round_trip(self):
+        day = parse_nav_date("05-03-2024")
+        self.assertEqual(day, date(2024, 3, 5).toordinal())
+        self.assertEqual(format_nav_date(day), "05-03-2024")
+
+    def test_expected_nav_day_skips_weekends(self):
+        # 08-01-2024 is a Monday
+        self.assertEqual(format_nav_date(expected_nav_day(datetime(2024, 1, 8, 22))), "08-01-2024")
+        self.assertEqual(format_nav_date(expected_nav_day(datetime(2024, 1, 8, 11))), "05-01-2024")
+        self.assertEqual(format_nav_date(expected_nav_day(datetime(2024, 1, 7, 22))), "05-01-2024")
+
+    def test_parse_new_rows_stops_at_stored_day(self):
+        data = rows(("03-01-2024", 12), ("02-01-2024", 11), ("01-01-2024", 10))
+        parsed = parse_new_rows(data, after_day=parse_nav_date("02-01-2024"))
+        self.assertEqual(parsed, [(parse_nav_date("03-01-2024"), 12.0)])
+
+    def test_bulk_date_parsing_matches_scalar(self):
+        strs = ["05-03-2024", "29-02-2024", "31-12-1999", "01-01-0001"]
+        days, valid = parse_nav_dates(strs)
+        self.assertTrue(valid.all())
+        self.assertEqual(days.dtype, "int32")
+        self.assertEqual(days.tolist(), [parse_nav_date(s) for s in strs])
+
+    def test_bulk_date_parsing_rejects_malformed(self):
+        _, valid = parse_nav_dates(["29-02-2023", "31-04-2024", "2024-03-05", "05-03-20245",
+                                    "5-3-2024", "00-01-2024", "05-13-2024", None, "0५-03-2024"])
+        self.assertFalse(valid.any())
+
+    def test_series_from_mfapi_skips_bad_rows(self):
+        data = rows(("03-01-2024", 12), ("bad", 11), ("02-01-2024", "N.A."), ("01-01-2024", 10))
+        series = NavSeries.from_mfapi(data + [{"nav": "9"}, "junk"])
+        self.assertEqual(series.days.tolist(), [parse_nav_date("01-01-2024"), parse_nav_date("03-01-2024")])
+        self.assertEqual(series.asof(parse_nav_date("02-01-2024")), (10.0, parse_nav_date("01-01-2024")))
+        self.assertEqual(series.asof(parse_nav_date("31-12-2023")), (None, None))
+        days, navs = series
+        self.assertEqual(navs.tolist(), [10.0, 12.0])
+
+    def test_series_from_mfapi_tolerates_out_of_order_rows(self):
+        # A stored day listed ahead of a newer one must not hide the newer point
+        data = rows(("04-01-2024", 13), ("02-01-2024", 11), ("05-01-2024", 14), ("01-01-2024", 10))
+        series = NavSeries.from_mfapi(data, after_day=parse_nav_date("02-01-2024"))
+        self.assertEqual(series.days.tolist(), [parse_nav_date("04-01-2024"), parse_nav_date("05-01-2024")])
+        self.assertEqual(series.navs.tolist(), [13.0, 14.0])
+
+    def test_merge_is_idempotent_and_sorted(self):
+        points = [(parse_nav_date("02-01-2024"), 11.0), (parse_nav_date("01-01-2024"), 10.0)]
+        self.assertEqual(self.store.merge("1", points), 2)
+        self.assertEqual(self.store.merge("1", points[:1]), 1)
+        series = self.store.load("1")
+        self.assertEqual(series.navs.tolist(), [10.0, 11.0])
+        self.assertEqual(self.store.last_day("1"), series.latest_day)
+        self.assertIsNone(self.store.last_day("2"))
+
+
+class TestIncrementalSync(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = NavStore(os.path.join(self.tmp.name, 'nav.db'))
+        self.fund = {"name": "Test Fund", "code": "100"}
+        self.base = fetch_mf_returns.MF_API_URL + "/100"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def sync(self, session):
+        return asyncio.run(fetch_mf_returns.sync_fund_history(
+            session, self.fund, UpstreamClient(rate=1000), store=self.store))
+
+    def test_first_sync_downloads_full_history(self):
+        session = FakeSession({self.base: {"data": rows(("02-01-2024", 11), ("01-01-2024", 10))}})
+        self.assertEqual(self.sync(session), 2)
+        self.assertEqual(session.requested, [self.base])
+
+    def test_next_day_uses_latest_endpoint_only(self):
+        # 05-01-2024 is a Friday, 08-01-2024 the following Monday
+        self.store.merge("100", [(parse_nav_date("05-01-2024"), 10.0)])
+        session = FakeSession({self.base + "/latest": {"data": rows(("08-01-2024", 10.5))}})
+        self.assertEqual(self.sync(session), 1)
+        self.assertEqual(session.requested, [self.base + "/latest"])
+        self.assertEqual(self.store.load("100").navs.tolist(), [10.0, 10.5])
+
+    def test_gap_falls_back_to_full_history(self):
+        self.store.merge("100", [(parse_nav_date("01-01-2024"), 10.0)])
+        session = FakeSession({
+            self.base + "/latest": {"data": rows(("04-01-2024", 13))},
+            self.base: {"data": rows(("04-01-2024", 13), ("03-01-2024", 12),
+                                     ("02-01-2024", 11), ("01-01-2024", 10))},
+        })
+        self.assertEqual(self.sync(session), 3)
+        self.assertEqual(self.store.load("100").navs.tolist(), [10.0, 11.0, 12.0, 13.0])
+
+    def test_mid_week_holiday_is_not_a_gap(self):
+        # 02-01-2024 (a Tuesday) had no NAV anywhere: NAVAll read on the Wednesday still showed Monday
+        monday, wednesday = parse_nav_date("01-01-2024"), parse_nav_date("03-01-2024")
+        self.store.merge("100", [(monday, 10.0)])
+        self.assertEqual(self.store.record_closed_days(monday, wednesday), [parse_nav_date("02-01-2024")])
+        session = FakeSession({self.base + "/latest": {"data": rows(("03-01-2024", 10.5))}})
+        self.assertEqual(self.sync(session), 1)
+        self.assertEqual(session.requested, [self.base + "/latest"])
+
+    def test_late_published_holiday_is_forgotten(self):
+        monday, tuesday = parse_nav_date("01-01-2024"), parse_nav_date("02-01-2024")
+        self.store.merge("100", [(monday, 10.0)])
+        self.store.record_closed_days(monday, parse_nav_date("03-01-2024"))
+        self.store.merge("200", [(monday, 20.0), (tuesday, 20.5)])
+        self.assertFalse(self.store.is_continuous(monday, parse_nav_date("03-01-2024")))
+        # Days that already have NAVs are never recorded
+        self.assertEqual(self.store.record_closed_days(monday, parse_nav_date("03-01-2024")), [])
+
+    def test_bulk_ingested_point_triggers_backfill(self):
+        self.store.merge_latest([("100", parse_nav_date("02-01-2024"), 11.0)])
+        session = FakeSession({self.base: {"data": rows(("02-01-2024", 11), ("01-01-2024", 10))}})
+        self.assertEqual(self.sync(session), 2)
+        self.assertEqual(session.requested, [self.base])
+        self.assertEqual(self.store.last_complete_day("100"), parse_nav_date("02-01-2024"))
+
+    def test_unchanged_scheme_costs_one_small_request(self):
+        self.store.merge("100", [(parse_nav_date("01-01-2024"), 10.0)])
+        session = FakeSession({self.base + "/latest": {"data": rows(("01-01-2024", 10))}})
+        self.assertEqual(self.sync(session), 0)
+        self.assertEqual(len(session.requested), 1)
+
+
+class TestRefreshChangedFunds(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = NavStore(os.path.join(self.tmp.name, 'nav.db'))
+        self.funds = [{"name": f"Fund {code}", "code": code} for code in ("100", "200", "300")]
+        history = [(parse_nav_date(d), 10.0) for d in ("03-01-2024", "04-01-2024")]
+        for fund in self.funds:
+            self.store.merge(fund["code"], history)
+        self.known = {fund["code"]: parse_nav_date("04-01-2024") for fund in self.funds}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def refresh(self, session, expected_day=None):
+        return asyncio.run(fetch_mf_returns.refresh_changed_funds(
+            self.funds, self.known, expected_day, session=session, client=UpstreamClient(rate=1000), store=self.store))
+
+    def test_only_funds_with_new_points_are_recomputed(self):
+        base = fetch_mf_returns.MF_API_URL
+        session = FakeSession({
+            base + "/100/latest": {"data": rows(("05-01-2024", 11))},
+            base + "/200/latest": {"data": rows(("04-01-2024", 10))},
+        })
+        results, summary = self.refresh(session)
+        self.assertEqual([r["code"] for r in results], ["100"])
+        self.assertEqual(summary, {"fetched": ["100"], "recomputed": [], "unchanged": ["200"], "failed": ["300"]})
+
+    def test_failed_sync_of_a_moved_scheme_counts_as_failed(self):
+        # 300's stored history moved since its result was computed, but its sync fails
+        self.store.merge_latest([("300", parse_nav_date("05-01-2024"), 11.0)])
+        session = FakeSession({fetch_mf_returns.MF_API_URL + "/100/latest": {"data": rows(("04-01-2024", 10))},
+                               fetch_mf_returns.MF_API_URL + "/200/latest": {"data": rows(("04-01-2024", 10))}})
+        results, summary = self.refresh(session)
+        self.assertEqual(results, [])
+        self.assertEqual(summary, {"fetched": [], "recomputed": [], "unchanged": ["100", "200"], "failed": ["300"]})
+
+    def test_schemes_already_stored_up_to_the_expected_day_skip_upstream(self):
+        # The NAVAll ingest already stored 05-01-2024 for every scheme
+        self.store.merge_latest([(f["code"], parse_nav_date("05-01-2024"), 11.0) for f in self.funds])
+        session = FakeSession({})
+        results, summary = self.refresh(session, expected_day=parse_nav_date("05-01-2024"))
+        self.assertEqual(session.requested, [])
+        self.assertEqual(summary["fetched"], [])
+        self.assertEqual(sorted(summary["recomputed"]), ["100", "200", "300"])
+        self.assertEqual(results[0]["current_date"], "05-01-2024")
+
+
+if __name__ == '__main__':
+    unittest.main()
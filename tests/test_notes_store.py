@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from notes_store import NotesStore
+
+
+class TestNotesStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'notes.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_ids_stay_stable_across_deletes(self):
+        store = NotesStore(self.path)
+        first = store.add("2024-01-01", "first")
+        second = store.add("2024-01-02", "second")
+        self.assertTrue(store.delete(first["id"]))
+        self.assertFalse(store.delete(first["id"]))
+        third = store.add("2024-01-03", "third")
+        self.assertGreater(third["id"], second["id"])
+        self.assertEqual([n["text"] for n in store.list()], ["second", "third"])
+
+    def test_listing_cached_until_any_writer_commits(self):
+        store = NotesStore(self.path)
+        store.add("2024-01-01", "mine")
+        listed = store.list()
+        self.assertIs(store.list(), listed)
+        # Another worker process writing through its own connection
+        NotesStore(self.path).add("2024-01-02", "theirs")
+        self.assertEqual([n["text"] for n in store.list()], ["mine", "theirs"])
+
+    def test_concurrent_writers_lose_nothing(self):
+        stores = [NotesStore(self.path) for _ in range(4)]
+
+        def write(store, worker):
+            for i in range(25):
+                store.add("2024-01-01", f"{worker}-{i}")
+
+        threads = [threading.Thread(target=write, args=(store, w)) for w, store in enumerate(stores)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(stores[0].list()), 100)
+
+    def test_legacy_json_imported_once(self):
+        legacy = os.path.join(self.tmp.name, 'notes.json')
+        with open(legacy, 'w') as f:
+            json.dump([{"date": "2023-12-31", "text": "old", "created_at": "2023-12-31T10:00:00"}], f)
+        store = NotesStore(self.path, legacy_json=legacy)
+        self.assertEqual(store.list()[0]["text"], "old")
+        store.delete(store.list()[0]["id"])
+        self.assertEqual(NotesStore(self.path, legacy_json=legacy).list(), [])
+
+
+    def test_workers_starting_together_import_once(self):
+        legacy = os.path.join(self.tmp.name, 'notes.json')
+        with open(legacy, 'w') as f:
+            json.dump([{"date": "2023-12-31", "text": "old"}], f)
+        first = NotesStore(self.path, legacy_json=legacy)
+        # A second worker that read user_version 0 before the first one committed
+        second = NotesStore(self.path)
+        second._import_json(second._conn(), legacy)
+        self.assertEqual([n["text"] for n in first.list()], ["old"])
+
+if __name__ == '__main__':
+    unittest.main()
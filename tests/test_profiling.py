@@ -0,0 +1,88 @@
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+import unittest
+
+from profiling import list_profiles, profile
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+class TestProfile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = os.path.join(self.tmp.name, "profiles")
+
+    def test_cprofile_writes_pstats(self):
+        with profile("GET /api/funds", self.dir) as run:
+            busy(0.01)
+        self.assertTrue(run.path.endswith("-GET-api-funds.prof"))
+        stats = pstats.Stats(run.path)
+        self.assertTrue(any(func[2] == "busy" for func in stats.stats))
+
+    def test_sampling_writes_speedscope(self):
+        with profile("job daily-refresh", self.dir, profiler="sampling") as run:
+            busy(0.05)
+        with open(run.path) as f:
+            data = json.load(f)
+        names = {frame["name"] for frame in data["shared"]["frames"]}
+        self.assertIn("busy", names)
+        sampled = data["profiles"][0]
+        self.assertEqual(len(sampled["samples"]), len(sampled["weights"]))
+        self.assertGreater(sum(sampled["weights"]), 0)
+
+    def test_concurrent_profile_is_skipped(self):
+        inside, release = threading.Event(), threading.Event()
+
+        def hold():
+            with profile("first", self.dir):
+                inside.set()
+                release.wait(2)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        inside.wait(2)
+        with profile("second", self.dir) as run:
+            pass
+        release.set()
+        thread.join()
+        self.assertIsNone(run.path)
+        self.assertEqual(len(list_profiles(self.dir)), 1)
+
+    def test_only_the_most_recent_are_kept(self):
+        paths = []
+        for i in range(4):
+            with profile(f"run {i}", self.dir, keep=2) as run:
+                pass
+            os.utime(run.path, (i, i))
+            paths.append(run.path)
+        with open(os.path.join(self.dir, "notes.txt"), "w") as f:
+            f.write("not a profile")
+        with profile("run 4", self.dir, keep=2):
+            pass
+        listed = list_profiles(self.dir)
+        self.assertEqual([p["name"] for p in listed][1:], [os.path.basename(paths[3])])
+        self.assertEqual(listed[0]["format"], "pstats")
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "notes.txt")))
+
+    def test_unknown_profiler_is_rejected(self):
+        with self.assertRaises(ValueError):
+            with profile("x", self.dir, profiler="perf"):
+                pass
+
+    def test_missing_directory_lists_nothing(self):
+        self.assertEqual(list_profiles(self.dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,12 @@
 import unittest
-from unittest.mock import patch
-import asyncio
 
-# Mocking the functions to avoid actual API calls
-# We need to test the logic snippet we inserted, which is inside fetch_fund_data_async.
-# Since it's hard to unit test a script without refactoring, I will simulate the logic directly in the test.
+from scoring import MetricsMatrix
+
 
 def calculate_score(r1y, r2y, r3y):
-    r1y = r1y or 0
-    r2y = r2y or 0
-    r3y = r3y or 0
-    return (r1y * 0.2) + (r2y * 0.3) + (r3y * 0.5)
+    """Consistency score of one fund through the production scoring registry"""
+    result = {"code": "1", "name": "Fund", "returns": {"1year": r1y, "2year": r2y, "3year": r3y}}
+    return MetricsMatrix([result]).score("consistency")[0]
 
 class TestRankingLogic(unittest.TestCase):
     def test_all_returns_present(self):
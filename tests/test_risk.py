@@ -0,0 +1,73 @@
+import unittest
+from datetime import date
+
+import numpy as np
+
+from risk import compute_risk_metrics, drawdown_stats, rolling_cagr
+from nav_store import format_nav_date
+
+
+def brute_force_drawdown(navs):
+    worst = 0.0
+    for i in range(len(navs)):
+        for j in range(i, len(navs)):
+            worst = max(worst, (1 - navs[j] / navs[i]) * 100)
+    return worst
+
+
+class TestDrawdown(unittest.TestCase):
+    def setUp(self):
+        start = date(2020, 1, 1).toordinal()
+        self.days = np.arange(start, start + 10, dtype=np.int64)
+        self.navs = np.array([10, 12, 9, 11, 6, 8, 12, 13, 12.5, 11], dtype=np.float64)
+
+    def test_peak_trough_and_recovery(self):
+        stats = drawdown_stats(self.days, self.navs)
+        self.assertAlmostEqual(stats["max_drawdown"], 50.0)
+        self.assertEqual(stats["drawdown_peak"], format_nav_date(int(self.days[1])))
+        self.assertEqual(stats["drawdown_trough"], format_nav_date(int(self.days[4])))
+        self.assertEqual(stats["drawdown_days"], 3)
+        self.assertEqual(stats["recovery_date"], format_nav_date(int(self.days[6])))
+        self.assertEqual(stats["recovery_days"], 2)
+        # Under water from day 1 until the new high on day 6, then again from day 7
+        self.assertEqual(stats["longest_drawdown_days"], 4)
+        self.assertAlmostEqual(stats["current_drawdown"], (1 - 11 / 13) * 100)
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        navs = 10 * np.cumprod(1 + rng.normal(0, 0.02, 400))
+        days = np.arange(400, dtype=np.int64) + date(2020, 1, 1).toordinal()
+        self.assertAlmostEqual(drawdown_stats(days, navs)["max_drawdown"], brute_force_drawdown(navs))
+
+    def test_unrecovered_and_flat(self):
+        stats = drawdown_stats(self.days[:5], self.navs[:5])
+        self.assertEqual(stats["recovery_date"], "NA")
+        self.assertIsNone(stats["recovery_days"])
+        flat = drawdown_stats(self.days[:3], np.array([10.0, 10.0, 10.0]))
+        self.assertEqual(flat["max_drawdown"], 0)
+        self.assertEqual(flat["longest_drawdown_days"], 0)
+
+
+class TestRollingCagr(unittest.TestCase):
+    def test_constant_growth(self):
+        start = date(2015, 1, 1).toordinal()
+        days = np.arange(start, start + 365 * 4, dtype=np.int64)
+        navs = 10 * 1.0003 ** (days - start)
+        values = rolling_cagr(days, navs, 3)
+        self.assertEqual(len(values), 365)
+        np.testing.assert_allclose(values, (1.0003 ** 365 - 1) * 100)
+        self.assertEqual(len(rolling_cagr(days, navs, 5)), 0)
+
+    def test_metrics_shape(self):
+        start = date(2015, 1, 1).toordinal()
+        days = list(range(start, start + 365 * 2))
+        metrics = compute_risk_metrics(days, [10 + i * 0.01 for i in range(len(days))])
+        self.assertEqual(sorted(metrics["rolling"]), ["1year", "3year", "5year"])
+        self.assertGreater(metrics["rolling"]["1year"]["count"], 0)
+        self.assertEqual(metrics["rolling"]["5year"]["count"], 0)
+        self.assertEqual(metrics["max_drawdown_5y"], 0)
+        self.assertEqual(metrics["rolling"]["1year"]["positive_pct"], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
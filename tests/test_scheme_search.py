@@ -0,0 +1,125 @@
+import os
+import tempfile
+import unittest
+
+import app as app_module
+import scheme_search
+from nav_store import NavStore
+from scheme_search import SchemeIndex, edit_distance, get_scheme_index, invalidate_scheme_index
+
+SCHEMES = [
+    {"code": "122639", "name": "Parag Parikh Flexi Cap Fund - Direct Plan - Growth"},
+    {"code": "122640", "name": "Parag Parikh Flexi Cap Fund - Regular Plan - Growth"},
+    {"code": "143269", "name": "Parag Parikh ELSS Tax Saver Fund - Direct Plan - Growth"},
+    {"code": "120828", "name": "quant Small Cap Fund - Growth Option - Direct Plan"},
+    {"code": "118778", "name": "Nippon India Small Cap Fund - Direct Plan Growth Plan - Growth Option"},
+    {"code": "118989", "name": "HDFC Mid-Cap Opportunities Fund - Growth Option - Direct Plan"},
+]
+
+
+def codes(results):
+    return [r["schemeCode"] for r in results]
+
+
+class TestSchemeIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SchemeIndex(SCHEMES)
+
+    def test_prefix_words_all_required(self):
+        self.assertEqual(codes(self.index.search("parag flexi direct")), [122639])
+        self.assertEqual(codes(self.index.search("small cap")), [120828, 118778])
+
+    def test_misspelled_words(self):
+        self.assertEqual(codes(self.index.search("parag flexy drect"))[0], 122639)
+        self.assertEqual(codes(self.index.search("qant smal"))[0], 120828)
+
+    def test_transposed_letters(self):
+        self.assertEqual(codes(self.index.search("paarg flexi"))[:2], [122639, 122640])
+        self.assertEqual(codes(self.index.search("nipopn small"))[0], 118778)
+        self.assertEqual(edit_distance("paarg", "parag", 2), 1)
+        self.assertEqual(edit_distance("paarg", "hdfc", 2), 3)
+
+    def test_broad_queries_take_the_shortest_names(self):
+        schemes = [{"code": str(i), "name": f"Fund {'x' * (i % 7)} {i} Growth" + (" Direct" if i % 2 else "")}
+                   for i in range(1, 400)]
+        index = SchemeIndex(schemes)
+        for query in ("growth", "fund direct", "gro"):
+            words = query.split()
+            expected = sorted((s for s in schemes if all(any(t.startswith(w) for t in s["name"].lower().split())
+                                                         for w in words)),
+                              key=lambda s: (len(s["name"]), s["name"]))[:5]
+            self.assertEqual(codes(index.search(query, limit=5)), [int(s["code"]) for s in expected])
+
+    def test_partial_match_fallback_ranks_most_words(self):
+        # No scheme is both ELSS and small cap: schemes with either word still come back
+        self.assertEqual(set(codes(self.index.search("elss small"))), {143269, 120828, 118778})
+
+    def test_code_prefix_and_limit(self):
+        self.assertEqual(codes(self.index.search("1226")), [122639, 122640])
+        self.assertEqual(len(self.index.search("growth", limit=2)), 2)
+        self.assertEqual(self.index.search("zzzz"), [])
+
+    def test_recent_queries_cached(self):
+        first = self.index.search("Parag  Flexi")
+        self.assertIs(self.index.search("parag flexi"), first)
+
+
+class TestSchemeMaster(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = NavStore(os.path.join(self.tmp.name, 'nav.db'))
+        self.original_index = scheme_search._index
+        scheme_search._index = None
+
+    def tearDown(self):
+        scheme_search._index = self.original_index
+        invalidate_scheme_index()
+        self.tmp.cleanup()
+
+    def test_name_only_source_keeps_navall_details(self):
+        self.store.save_schemes([("120828", "quant Small Cap", "Open Ended Schemes(Equity)", "Quant Mutual Fund")])
+        self.assertEqual(self.store.save_schemes([(120828, "quant Small Cap", None, None)]), 0)
+        self.assertEqual(self.store.load_schemes()[0]["fund_house"], "Quant Mutual Fund")
+
+    def test_index_rebuilt_when_master_changes(self):
+        self.store.save_schemes([(s["code"], s["name"], None, None) for s in SCHEMES[:2]])
+        index = get_scheme_index(self.store)
+        self.assertIs(get_scheme_index(self.store), index)
+        self.store.save_schemes([(s["code"], s["name"], None, None) for s in SCHEMES])
+        self.assertIs(get_scheme_index(self.store), index)  # not checked again yet
+        invalidate_scheme_index()
+        self.assertEqual(len(get_scheme_index(self.store)), len(SCHEMES))
+
+
+class TestSearchApi(unittest.TestCase):
+    def setUp(self):
+        self.original_index = app_module.get_scheme_index
+        self.original_upstream = app_module.search_upstream
+        app_module.app.config['LOGIN_DISABLED'] = True
+        self.client = app_module.app.test_client()
+
+    def tearDown(self):
+        app_module.get_scheme_index = self.original_index
+        app_module.search_upstream = self.original_upstream
+        app_module.app.config['LOGIN_DISABLED'] = False
+
+    def test_answers_locally_with_limit(self):
+        index = SchemeIndex(SCHEMES)
+        app_module.get_scheme_index = lambda: index
+
+        def upstream(query):
+            raise AssertionError("search went upstream")
+        app_module.search_upstream = upstream
+        response = self.client.get('/api/funds/search?q=parag&limit=2')
+        self.assertEqual(response.get_json(), index.search("parag", 2))
+        self.assertEqual(len(response.get_json()), 2)
+
+    def test_falls_back_to_upstream_before_first_load(self):
+        app_module.get_scheme_index = lambda: SchemeIndex([])
+        app_module.search_upstream = lambda query: [{"schemeCode": 1, "schemeName": query}]
+        self.assertEqual(self.client.get('/api/funds/search?q=quant').get_json(),
+                         [{"schemeCode": 1, "schemeName": "quant"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
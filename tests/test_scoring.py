@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+
+from scoring import FORMULAS, MetricsMatrix, DEFAULT_DRAWDOWN
+
+
+def result(code, mean_return, drawdown, is_portfolio=False):
+    return {
+        "code": code, "name": f"Fund {code}", "is_portfolio": is_portfolio,
+        "returns": {"1year": mean_return, "2year": mean_return, "3year": mean_return},
+        "year_breakdown": {"5year": {f"year{i}": mean_return for i in range(1, 6)}},
+        "risk_metrics": {"max_drawdown_5y": drawdown},
+    }
+
+
+class TestScoring(unittest.TestCase):
+    def setUp(self):
+        # Figures from experiments/formula-analysis-summary.md
+        self.matrix = MetricsMatrix([
+            result("quant", 40.29, 25.17),
+            result("motilal", 35.72, 24.33, is_portfolio=True),
+            result("bandhan", 35.34, 24.34, is_portfolio=True),
+            result("edelweiss", 32.11, 20.06),
+            result("young", 12.0, 0),
+        ])
+
+    def test_formulas_match_scalar_definitions(self):
+        scores = self.matrix.score("sqrt_drawdown")
+        self.assertAlmostEqual(scores[0], 40.29 / np.sqrt(25.17))
+        scores = self.matrix.score("composite_70_30")
+        # Both metrics are min-max scaled over the fund set: return 12.0-40.29, drawdown 20.06-30 (young's default)
+        self.assertAlmostEqual(scores[3], 0.7 * (32.11 - 12.0) / 28.29 * 100 - 0.3 * 0.0)
+        self.assertAlmostEqual(self.matrix.score("consistency")[1], 35.72)
+
+    def test_composites_match_experiment_ranking(self):
+        # The nine funds of experiments/test-results.txt, ranked with the weighted composites of
+        # experiments/test-consistency-formulas.js (which scale return and drawdown to 0-100 first)
+        matrix = MetricsMatrix([
+            result("quant_small", 40.29, 25.17), result("edelweiss", 32.11, 20.06),
+            result("nippon_small", 36.09, 24.21), result("nippon_growth", 31.39, 19.87),
+            result("motilal", 35.72, 24.33), result("bandhan", 35.34, 24.34),
+            result("quant_elss", 31.32, 25.84), result("quant_mid", 31.23, 25.95),
+            result("parag", 24.03, 17.87),
+        ])
+        self.assertEqual([f["code"] for f in matrix.rank("composite_70_30")],
+                         ["quant_small", "nippon_small", "edelweiss", "motilal", "bandhan", "nippon_growth",
+                          "quant_elss", "quant_mid", "parag"])
+        self.assertEqual([f["code"] for f in matrix.rank("composite_60_40")],
+                         ["quant_small", "edelweiss", "nippon_growth", "nippon_small", "motilal", "bandhan",
+                          "parag", "quant_elss", "quant_mid"])
+
+    def test_missing_drawdown_uses_default(self):
+        self.assertAlmostEqual(self.matrix.score("calmar")[4], 12.0 / DEFAULT_DRAWDOWN)
+
+    def test_rank_order_and_normalization(self):
+        ranking = self.matrix.rank("multiplicative")
+        self.assertEqual([f["code"] for f in ranking[:3]], ["quant", "motilal", "bandhan"])
+        self.assertEqual(ranking[0]["normalized_score"], 100)
+        self.assertEqual(ranking[-1]["normalized_score"], 0)
+        self.assertEqual([f["rank"] for f in ranking], [1, 2, 3, 4, 5])
+
+    def test_portfolio_filter_and_limit(self):
+        ranking = self.matrix.rank("calmar", limit=1, portfolio_only=True)
+        self.assertEqual([f["code"] for f in ranking], ["motilal"])
+
+    def test_undefined_scores_rank_last(self):
+        matrix = MetricsMatrix([result("loss", -5.0, 10.0), result("gain", 5.0, 10.0)])
+        ranking = matrix.rank("return_pow1.5_drawdown")
+        self.assertEqual([f["code"] for f in ranking], ["gain", "loss"])
+        self.assertIsNone(ranking[1]["score"])
+
+    def test_every_formula_runs_on_empty_and_full_universe(self):
+        for name in FORMULAS:
+            self.assertEqual(len(self.matrix.rank(name)), 5)
+            self.assertEqual(MetricsMatrix([]).rank(name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
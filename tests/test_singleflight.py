@@ -0,0 +1,117 @@
+import threading
+import time
+import unittest
+
+from singleflight import SingleFlight, _RELEASE_SCRIPT
+
+
+class FakeLeaseRedis:
+    """Shared between SingleFlight instances to stand in for one Redis seen by several workers"""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def eval(self, script, numkeys, key, token, *args):
+        with self.lock:
+            if self.data.get(key) != token:
+                return 0
+            if script == _RELEASE_SCRIPT:
+                del self.data[key]
+            return 1
+
+
+class DownRedis:
+    def set(self, *args, **kwargs):
+        raise ConnectionError("down")
+
+    def exists(self, key):
+        raise ConnectionError("down")
+
+    def eval(self, *args):
+        raise ConnectionError("down")
+
+
+def slow_job(calls, delay=0.2):
+    def job():
+        calls.append(threading.current_thread().name)
+        time.sleep(delay)
+        return "result"
+    return job
+
+
+class TestSingleFlight(unittest.TestCase):
+    def run_concurrently(self, flights, job, **kwargs):
+        outcomes = []
+
+        def call(flight):
+            outcomes.append(flight.run("refresh", job, **kwargs))
+
+        threads = [threading.Thread(target=call, args=(f,)) for f in flights]
+        for t in threads:
+            t.start()
+            time.sleep(0.01)
+        for t in threads:
+            t.join()
+        return outcomes
+
+    def test_threads_of_one_worker_coalesce(self):
+        calls = []
+        flight = SingleFlight(None)
+        outcomes = self.run_concurrently([flight] * 4, slow_job(calls))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(ran for ran, _ in outcomes), [False, False, False, True])
+
+    def test_workers_coalesce_through_the_lease(self):
+        calls = []
+        redis = FakeLeaseRedis()
+        workers = [SingleFlight(redis, poll_interval=0.01) for _ in range(3)]
+        self.run_concurrently(workers, slow_job(calls))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(redis.data, {})  # lease released
+
+    def test_non_waiting_caller_returns_immediately(self):
+        redis = FakeLeaseRedis()
+        busy = SingleFlight(redis)
+        other = SingleFlight(redis)
+        started = threading.Event()
+
+        def job():
+            started.set()
+            time.sleep(0.2)
+
+        t = threading.Thread(target=busy.run, args=("refresh", job))
+        t.start()
+        started.wait()
+        self.assertTrue(other.is_running("refresh"))
+        self.assertEqual(other.run("refresh", job, wait=False), (False, None))
+        t.join()
+        self.assertFalse(other.is_running("refresh"))
+
+    def test_serialized_callers_all_run(self):
+        calls = []
+        redis = FakeLeaseRedis()
+        workers = [SingleFlight(redis, poll_interval=0.01) for _ in range(3)]
+        outcomes = self.run_concurrently(workers, slow_job(calls, 0.05), coalesce=False)
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(all(ran for ran, _ in outcomes))
+
+    def test_redis_down_falls_back_to_local_lock(self):
+        calls = []
+        flight = SingleFlight(DownRedis())
+        self.assertEqual(flight.run("refresh", slow_job(calls, 0)), (True, "result"))
+        self.assertFalse(flight.is_running("refresh"))
+
+
+if __name__ == '__main__':
+    unittest.main()
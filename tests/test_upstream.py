@@ -0,0 +1,117 @@
+import asyncio
+import json
+import unittest
+
+from upstream import UpstreamClient, UpstreamError, HostLimiter, RetryBudget
+
+
+class ScriptedResponse:
+    def __init__(self, status, payload=None, headers=None):
+        self.status = status
+        self._payload = payload
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self):
+        return json.dumps(self._payload).encode()
+
+
+class ScriptedSession:
+    """Returns the scripted statuses in order, then keeps repeating the last one"""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        status = self.statuses[min(self.calls, len(self.statuses) - 1)]
+        self.calls += 1
+        return ScriptedResponse(status, {"data": []} if status == 200 else None)
+
+
+def client(**kwargs):
+    options = dict(rate=1000, backoff_base=0.001, backoff_max=0.01)
+    options.update(kwargs)
+    return UpstreamClient(**options)
+
+
+class TestUpstreamClient(unittest.TestCase):
+    URL = "https://api.mfapi.in/mf/1"
+
+    def test_transient_errors_are_retried(self):
+        session = ScriptedSession(503, 429, 200)
+        self.assertEqual(asyncio.run(client().get_json(session, self.URL)), {"data": []})
+        self.assertEqual(session.calls, 3)
+
+    def test_client_errors_are_not_retried(self):
+        session = ScriptedSession(404)
+        self.assertIsNone(asyncio.run(client().get_json(session, self.URL)))
+        self.assertEqual(session.calls, 1)
+
+    def test_gives_up_after_max_retries(self):
+        session = ScriptedSession(500)
+        with self.assertRaises(UpstreamError):
+            asyncio.run(client(max_retries=2).get_json(session, self.URL))
+        self.assertEqual(session.calls, 3)
+
+    def test_retry_budget_caps_retries_across_requests(self):
+        c = client(max_retries=5, retry_budget_ratio=0)
+        session = ScriptedSession(500)
+
+        async def many():
+            for _ in range(3):
+                with self.assertRaises(UpstreamError):
+                    await c.get_json(session, self.URL)
+
+        asyncio.run(many())
+        # 3 first attempts plus the 3 retries the initial budget allows
+        self.assertEqual(session.calls, 6)
+
+    def test_rate_backs_off_on_throttling(self):
+        c = client()
+        asyncio.run(c.get_json(ScriptedSession(429, 200), self.URL))
+        self.assertEqual(c.limiter_for(self.URL).rate, 500)
+
+
+class TestHostLimiter(unittest.TestCase):
+    def test_additive_increase_and_latency_spike(self):
+        limiter = HostLimiter(rate=3, max_rate=4, increase_every=2, increase_step=0.5)
+        for _ in range(4):
+            limiter.record_success(0.5)
+        self.assertEqual(limiter.rate, 4)
+        limiter.record_success(5.0)
+        self.assertEqual(limiter.rate, 2)
+
+    def test_pacing_spaces_requests(self):
+        limiter = HostLimiter(rate=20, max_concurrency=10)
+
+        async def burst():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+
+            async def one():
+                async with limiter:
+                    return loop.time() - start
+
+            return await asyncio.gather(*(one() for _ in range(5)))
+
+        times = sorted(asyncio.run(burst()))
+        self.assertGreaterEqual(times[-1], 0.18)
+
+
+class TestRetryBudget(unittest.TestCase):
+    def test_tokens_are_earned_per_attempt(self):
+        budget = RetryBudget(ratio=0.5, min_tokens=0)
+        self.assertFalse(budget.try_spend())
+        budget.record_attempt()
+        budget.record_attempt()
+        self.assertTrue(budget.try_spend())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+"""Adaptive client for upstream (mfapi) requests.
+
+Replaces the fixed ``Throttler(rate_limit=3, period=1)``:
+
+* each host gets an AIMD pacer that starts at ``API_RATE_LIMIT`` requests per
+  ``API_RATE_PERIOD``, creeps up while responses are healthy and halves on
+  429/5xx responses, timeouts or latency spikes;
+* a per-host semaphore caps requests in flight;
+* transient failures are retried with full-jitter exponential backoff,
+  honouring ``Retry-After``;
+* a retry budget (a fraction of recent first attempts) stops a bad upstream
+  day from turning into a retry storm.
+
+Rate, latency and budget state is plain Python and survives across event
+loops; the asyncio primitives are created per running loop.
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from metrics import JSON_DECODE, UPSTREAM_ERRORS, UPSTREAM_LATENCY, UPSTREAM_RESPONSE_BYTES, UPSTREAM_THROTTLE_WAIT
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    def __init__(self, status, url):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+        self.url = url
+
+
+def _endpoint(url):
+    """Metrics label of an mfapi URL: the small ``/latest`` call or a full history"""
+    return "latest" if url.rstrip("/").endswith("/latest") else "history"
+
+
+def _parse_retry_after(value):
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RetryBudget:
+    """Token bucket where every first attempt earns ``ratio`` retry tokens"""
+
+    def __init__(self, ratio=0.2, min_tokens=3, max_tokens=20):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def record_attempt(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+
+class HostLimiter:
+    """AIMD request pacing and concurrency limit for one upstream host"""
+
+    def __init__(self, rate, period=1, min_rate=0.5, max_rate=10, max_concurrency=5,
+                 increase_every=10, increase_step=0.5, decrease_factor=0.5,
+                 latency_spike=3.0, latency_floor=1.0):
+        self.period = period
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.increase_every = increase_every
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_spike = latency_spike
+        self.latency_floor = latency_floor
+        self.latency_ewma = None
+        self._healthy_streak = 0
+        self._next_slot = 0.0
+        self._state_lock = threading.Lock()
+        self._per_loop = weakref.WeakKeyDictionary()
+
+    def _primitives(self):
+        loop = asyncio.get_running_loop()
+        prims = self._per_loop.get(loop)
+        if prims is None:
+            prims = self._per_loop[loop] = (asyncio.Semaphore(self.max_concurrency), asyncio.Lock())
+        return prims
+
+    async def __aenter__(self):
+        semaphore, pacing_lock = self._primitives()
+        await semaphore.acquire()
+        try:
+            async with pacing_lock:
+                now = time.monotonic()
+                with self._state_lock:
+                    slot = max(now, self._next_slot)
+                    self._next_slot = slot + self.period / self.rate
+            if slot > now:
+                await asyncio.sleep(slot - now)
+        except BaseException:
+            semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self._primitives()[0].release()
+        return False
+
+    def record_success(self, latency):
+        with self._state_lock:
+            spike = (self.latency_ewma is not None and latency > self.latency_floor
+                     and latency > self.latency_spike * self.latency_ewma)
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+            if spike:
+                self._decrease_locked("latency spike")
+                return
+            self._healthy_streak += 1
+            if self._healthy_streak >= self.increase_every and self.rate < self.max_rate:
+                self._healthy_streak = 0
+                self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def record_failure(self, reason):
+        with self._state_lock:
+            self._decrease_locked(reason)
+
+    def _decrease_locked(self, reason):
+        self._healthy_streak = 0
+        new_rate = max(self.min_rate, self.rate * self.decrease_factor)
+        if new_rate < self.rate:
+            logger.warning(f"Upstream {reason}: lowering rate to {new_rate:.2f}/{self.period}s")
+        self.rate = new_rate
+
+
+class UpstreamClient:
+    def __init__(self, rate=3, period=1, max_rate=10, max_concurrency=5, timeout=15,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, retry_budget_ratio=0.2):
+        self.limiter_options = {
+            "rate": rate, "period": period, "max_rate": max_rate, "max_concurrency": max_concurrency
+        }
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_budget = RetryBudget(ratio=retry_budget_ratio)
+        self._limiters = {}
+        self._limiters_lock = threading.Lock()
+
+    def limiter_for(self, url):
+        host = urlsplit(url).netloc
+        with self._limiters_lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = HostLimiter(**self.limiter_options)
+            return limiter
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def get_json(self, session, url):
+        """GET ``url`` and return its decoded JSON.
+
+        Returns None for non-retryable HTTP errors (e.g. 404). Retryable
+        failures are retried while attempts and the retry budget last; the
+        last error is then raised (``UpstreamError`` or the network exception).
+        """
+        limiter = self.limiter_for(url)
+        endpoint = _endpoint(url)
+        self.retry_budget.record_attempt()
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                queued = time.monotonic()
+                async with limiter:
+                    started = time.monotonic()
+                    UPSTREAM_THROTTLE_WAIT.observe(started - queued)
+                    async with session.get(url, timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                        # Time to headers: body size differs wildly between /latest and full histories
+                        latency = time.monotonic() - started
+                        UPSTREAM_LATENCY.observe(latency, endpoint=endpoint, status=response.status)
+                        if response.status == 200:
+                            body = await response.read()
+                            UPSTREAM_RESPONSE_BYTES.observe(len(body), endpoint=endpoint)
+                            with JSON_DECODE.time(endpoint=endpoint):
+                                data = json.loads(body)
+                            limiter.record_success(latency)
+                            return data
+                        if response.status not in RETRYABLE_STATUSES:
+                            limiter.record_success(latency)
+                            logger.error(f"HTTP {response.status} for {url}")
+                            return None
+                        limiter.record_failure(f"HTTP {response.status}")
+                        retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                        error = UpstreamError(response.status, url)
+            except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                UPSTREAM_ERRORS.inc(endpoint=endpoint, error=type(e).__name__)
+                limiter.record_failure(type(e).__name__)
+                error = e
+
+            if attempt >= self.max_retries or not self.retry_budget.try_spend():
+                logger.error(f"Giving up on {url} after {attempt + 1} attempts: {error!r}")
+                raise error
+            delay = self._backoff(attempt, retry_after)
+            attempt += 1
+            logger.info(f"Retrying {url} in {delay:.2f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)